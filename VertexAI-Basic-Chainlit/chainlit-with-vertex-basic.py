@@ -2,6 +2,8 @@ import re
 import chainlit as cl
 from typing import List
 import os
+import sys
+from pathlib import Path
 from typing import Dict, Optional
 from datetime import datetime
 from typing import List, Optional, Tuple
@@ -11,123 +13,111 @@ from google.api_core.client_options import ClientOptions
 from google.cloud import discoveryengine_v1 as discoveryengine
 from google.cloud.discoveryengine_v1 import Conversation
 
+# The shared vertexchat package lives at the repository root
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from vertexchat.cache import AnswerCache
+from vertexchat.limiter import busy_on_overload
+from vertexchat.metrics import StageMetrics, serve_metrics
+from vertexchat.pool import WarmPool
+from vertexchat.references import render_search_results
+from vertexchat.request_templates import ConverseRequestTemplate
+from vertexchat.routing import search_client_from_env
+
 
 
 project_id = os.environ["project_id"]
 location = os.environ["location"]  # Values: "global", "us", "eu"
 data_store_id = os.environ["data_store_id"]
-
-
-
-# Function for parsing the output as needed 
-def parse_external_link(url=''):
-    protocol_regex = r'^(gs)://'
-    match = re.match(protocol_regex, url)
-    protocol = match.group(1) if match else None
-    if protocol == 'gs':
-        return re.sub(protocol_regex, 'https://storage.cloud.google.com/', url)
-    else:
-        return url
-
-# Function for parsing the output as needed 
-def replace_references(text: str, search_results: List):
-    for i, search_result in enumerate(search_results):
-        placeholder = f"[{i + 1}]"
-        text = text.replace(placeholder, f"{placeholder}({search_result.document.struct_data['url']})")
-    return text
-  
-# Function for parsing the output as needed 
-def add_references(text: str, search_results: List):
-    textref = f"\n References"
-    textlinks = ""
-    for i, search_result in enumerate(search_results[:5]):
-        placeholder = f"[{i + 1}]"
-        textlinks+= (f"\n [{placeholder} {search_result.document.struct_data['title']}]({search_result.document.struct_data['url']})")
-    text = text + textref + textlinks
-    return text
-
+model_version = "gemini-1.5-flash-001/answer_gen/v1"
+preamble = "Given the conversation between a user and a helpful assistant and some search results, create a final answer for the assistant. Always respond back to the user in the same language as the user. The answer should use all relevant information from the search results, not introduce any additional information, and use exactly the same words as the search results when possible. The assistant's answer should be formatted as a bulleted list."
 
 
 
 def initialize_client():
-    #  For more information, refer to:
-    # https://cloud.google.com/generative-ai-app-builder/docs/locations#specify_a_multi-region_for_your_data_store
-    client_options = (
-        ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
-        if location != "global"
-        else None
-    )
-    # Create a client
-    client = discoveryengine.ConversationalSearchServiceClient(
-        client_options=client_options
-    )
+    # Async client; blocking calls fall back to a worker thread. Routed by latency
+    # when DISCOVERYENGINE_ENDPOINTS lists several endpoints
+    client = search_client_from_env(discoveryengine, location)
     return client
 
 
 discoveryengine_client = initialize_client()
+metrics = StageMetrics("chainlit-with-vertex-basic")
+serve_metrics()
+answer_cache = AnswerCache.from_env(response_type=discoveryengine.ConverseConversationResponse)
+# Spec messages and serving config path are built once; each message only stamps in its query
+converse_template = ConverseRequestTemplate(
+    discoveryengine,
+    serving_config=discoveryengine_client.serving_config_path(project_id, location, data_store_id, "default_config"),
+    model_version=model_version,
+    preamble=preamble,
+)
+
+
+async def initialize_conversation(client) -> Conversation:
+    conversation_instance = await client.create_conversation(project_id, location, data_store_id)
+    return conversation_instance
 
 
-def initialize_conversation(client) -> Conversation:
-    conversation_instance = client.create_conversation(
-        # The full resource name of the data store
-        # e.g. projects/{project_id}/locations/{location}/dataStores/{data_store_id}
-        parent=client.data_store_path(
-            project=project_id, location=location, data_store=data_store_id
-        ),
-        conversation=discoveryengine.Conversation(),
-    )
-    return conversation_instance
+# Conversations created ahead of time so opening a chat does not wait on an RPC
+conversation_pool = WarmPool.from_env(lambda: initialize_conversation(discoveryengine_client))
+# Filled as the server starts, so the first chat after a cold start does not wait either
+conversation_pool.start_with_server()
 
 
 @cl.on_chat_start
 async def on_chat_start():
-    conversation = initialize_conversation(discoveryengine_client)
-    cl.user_session.set("conversation", conversation.name)
+    conversation = conversation_pool.take_nowait()
+    # None when the pool is empty; on_message then creates one lazily
+    cl.user_session.set("conversation", conversation.name if conversation else None)
+    cl.user_session.set("turns", 0)
     await cl.Message(content=f"Welcome to the Chatbot. Please ask your question below.", type="system_message").send()
 
 
 
 @cl.action_callback("ask_new_question")
 async def on_action(action):
-    conversation = initialize_conversation(discoveryengine_client)
-    cl.user_session.set("conversation", conversation.name)
+    conversation = conversation_pool.take_nowait()
+    # None when the pool is empty; on_message then creates one lazily
+    cl.user_session.set("conversation", conversation.name if conversation else None)
+    cl.user_session.set("turns", 0)
     await cl.Message(content=f"Sure, what's your next question?", type="system_message").send()
 
 
 
 @cl.on_message
+@busy_on_overload
 async def on_message(message: cl.Message):
-    print(cl.user_session.get("conversation"))
-    request = discoveryengine.ConverseConversationRequest(
-        name=cl.user_session.get("conversation"),
-        query=discoveryengine.TextInput(input=message.content),
-        serving_config=discoveryengine_client.serving_config_path(
-            project=project_id,
-            location=location,
-            data_store=data_store_id,
-            serving_config="default_config",
-        ),
-        # Options for the returned summary
-        summary_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec(
-            # Number of results to include in summary
-            summary_result_count=3,
-            model_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec.ModelSpec(version="gemini-1.5-flash-001/answer_gen/v1"),
-            model_prompt_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec.ModelPromptSpec
-            (preamble="Given the conversation between a user and a helpful assistant and some search results, create a final answer for the assistant. Always respond back to the user in the same language as the user. The answer should use all relevant information from the search results, not introduce any additional information, and use exactly the same words as the search results when possible. The assistant's answer should be formatted as a bulleted list."),
-            include_citations=True,
-        ),
-    )
-    response = discoveryengine_client.converse_conversation(request)
-    try:
-        #content = f"{replace_references(response.reply.summary.summary_text, response.reply.summary.summary_with_metadata.references)}"
-        content = f"{add_references(response.reply.summary.summary_text, response.search_results)}"
-    except AttributeError:
-        content = f"{response.reply.summary.summary_text}"
-    # Send a response back to the user
-    await cl.Message(
-        content=content
-    ).send()
-    return content
+    with metrics.message():
+        with metrics.stage("session_lookup"):
+            if cl.user_session.get("conversation") is None:
+                conversation = await conversation_pool.get()
+                cl.user_session.set("conversation", conversation.name)
+        with metrics.stage("request_build"):
+            request = converse_template.build(message.content, cl.user_session.get("conversation"))
+        # Only the first turn of a conversation is cacheable; follow-ups depend on its history
+        turns = cl.user_session.get("turns") or 0
+        cl.user_session.set("turns", turns + 1)
+        with metrics.stage("rpc"):
+            if answer_cache is None:
+                response = await discoveryengine_client.converse_conversation(request)
+            else:
+                response = await answer_cache.get_or_call(
+                    lambda: discoveryengine_client.converse_conversation(request),
+                    message.content, converse_template.serving_config, model_version, preamble,
+                    bypass=turns > 0,
+                    # A hit is still written into the conversation, in the background and without
+                    # generating it again, so follow-ups have its context
+                    session=request.name,
+                    record=lambda cached: discoveryengine_client.record_turn(request.name, message.content, cached.reply),
+                )
+        with metrics.stage("render"):
+            content = render_search_results(response.reply.summary.summary_text, response.search_results)
+        # Send a response back to the user
+        with metrics.stage("send"):
+            await cl.Message(
+                content=content
+            ).send()
+        return content
     
    
 
@@ -62,12 +62,13 @@ gcloud services enable run.googleapis.com \
   --project="$PROJECT_ID"
 
 # Submit the build to Cloud Build
+# The repository root is uploaded so the image can include the shared vertexchat package
 echo "Submitting build to Cloud Build..."
 gcloud builds submit \
   --project="$PROJECT_ID" \
   --config=cloudbuild.yaml \
   --substitutions=_REGION="$REGION",_SERVICE_NAME="$SERVICE_NAME",_REPOSITORY="$DEFAULT_REPOSITORY",_DATA_STORE_ID="$DATA_STORE_ID" \
-  .
+  ..
 
 echo "Deployment submitted to Cloud Build."
 echo "Check the build status at: https://console.cloud.google.com/cloud-build/builds?project=$PROJECT_ID"
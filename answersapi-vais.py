@@ -3,9 +3,10 @@ from google.api_core.client_options import ClientOptions
 from dotenv import load_dotenv
 load_dotenv()
 import os
-import requests
+import asyncio
 from google.auth import default
-from google.auth.transport.requests import Request
+from vertexchat.auth import TokenCache
+from vertexchat.rest import aclose_client, create_session
 
 
 
@@ -15,22 +16,17 @@ project_id = os.environ["project_id"]
 location = os.environ["location"]  # Values: "global", "us", "eu"
 data_store_id = os.environ["data_store_id"]
 
-def session_variables():
-    credentials, project = default()
-    credentials.refresh(Request())
-    access_token = credentials.token
-    url = (f"https://discoveryengine.googleapis.com/v1beta/projects/{project_id}/locations/global/collections/default_collection/dataStores/{data_store_id}/sessions")
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "userPseudoId": "",  # Set your user ID
-    }
-    response = requests.post(url, headers=headers,json=data)
-    return response.json()['name']
-
-session1 = session_variables()
+credentials, project = default()
+token_cache = TokenCache(credentials)
+
+async def session_variables():
+    try:
+        return await create_session(token_cache, project_id, data_store_id, user_pseudo_id="")  # Set your user ID
+    finally:
+        # asyncio.run closes the loop on return; the pooled connection must not outlive it
+        await aclose_client()
+
+session1 = asyncio.run(session_variables())
 
 
 
@@ -0,0 +1,103 @@
+"""Time to first byte for streamed vs unary Answers API replies.
+
+Drives ``vertexchat.answers.stream_answer`` against a simulated client whose
+answers take ``--generation`` seconds to produce in ``--chunks`` pieces, once
+over ``stream_answer_query`` and once through the unary fallback, and reports
+p50/p95 time to first byte and total time per reply. Also checks the streamed
+reply reassembles to the same answer as the unary one.
+
+Usage: python benchmarks/answer_stream_bench.py --replies 50 --generation 3.0
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+from pathlib import Path
+
+from google.cloud import discoveryengine_v1beta as discoveryengine
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vertexchat.answers import stream_answer
+
+ANSWER = " ".join(["Renewals are processed within ten business days of the complete application [1]."] * 12)
+
+
+class SimulatedClient:
+    def __init__(self, generation: float, chunks: int, streaming: bool):
+        self.generation = generation
+        self.chunks = chunks
+        self.streaming = streaming
+
+    def _final(self, text):
+        return discoveryengine.AnswerQueryResponse(
+            answer=discoveryengine.Answer(
+                answer_text=text,
+                related_questions=["How long does a renewal take?"],
+                state=discoveryengine.Answer.State.SUCCEEDED,
+            )
+        )
+
+    async def answer_query(self, request):
+        await asyncio.sleep(self.generation)
+        return self._final(ANSWER)
+
+    async def stream_answer_query(self, request):
+        if not self.streaming:
+            raise NotImplementedError("no streaming")
+        size = -(-len(ANSWER) // self.chunks)
+        pieces = [ANSWER[i:i + size] for i in range(0, len(ANSWER), size)]
+
+        async def responses():
+            for piece in pieces[:-1]:
+                await asyncio.sleep(self.generation / len(pieces))
+                yield discoveryengine.AnswerQueryResponse(answer=discoveryengine.Answer(answer_text=piece))
+            await asyncio.sleep(self.generation / len(pieces))
+            yield self._final(pieces[-1])
+
+        return responses()
+
+
+class Message:
+    def __init__(self):
+        self.content = ""
+        self.metadata = None
+
+    async def stream_token(self, token):
+        self.content += token
+
+
+async def run(client, replies):
+    request = discoveryengine.AnswerQueryRequest(query=discoveryengine.Query(text="How do I renew?"))
+    timings = []
+
+    async def reply():
+        msg = Message()
+        response = await stream_answer(client, request, msg)
+        assert response.answer.answer_text == ANSWER
+        timings.append(msg.metadata)
+
+    await asyncio.gather(*(reply() for _ in range(replies)))
+    return timings
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replies", type=int, default=50)
+    parser.add_argument("--generation", type=float, default=3.0, help="seconds to generate one answer")
+    parser.add_argument("--chunks", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'mode':<10} {'ttfb p50':>9} {'ttfb p95':>9} {'total p50':>10}")
+    for label, streaming in (("unary", False), ("streaming", True)):
+        timings = asyncio.run(run(SimulatedClient(args.generation, args.chunks, streaming), args.replies))
+        assert all(t["streamed"] == streaming for t in timings)
+        ttfb = [t["ttfb_s"] for t in timings]
+        total = [t["total_s"] for t in timings]
+        print(f"{label:<10} {percentile(ttfb, 50):8.3f}s {percentile(ttfb, 95):8.3f}s {percentile(total, 50):9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Attachment preparation with and without the content-addressed cache.
+
+Simulates ``--uploads`` PDF uploads drawn from ``--distinct`` different
+files of ``--size-mb`` each. Like Chainlit, every upload is written to its own
+path. Each upload's part is kept alive, as it is while the message is in
+flight, and the script reports time per upload plus the memory
+holding those parts (resident set growth, Linux only):
+
+* ``read``    - read the file and build ``Part.from_data`` every time (previous behaviour)
+* ``cache``   - ``AttachmentCache`` with inline parts
+* ``store``   - ``AttachmentCache`` with a local object-store stand-in (``Part.from_uri``)
+
+    python benchmarks/attachment_cache_bench.py --uploads 200 --distinct 5 --size-mb 4
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from vertexai.generative_models import Part
+
+from vertexchat.attachments import AttachmentCache, LocalObjectStore
+
+
+def make_uploads(root: Path, uploads: int, distinct: int, size: int, seed: int):
+    rng = random.Random(seed)
+    sources = []
+    for i in range(distinct):
+        source = root / f"source-{i}.pdf"
+        source.write_bytes(b"%PDF-1.4\n" + rng.randbytes(size))
+        sources.append(source)
+    paths = []
+    for i in range(uploads):
+        # A fresh path per upload, as Chainlit stores them
+        path = root / "files" / f"{i}" / "upload.pdf"
+        path.parent.mkdir(parents=True)
+        shutil.copyfile(rng.choice(sources), path)
+        paths.append(path)
+    return paths
+
+
+async def read_every_time(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return Part.from_data(data, mime_type="application/pdf")
+
+
+def rss() -> int:
+    # Parts keep their bytes in protobuf's native memory, which tracemalloc does not see
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def run(prepare, paths):
+    held = []
+    times = []
+    before = rss()
+    for path in paths:
+        start = time.perf_counter()
+        held.append(await prepare(path))
+        times.append(time.perf_counter() - start)
+    return times, rss() - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=5)
+    parser.add_argument("--size-mb", type=float, default=4.0)
+    parser.add_argument("--budget-mb", type=float, default=256.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp())
+    try:
+        paths = make_uploads(root, args.uploads, args.distinct, int(args.size_mb * (1 << 20)), args.seed)
+        budget = int(args.budget_mb * (1 << 20))
+        cache = AttachmentCache(max_bytes=budget)
+        store_cache = AttachmentCache(max_bytes=budget, store=LocalObjectStore(root / "store"))
+        modes = [
+            ("read", read_every_time, None),
+            ("cache", lambda path: cache.part_for(path, "application/pdf"), cache),
+            ("store", lambda path: store_cache.part_for(path, "application/pdf"), store_cache),
+        ]
+        print(f"{args.uploads} uploads of {args.distinct} distinct {args.size_mb:g} MiB files")
+        print(f"{'mode':<6} {'total':>8} {'p50':>9} {'max':>9} {'RSS +MiB':>9}  cache")
+        for name, prepare, used in modes:
+            times, grown = asyncio.run(run(prepare, paths))
+            print(f"{name:<6} {sum(times):>7.2f}s {statistics.median(times) * 1e3:>7.2f}ms {max(times) * 1e3:>7.2f}ms "
+                  f"{grown / (1 << 20):>9.1f}  {used.stats() if used else ''}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
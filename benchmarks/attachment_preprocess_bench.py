@@ -0,0 +1,167 @@
+"""Preprocessing a message with several mixed attachments, on the event loop vs the process pool.
+
+Builds one message's worth of files: text PDFs, PNGs, a text file, a
+damaged PDF and a .docx (unsupported). Then prepares them two ways:
+
+* ``loop``  - ``inspect_file`` called one file after another on the event loop
+* ``pool``  - ``prepare_attachments``, all files in parallel on ``ATTACHMENT_WORKERS`` processes
+
+It reports wall time, per-file preprocessing time and the longest event-loop
+stall. The stall is what every other connected user waits through. Use
+``--pdf-mode text`` to include full text extraction.
+
+    python benchmarks/attachment_preprocess_bench.py --pdfs 4 --pages 40 --pdf-mode text
+"""
+import argparse
+import asyncio
+import io
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# The apps import this at startup; importing it mid-run would show up as a stall
+import vertexai.generative_models  # noqa: F401
+
+from vertexchat import attachments
+from vertexchat.preprocess import AttachmentError, inspect_file
+
+WORDS = "permit renewal parking ticket property tax trash pickup business license street repair fee schedule".split()
+
+
+class Element:
+    """The attributes of a Chainlit file element that ``prepare_attachments`` reads."""
+
+    def __init__(self, path: Path, mime: str):
+        self.path = str(path)
+        self.mime = mime
+        self.name = path.name
+
+
+def make_text_pdf(path: Path, pages: int, rng: random.Random) -> None:
+    """A minimal multi-page PDF with a real text layer."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(40)]
+        stream = b"BT /F1 10 Tf 40 800 Td 14 TL " + b" ".join(f"({line}) '".encode() for line in lines) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), pages)
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    path.write_bytes(out.getvalue())
+
+
+def make_files(root: Path, pdfs: int, pages: int, images: int, rng: random.Random):
+    from PIL import Image
+
+    elements = []
+    for i in range(pdfs):
+        path = root / f"report-{i}.pdf"
+        make_text_pdf(path, pages, rng)
+        elements.append(Element(path, "application/pdf"))
+    for i in range(images):
+        path = root / f"photo-{i}.png"
+        Image.frombytes("RGB", (800, 600), rng.randbytes(800 * 600 * 3)).save(path)
+        # Browsers often send a generic type; sniffing finds the real one
+        elements.append(Element(path, "application/octet-stream"))
+    notes = root / "notes.txt"
+    notes.write_text("Questions for the permit office:\n" + "\n".join(rng.choice(WORDS) for _ in range(500)))
+    elements.append(Element(notes, "text/plain"))
+    damaged = root / "scan.pdf"
+    damaged.write_bytes(b"%PDF-1.4\n" + rng.randbytes(50_000))
+    elements.append(Element(damaged, "application/pdf"))
+    docx = root / "letter.docx"
+    with zipfile.ZipFile(docx, "w") as z:
+        z.writestr("word/document.xml", "<w:document/>")
+    elements.append(Element(docx, "application/vnd.openxmlformats-officedocument.wordprocessingml.document"))
+    return elements
+
+
+async def watch_loop(stalls: list, stop: asyncio.Event, interval: float = 0.005) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def on_loop(elements, extract_text: bool):
+    infos, errors = [], []
+    for element in elements:
+        try:
+            infos.append(inspect_file(element.path, element.mime, element.name, extract_text))
+        except AttachmentError as error:
+            errors.append(error)
+        await asyncio.sleep(0)
+    return infos, errors
+
+
+async def in_pool(elements, pdf_mode: str):
+    _, infos, errors = await attachments.prepare_attachments(elements, None, pdf_mode)
+    return infos, errors
+
+
+async def measure(run):
+    stalls = []
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(watch_loop(stalls, stop))
+    await asyncio.sleep(0.02)
+    start = time.perf_counter()
+    infos, errors = await run()
+    wall = time.perf_counter() - start
+    stop.set()
+    await watcher
+    return wall, max(stalls), infos, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pdfs", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--images", type=int, default=2)
+    parser.add_argument("--pdf-mode", choices=("inline", "text"), default="text")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp())
+    try:
+        elements = make_files(root, args.pdfs, args.pages, args.images, random.Random(args.seed))
+
+        async def bench():
+            # Start the workers first so spawn time is not billed to the first message
+            await attachments.run_in_process(len, "")
+            extract = args.pdf_mode == "text"
+            return [
+                ("loop", await measure(lambda: on_loop(elements, extract))),
+                ("pool", await measure(lambda: in_pool(elements, args.pdf_mode))),
+            ]
+
+        print(f"{len(elements)} files: {args.pdfs} x {args.pages}-page PDFs, {args.images} PNGs, text, damaged PDF, .docx; "
+              f"pdf mode {args.pdf_mode}, {attachments.ATTACHMENT_WORKERS} workers")
+        for name, (wall, stall, infos, errors) in asyncio.run(bench()):
+            print(f"{name}: wall {wall * 1e3:.0f}ms, longest event-loop stall {stall * 1e3:.0f}ms")
+            for info in infos:
+                print(f"    {info.name:<14} {info.mime_type:<16} {info.size:>9} B  pages={info.pages}  {info.seconds * 1e3:7.1f}ms")
+            for error in errors:
+                print(f"    skipped: {error}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
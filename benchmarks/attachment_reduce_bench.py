@@ -0,0 +1,120 @@
+"""Bytes sent and latency per attachment with and without size reduction.
+
+Builds the uploads that dominate request latency: full-resolution phone
+photos (JPEG), a screenshot (PNG), a scanned PDF (one 300 dpi image per page)
+and a text PDF padded with blank pages. Each file goes through
+``preprocess_file`` once per setting of ``--max-side`` / ``--dpi``.
+
+It prints bytes in and out, the reduction time, and an end-to-end estimate:
+reduction time plus the time to upload the result at ``--uplink-mbps``.
+That upload is the inline request body, which dominated before. Every run
+uses a fresh work dir, so no result is reused.
+
+    python benchmarks/attachment_reduce_bench.py --photos 2 --scan-pages 10 --max-side 768,1536,3072 --dpi 100
+"""
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from attachment_preprocess_bench import make_text_pdf
+
+from vertexchat.preprocess import ReduceOptions, preprocess_file
+
+
+def make_photo(rng: random.Random, width: int, height: int):
+    """Smooth gradients plus sensor noise: compresses like a photo, unlike pure noise."""
+    from PIL import Image, ImageFilter
+
+    base = Image.frombytes("RGB", (width // 32, height // 32), rng.randbytes((width // 32) * (height // 32) * 3))
+    image = base.resize((width, height), Image.BICUBIC).filter(ImageFilter.GaussianBlur(4))
+    noise = Image.effect_noise((width, height), 24).convert("RGB")
+    return Image.blend(image, noise, 0.15)
+
+
+def make_files(root: Path, photos: int, scan_pages: int, rng: random.Random):
+    from PIL import Image, ImageDraw
+
+    files = []
+    for i in range(photos):
+        path = root / f"IMG_{i:04d}.jpg"
+        make_photo(rng, 4032, 3024).save(path, quality=95)
+        files.append((path, "image/jpeg"))
+    screenshot = Image.new("RGB", (2532, 1170), "white")
+    draw = ImageDraw.Draw(screenshot)
+    for row in range(0, 1170, 40):
+        draw.text((40, row), " ".join(rng.choice("permit fee street tax".split()) for _ in range(30)), fill="black")
+    path = root / "screenshot.png"
+    screenshot.save(path)
+    files.append((path, "image/png"))
+    pages = []
+    for _ in range(scan_pages):
+        # A4 at 300 dpi, greyish paper with dark text-like blocks
+        page = make_photo(rng, 2480 // 4, 3508 // 4).resize((2480, 3508)).point(lambda v: 235 + v // 32)
+        draw = ImageDraw.Draw(page)
+        for row in range(300, 3200, 60):
+            draw.rectangle((200, row, 200 + rng.randint(1200, 2000), row + 28), fill=(40, 40, 40))
+        pages.append(page)
+    path = root / "scan.pdf"
+    pages[0].save(path, save_all=True, append_images=pages[1:], resolution=300, quality=90)
+    files.append((path, "application/pdf"))
+    path = root / "report.pdf"
+    make_text_pdf(path, 20, rng)
+    _pad_with_blank_pages(path, 10)
+    files.append((path, "application/pdf"))
+    return files
+
+
+def _pad_with_blank_pages(path: Path, blanks: int) -> None:
+    import pypdf
+
+    writer = pypdf.PdfWriter(clone_from=str(path))
+    for _ in range(blanks):
+        writer.add_blank_page(595, 842)
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photos", type=int, default=2)
+    parser.add_argument("--scan-pages", type=int, default=10)
+    parser.add_argument("--max-side", default="768,1536,3072")
+    parser.add_argument("--dpi", default="100")
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--uplink-mbps", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp())
+    try:
+        files = make_files(root, args.photos, args.scan_pages, random.Random(args.seed))
+        upload = lambda nbytes: nbytes * 8 / (args.uplink_mbps * 1e6)
+        settings = [("original", None)] + [
+            (f"side={side} dpi={dpi}", ReduceOptions(image_max_side=int(side), image_quality=args.quality,
+                                                     pdf_raster_dpi=int(dpi), work_dir=str(root / f"work-{side}-{dpi}")))
+            for side in args.max_side.split(",") for dpi in args.dpi.split(",")
+        ]
+        print(f"uplink {args.uplink_mbps:g} Mbit/s, JPEG quality {args.quality}")
+        print(f"{'setting':<20} {'file':<16} {'KiB in':>9} {'KiB out':>9} {'reduce ms':>10} {'e2e ms':>8}  result")
+        for label, options in settings:
+            total_in = total_out = total_e2e = 0.0
+            for path, mime in files:
+                info = preprocess_file(str(path), mime, path.name, False, options)
+                e2e = info.seconds + upload(info.bytes_out)
+                total_in += info.size
+                total_out += info.bytes_out
+                total_e2e += e2e
+                print(f"{label:<20} {path.name:<16} {info.size / 1024:>9.0f} {info.bytes_out / 1024:>9.0f} "
+                      f"{info.seconds * 1e3:>10.0f} {e2e * 1e3:>8.0f}  {info.reduction or 'as uploaded'}")
+            print(f"{label:<20} {'total':<16} {total_in / 1024:>9.0f} {total_out / 1024:>9.0f} {'':>10} {total_e2e * 1e3:>8.0f}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
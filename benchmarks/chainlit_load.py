@@ -0,0 +1,268 @@
+"""End-to-end websocket load driver for the Chainlit apps.
+
+Opens ``--users`` concurrent Chainlit 1.1 socket.io sessions against a
+running app, the same way the browser UI does. Each session:
+
+* waits for the welcome message (``on_chat_start``)
+* sends ``--messages`` questions with ``--think`` seconds between them
+  (``on_message``)
+* optionally clicks one of the action buttons returned with an answer
+  (``--click related_question``, the action callback)
+
+For each entry point the driver reports throughput, errors, and
+p50/p95/p99 of two latencies: time to the first assistant output (a new or
+streaming message) and time until the handler finished. A handler that
+finishes without sending an assistant message counts as an error.
+
+Run the app against the in-process fake backend so no quota is used, e.g.::
+
+    VERTEXCHAT_FAKE_BACKEND=true chainlit run vertexaisearch-withanswersui.py --headless --port 8000
+    python benchmarks/chainlit_load.py --url http://localhost:8000 --users 200 --messages 3 --click related_question
+
+Apps without ``on_chat_start`` (gemini-image.py) need ``--no-welcome``. If
+the app requires login, pass its ``CHAINLIT_AUTH_SECRET`` as
+``--auth-secret`` to mint a token per simulated user.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import socketio
+
+QUESTIONS = [
+    "How do I renew a business permit?",
+    "When is trash picked up on my street?",
+    "How can I pay a parking ticket online?",
+    "What is the property tax rate this year?",
+    "How do I report a pothole?",
+    "Where do I apply for a street vendor license?",
+]
+
+RESPONSE_EVENTS = ("new_message", "stream_start", "update_message", "send_token", "task_start", "task_end", "action", "action_response")
+
+
+class Stats:
+    def __init__(self):
+        self.first: Dict[str, List[float]] = defaultdict(list)
+        self.done: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, entry_point: str, first: Optional[float], done: Optional[float], error: bool) -> None:
+        if error or done is None:
+            self.errors[entry_point] += 1
+            return
+        self.done[entry_point].append(done)
+        if first is not None:
+            self.first[entry_point].append(first)
+
+    def report(self, elapsed: float) -> None:
+        print(f"{'entry point':<24} {'ok':>6} {'err':>5} {'req/s':>7}   "
+              f"{'first p50':>9} {'p95':>7} {'p99':>7}   {'done p50':>8} {'p95':>7} {'p99':>7}")
+        for entry_point in sorted(set(self.done) | set(self.errors)):
+            done = self.done[entry_point]
+            first = self.first[entry_point]
+            print(f"{entry_point:<24} {len(done):>6} {self.errors[entry_point]:>5} {len(done) / elapsed:>7.1f}   "
+                  f"{_percentiles(first)}   {_percentiles(done)}")
+
+
+def _percentiles(values: List[float]) -> str:
+    if len(values) < 2:
+        return f"{'-':>9} {'-':>7} {'-':>7}"
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return f"{q[49]:>8.3f}s {q[94]:>6.3f}s {q[98]:>6.3f}s"
+
+
+def mint_token(secret: str, identifier: str) -> str:
+    import jwt
+
+    payload = {
+        "identifier": identifier,
+        "metadata": {"provider": "load-test"},
+        "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=12),
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+class ChainlitSession:
+    """One simulated browser tab speaking Chainlit's socket.io protocol."""
+
+    def __init__(self, url: str, token: Optional[str], timeout: float):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.events: "asyncio.Queue" = asyncio.Queue()
+        self.actions: List[dict] = []
+        for event in RESPONSE_EVENTS:
+            self.sio.on(event, self._handler(event))
+
+    def _handler(self, event: str):
+        async def handle(data=None):
+            if event == "action":
+                self.actions.append(data)
+            await self.events.put((event, data or {}, time.perf_counter()))
+
+        return handle
+
+    async def connect(self) -> None:
+        headers = {
+            "X-Chainlit-Session-Id": str(uuid.uuid4()),
+            "X-Chainlit-Client-Type": "webapp",
+            "user-env": "{}",
+        }
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        await self.sio.connect(self.url, headers=headers, socketio_path="/ws/socket.io", transports=["websocket"], wait_timeout=self.timeout)
+        await self.sio.emit("connection_successful")
+
+    async def _wait(self, start: float, done_event: str, done_id: Optional[str] = None):
+        """Return (time to first assistant output, time to ``done_event``, error)."""
+        first = None
+        error = False
+        # connection_successful emits a task_end of its own that can arrive late
+        started = done_event != "task_end"
+        deadline = start + self.timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return first, None, True
+            try:
+                event, data, at = await asyncio.wait_for(self.events.get(), remaining)
+            except asyncio.TimeoutError:
+                return first, None, True
+            if event == "task_start":
+                started = True
+            if event in ("new_message", "stream_start") and data.get("isError"):
+                error = True
+            if first is None and event in ("new_message", "stream_start") and data.get("type") == "assistant_message":
+                first = at - start
+            if event == done_event and started and (done_id is None or data.get("id") == done_id):
+                if event == "action_response" and not data.get("status", True):
+                    error = True
+                # Chainlit logs on_message exceptions without telling the user; no reply is a failure
+                return first, at - start, error or first is None
+
+    def _drain(self) -> None:
+        while not self.events.empty():
+            self.events.get_nowait()
+
+    async def welcome(self, start: float):
+        """Wait for the first message after connecting, sent by ``on_chat_start``."""
+        deadline = start + self.timeout
+        while True:
+            try:
+                event, data, at = await asyncio.wait_for(self.events.get(), max(0.0, deadline - time.perf_counter()))
+            except asyncio.TimeoutError:
+                return None, None, True
+            if event == "new_message":
+                return at - start, at - start, bool(data.get("isError"))
+
+    async def ask(self, text: str):
+        self._drain()
+        self.actions = []
+        now = datetime.datetime.utcnow().isoformat() + "Z"
+        payload = {
+            "message": {
+                "id": str(uuid.uuid4()),
+                "threadId": "",
+                "createdAt": now,
+                "output": text,
+                "name": "User",
+                "type": "user_message",
+            },
+            "fileReferences": [],
+        }
+        start = time.perf_counter()
+        await self.sio.emit("client_message", payload)
+        return await self._wait(start, "task_end")
+
+    async def click(self, action: dict):
+        self._drain()
+        self.actions = []
+        start = time.perf_counter()
+        await self.sio.emit("action_call", action)
+        return await self._wait(start, "action_response", action.get("id"))
+
+    async def close(self) -> None:
+        await self.sio.disconnect()
+
+
+async def simulate_user(index: int, args, stats: Stats, questions: List[str], rng: random.Random) -> None:
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    token = mint_token(args.auth_secret, f"load-{index}") if args.auth_secret else None
+    session = ChainlitSession(args.url, token, args.timeout)
+    start = time.perf_counter()
+    try:
+        await session.connect()
+    except Exception as error:
+        print(f"user {index}: connect failed: {error}", file=sys.stderr)
+        stats.record("connect", None, None, True)
+        return
+    stats.record("connect", None, time.perf_counter() - start, False)
+    try:
+        if args.welcome:
+            stats.record("on_chat_start", *await session.welcome(start))
+        for turn in range(args.messages):
+            if turn:
+                await asyncio.sleep(args.think * rng.uniform(0.5, 1.5))
+            clickable = [action for action in session.actions if action.get("name") == args.click]
+            if clickable and rng.random() < args.click_rate:
+                stats.record(f"action:{args.click}", *await session.click(rng.choice(clickable)))
+            else:
+                stats.record("on_message", *await session.ask(rng.choice(questions)))
+    finally:
+        await session.close()
+
+
+def load_questions(path: Optional[str]) -> List[str]:
+    if not path:
+        return QUESTIONS
+    import pandas as pd
+
+    return [str(query) for query in pd.read_csv(path)["Query"].dropna()]
+
+
+async def main_async(args) -> None:
+    stats = Stats()
+    rng = random.Random(args.seed)
+    questions = load_questions(args.queries)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        simulate_user(i, args, stats, questions, random.Random(rng.random())) for i in range(args.users)
+    ))
+    elapsed = time.perf_counter() - start
+    print(f"{args.users} users x {args.messages} messages against {args.url} in {elapsed:.1f}s")
+    stats.report(elapsed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"elapsed_s": elapsed, "first": stats.first, "done": stats.done, "errors": stats.errors}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--think", type=float, default=2.0, help="mean seconds between a reply and the next message")
+    parser.add_argument("--ramp", type=float, default=5.0, help="users connect uniformly over this many seconds")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--queries", help="CSV with a Query column (defaults to a built-in list)")
+    parser.add_argument("--click", default="related_question", help="action name to click when an answer offers one")
+    parser.add_argument("--click-rate", type=float, default=0.0)
+    parser.add_argument("--no-welcome", dest="welcome", action="store_false", help="the app has no on_chat_start message")
+    parser.add_argument("--auth-secret", help="CHAINLIT_AUTH_SECRET of the app, when it requires login")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write raw latencies to this file")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Request payload and latency over long Gemini chats, shared vs per-session history.
+
+Runs ``--users`` concurrent ``--turns``-turn conversations against the fake
+Gemini model. Each user attaches a PDF on their first turn. The fake adds
+``VERTEXCHAT_FAKE_PREFILL_PER_1K_TOKENS`` of delay per 1000 input tokens,
+so time to first token grows with what is re-sent. Modes:
+
+* ``shared``   - one ``ChatSession`` for every user, never trimmed (previous behaviour)
+* ``window``   - ``ChatHistory`` per user with ``--max-tokens`` / ``--max-bytes-mb``
+* ``summary``  - the same, folding dropped turns into a background summary
+
+For sampled turns it prints the mean request size, estimated input tokens
+and time to first token.
+
+    python benchmarks/chat_history_bench.py --users 4 --turns 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("VERTEXCHAT_FAKE_LATENCY_SEND_MESSAGE_FIRST_CHUNK", "fixed:0.02")
+os.environ.setdefault("VERTEXCHAT_FAKE_LATENCY_SEND_MESSAGE", "fixed:0.05")
+os.environ.setdefault("VERTEXCHAT_FAKE_LATENCY_GENERATE_CONTENT", "fixed:0.05")
+
+from vertexai.generative_models import Part
+
+from vertexchat import fakes
+from vertexchat.history import ChatHistory, part_bytes, part_tokens
+
+QUESTIONS = [
+    "What does section {n} of the permit guide say about renewals?",
+    "Which fees from the attached schedule apply to a food truck in district {n}?",
+    "Summarize the parking rules for zone {n} in two sentences.",
+    "Who do I contact about inspection number {n}?",
+]
+
+
+class Message:
+    """Collects streamed tokens like ``cl.Message``."""
+
+    def __init__(self):
+        self.content = ""
+
+    async def stream_token(self, token: str) -> None:
+        self.content += token
+
+
+def make_pdf(pages: int, size: int, rng: random.Random) -> Part:
+    body = b"".join(b"1 0 obj << /Type /Page >> endobj\n" for _ in range(pages))
+    return Part.from_data(b"%PDF-1.4\n" + body + rng.randbytes(size), mime_type="application/pdf")
+
+
+def shared_size(chat, content) -> tuple:
+    parts = []
+    for entry in list(chat.history) + [content]:
+        entry = getattr(entry, "parts", entry)
+        parts.extend(entry if isinstance(entry, list) else [entry])
+    return sum(part_tokens(part) for part in parts), sum(part_bytes(part) for part in parts)
+
+
+async def ttft_of(chat, content) -> float:
+    start = time.perf_counter()
+    responses = await chat.send_message_async(content, stream=True)
+    msg = Message()
+    ttft = None
+    async for chunk in responses:
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        await msg.stream_token(chunk.text)
+    return ttft, msg.content
+
+
+async def converse(user: int, mode: str, args, model, shared_chat, results, rng: random.Random) -> None:
+    history = None
+    if mode != "shared":
+        history = ChatHistory(model, args.max_tokens, int(args.max_bytes_mb * (1 << 20)), summarizer=model if mode == "summary" else None)
+    for turn in range(1, args.turns + 1):
+        content = [rng.choice(QUESTIONS).format(n=rng.randint(1, 99))]
+        if turn == 1:
+            content.append(make_pdf(args.pdf_pages, int(args.pdf_mb * (1 << 20)), rng))
+        if history is None:
+            chat = shared_chat
+            tokens, nbytes = shared_size(chat, content)
+        else:
+            chat = history.start_chat()
+            tokens, nbytes = history.request_size(content)
+        ttft, reply = await ttft_of(chat, content)
+        if history is not None:
+            history.record(content, reply)
+        results[turn].append((nbytes, tokens, ttft))
+        await asyncio.sleep(rng.uniform(0, 0.01))
+    if history is not None:
+        results["stats"].append(history.stats())
+
+
+async def run(mode: str, args) -> dict:
+    model = fakes.FakeGenerativeModel("gemini-1.5-pro-001")
+    shared_chat = model.start_chat(history=[])
+    results = defaultdict(list)
+    rng = random.Random(args.seed)
+    await asyncio.gather(*(
+        converse(user, mode, args, model, shared_chat, results, random.Random(rng.random())) for user in range(args.users)
+    ))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--pdf-mb", type=float, default=1.0)
+    parser.add_argument("--pdf-pages", type=int, default=12)
+    parser.add_argument("--max-tokens", type=int, default=6000)
+    parser.add_argument("--max-bytes-mb", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ["VERTEXCHAT_FAKE_BACKEND"] = "true"
+    samples = sorted({1, 2, 5, 10, 25, args.turns} & set(range(1, args.turns + 1)))
+    print(f"{args.users} users x {args.turns} turns, {args.pdf_mb:g} MiB / {args.pdf_pages}-page PDF on turn 1, "
+          f"budget {args.max_tokens} tokens / {args.max_bytes_mb:g} MiB")
+    print(f"{'mode':<8} {'turn':>5} {'request KiB':>12} {'tokens':>8} {'ttft ms':>8}")
+    for mode in ("shared", "window", "summary"):
+        results = asyncio.run(run(mode, args))
+        for turn in samples:
+            rows = results[turn]
+            print(f"{mode:<8} {turn:>5} {statistics.mean(r[0] for r in rows) / 1024:>12.1f} "
+                  f"{statistics.mean(r[1] for r in rows):>8.0f} {statistics.mean(r[2] for r in rows) * 1e3:>8.1f}")
+        if results["stats"]:
+            print(f"{'':<8} final history of user 0: {results['stats'][0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Backend calls and latency for a burst of identical questions, with and without coalescing.
+
+``--users`` users ask within ``--burst`` seconds of each other. Most ask one of
+``--hot`` popular questions, in trivial variants (case, spacing, trailing
+"?"), and ``--cold-share`` ask something unique. Every miss goes to a fake
+``answer_query`` taking ``--latency`` seconds. ``--leave-share`` of users
+cancel their request half way, as when they close the tab; with coalescing
+that must not cancel the call the others are waiting on.
+
+Each user has their own session, as in the apps, so a user who gets an answer
+from another user's call still sends the turn to their session in the
+background ("turn records").
+
+    python benchmarks/coalescing_bench.py --users 500 --burst 2 --latency 2.5
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vertexchat.cache import AnswerCache, normalize_query
+
+HOT = ["how do I renew my permit", "when is trash pickup this week", "where can I pay a parking ticket"]
+
+
+class FakeAnswers:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.records = 0
+
+    async def answer_query(self, question: str):
+        self.calls += 1
+        await asyncio.sleep(self.latency * random.uniform(0.8, 1.2))
+        return f"Answer to {question}"
+
+    async def record_turn(self, question: str):
+        self.records += 1
+        await asyncio.sleep(self.latency * random.uniform(0.8, 1.2))
+
+
+def variant(question: str, rng: random.Random) -> str:
+    question = question.upper() if rng.random() < 0.2 else question
+    return question.replace(" ", "  ", 1) + rng.choice(["", "?", " ?", "."])
+
+
+async def simulate(args, coalesce: bool) -> dict:
+    random.seed(args.seed)
+    rng = random.Random(args.seed)
+    backend = FakeAnswers(args.latency)
+    cache = AnswerCache(coalesce=coalesce)
+    latencies, left, wrong = [], 0, 0
+
+    async def user(i: int):
+        nonlocal left, wrong
+        await asyncio.sleep(rng.uniform(0, args.burst))
+        question = f"unique question {i}" if rng.random() < args.cold_share else variant(rng.choice(HOT[:args.hot]), rng)
+        start = time.perf_counter()
+        lookup = asyncio.ensure_future(cache.get_or_call(
+            lambda: backend.answer_query(question), question, "serving-config",
+            session=f"session-{i}", record=lambda answer: backend.record_turn(question),
+        ))
+        if rng.random() < args.leave_share:
+            await asyncio.sleep(args.latency / 2)
+            lookup.cancel()
+            left += 1
+            return
+        answer = await lookup
+        # A shared answer must be for the same question, up to normalization
+        if normalize_query(answer[len("Answer to "):]) != normalize_query(question):
+            wrong += 1
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(user(i) for i in range(args.users)), return_exceptions=True)
+    while cache.stats()["recording"]:
+        await asyncio.sleep(0.05)
+    p50, p99 = np.percentile(latencies, [50, 99])
+    stats = cache.stats()
+    return {"calls": backend.calls, "records": backend.records, "p50": p50, "p99": p99, "answered": len(latencies), "left": left,
+            "wrong": wrong, "coalesced": stats["coalesced"], "hits": stats["hits"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--burst", type=float, default=2.0)
+    parser.add_argument("--latency", type=float, default=2.5)
+    parser.add_argument("--hot", type=int, default=3)
+    parser.add_argument("--cold-share", type=float, default=0.1)
+    parser.add_argument("--leave-share", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.users} users in {args.burst:g}s, {args.hot} hot questions, {args.cold_share:.0%} unique, "
+          f"{args.leave_share:.0%} leave early, answer_query {args.latency:g}s")
+    print(f"{'coalesce':<9} {'backend calls':>13} {'turn records':>12} {'coalesced':>9} {'cache hits':>10} {'p50 s':>6} {'p99 s':>6} {'answered':>8} {'left':>5} {'wrong':>5}")
+    for coalesce in (False, True):
+        r = asyncio.run(simulate(args, coalesce))
+        print(f"{str(coalesce):<9} {r['calls']:>13} {r['records']:>12} {r['coalesced']:>9} {r['hits']:>10} {r['p50']:>6.2f} {r['p99']:>6.2f} "
+              f"{r['answered']:>8} {r['left']:>5} {r['wrong']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Throughput of concurrent chat sessions against a slow conversational search RPC.
+
+Simulates ``--sessions`` users each sending ``--messages`` messages through an
+async handler, with every RPC taking ``--latency`` seconds. Three paths are
+compared:
+
+* blocking - the old handlers, calling the sync client on the event loop
+* thread   - ``ConversationalSearch`` with no async client (worker-pool fallback)
+* async    - ``ConversationalSearch`` on the async client
+
+Usage: python benchmarks/concurrency_bench.py --latency 0.2 --sessions 1 8 32 128
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vertexchat.aio import ConversationalSearch
+
+LATENCY = 0.2
+
+
+class FakeSyncClient:
+    def __init__(self, client_options=None):
+        pass
+
+    def converse_conversation(self, request):
+        time.sleep(LATENCY)
+        return request
+
+
+class FakeAsyncClient:
+    def __init__(self, client_options=None):
+        pass
+
+    async def converse_conversation(self, request):
+        await asyncio.sleep(LATENCY)
+        return request
+
+
+sync_only = SimpleNamespace(ConversationalSearchServiceClient=FakeSyncClient)
+with_async = SimpleNamespace(
+    ConversationalSearchServiceClient=FakeSyncClient,
+    ConversationalSearchServiceAsyncClient=FakeAsyncClient,
+)
+
+
+async def run_sessions(mode: str, sessions: int, messages: int) -> float:
+    blocking_client = FakeSyncClient()
+    search = ConversationalSearch(with_async if mode == "async" else sync_only)
+
+    async def on_message(text):
+        if mode == "blocking":
+            return blocking_client.converse_conversation(text)
+        return await search.converse_conversation(text)
+
+    async def session(i):
+        for j in range(messages):
+            await on_message(f"user {i} message {j}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    return sessions * messages / elapsed
+
+
+def main():
+    global LATENCY
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=LATENCY, help="simulated RPC latency in seconds")
+    parser.add_argument("--messages", type=int, default=3, help="messages per session")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32, 128])
+    args = parser.parse_args()
+    LATENCY = args.latency
+
+    print(f"{'sessions':>8} {'blocking msg/s':>15} {'thread msg/s':>13} {'async msg/s':>12}")
+    for sessions in args.sessions:
+        row = [asyncio.run(run_sessions(mode, sessions, args.messages)) for mode in ("blocking", "thread", "async")]
+        print(f"{sessions:>8} {row[0]:>15.1f} {row[1]:>13.1f} {row[2]:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
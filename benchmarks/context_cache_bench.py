@@ -0,0 +1,86 @@
+"""Bytes uploaded per chat turn with a PDF inline vs in a cached context.
+
+Runs ``--users`` concurrent ``--turns``-turn chats against the fake Gemini
+model. Each user attaches a large PDF on the first turn, and every later turn
+is a follow-up question about it. Modes:
+
+* ``inline`` - the PDF stays in the history and is re-sent every turn (previous behaviour)
+* ``cached`` - ``ChatHistory.attach`` puts it in a (fake) cached context once
+
+For sampled turns it prints the mean bytes uploaded, counting the request plus
+any cache creation, and time to first token. It also prints the total over
+the conversation.
+
+    python benchmarks/context_cache_bench.py --users 4 --turns 20 --pdf-mb 8 --pdf-pages 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ["VERTEXCHAT_FAKE_BACKEND"] = "true"
+os.environ.setdefault("VERTEXCHAT_FAKE_LATENCY_SEND_MESSAGE_FIRST_CHUNK", "fixed:0.02")
+os.environ.setdefault("VERTEXCHAT_FAKE_LATENCY_SEND_MESSAGE", "fixed:0.05")
+os.environ.setdefault("VERTEXCHAT_FAKE_LATENCY_CREATE_CACHED_CONTENT", "fixed:0.3")
+
+from chat_history_bench import QUESTIONS, make_pdf, ttft_of
+
+from vertexchat import fakes
+from vertexchat.history import ChatHistory
+
+
+async def converse(mode: str, args, model, results, rng: random.Random) -> None:
+    context_cache = fakes.FakeContextCache(model.model_name, min_tokens=args.min_tokens) if mode == "cached" else None
+    # Budgets large enough that the inline PDF is never trimmed, as with the old shared chat
+    history = ChatHistory(model, max_tokens=1 << 30, max_bytes=1 << 40, context_cache=context_cache)
+    for turn in range(1, args.turns + 1):
+        content = [rng.choice(QUESTIONS).format(n=rng.randint(1, 99))]
+        if turn == 1:
+            content.append(make_pdf(args.pdf_pages, int(args.pdf_mb * (1 << 20)), rng))
+        uploaded_before = history.uploaded_bytes
+        content = await history.attach(content)
+        tokens, nbytes = history.request_size(content)
+        ttft, reply = await ttft_of(history.start_chat(), content)
+        history.record(content, reply)
+        results[turn].append((nbytes + history.uploaded_bytes - uploaded_before, ttft))
+    await history.close()
+
+
+async def run(mode: str, args) -> dict:
+    model = fakes.FakeGenerativeModel("gemini-1.5-pro-001")
+    results = defaultdict(list)
+    rng = random.Random(args.seed)
+    await asyncio.gather(*(converse(mode, args, model, results, random.Random(rng.random())) for _ in range(args.users)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--pdf-mb", type=float, default=8.0)
+    parser.add_argument("--pdf-pages", type=int, default=200)
+    parser.add_argument("--min-tokens", type=int, default=32768)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    samples = sorted({1, 2, 5, 10, args.turns} & set(range(1, args.turns + 1)))
+    print(f"{args.users} users x {args.turns} turns, {args.pdf_mb:g} MiB / {args.pdf_pages}-page PDF on turn 1")
+    print(f"{'mode':<7} {'turn':>5} {'uploaded KiB':>13} {'ttft ms':>8}")
+    for mode in ("inline", "cached"):
+        results = asyncio.run(run(mode, args))
+        for turn in samples:
+            rows = results[turn]
+            print(f"{mode:<7} {turn:>5} {statistics.mean(r[0] for r in rows) / 1024:>13.1f} {statistics.mean(r[1] for r in rows) * 1e3:>8.1f}")
+        total = sum(r[0] for turn in results for r in results[turn]) / args.users
+        print(f"{mode:<7} {'all':>5} {total / 1024:>13.1f}   per user over the conversation")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Peak memory of the eval pipeline, whole-DataFrame vs chunked streaming.
+
+Writes a ``--rows``-row query CSV with a few extra columns, then runs the
+batch over it with an instant fake Answers API returning ``--answer-kb`` KiB
+answers. Each mode runs in its own process, so peak RSS is its own:
+
+* ``frame``  - the old script: ``read_csv`` everything, ``run_batch`` collects
+  every record, ``df.at`` per row, one ``to_csv`` at the end
+* ``stream`` - ``read_rows`` in chunks, ``run_batch(collect=False)`` appending
+  to the checkpoint, then ``merge_results`` chunk by chunk
+
+Also run ``stream`` as ``--shards`` partial runs merged at the end, and
+``--crash-at`` to kill a run part way and resume it.
+
+    python benchmarks/eval_stream_bench.py --rows 100000 100000 --answer-kb 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+WORDS = "permit renewal parking ticket property tax trash pickup business license street repair fee schedule".split()
+RESULT_COLUMNS = {"Answers API": "answer", "API Call Time (s)": "elapsed_s", "References": "references"}
+
+
+def make_csv(path: Path, rows: int, rng: random.Random) -> None:
+    with open(path, "w") as f:
+        f.write("Query,Category,Expected\n")
+        for _ in range(rows):
+            query = " ".join(rng.choice(WORDS) for _ in range(10))
+            expected = " ".join(rng.choice(WORDS) for _ in range(40))
+            f.write(f"{query},{rng.choice(WORDS)},{expected}\n")
+
+
+def fake_answer(answer_kb: float, crash_at: int):
+    calls = 0
+    filler = ("lorem ipsum " * int(answer_kb * 1024 / 12 + 1))[: int(answer_kb * 1024)]
+
+    async def answer_row(query):
+        nonlocal calls
+        calls += 1
+        if crash_at and calls == crash_at:
+            os._exit(3)
+        await asyncio.sleep(0)
+        return {"answer": f"{query}: {filler}", "references": "\n\n**References:**\n1. [Fee schedule](https://example.org)"}
+
+    return answer_row
+
+
+def child(args) -> None:
+    from vertexchat.batch import Checkpoint, run_batch
+
+    work = Path(args.work)
+    start = time.perf_counter()
+    worker = fake_answer(args.answer_kb, args.crash_at)
+    if args.child == "frame":
+        import pandas as pd
+
+        df = pd.read_csv(work / "queries.csv")
+        df["Answers API"] = None
+        df["API Call Time (s)"] = None
+        results = asyncio.run(run_batch(
+            ((index, row["Query"]) for index, row in df.iterrows()), worker, concurrency=8,
+            checkpoint=Checkpoint(work / "frame.jsonl", flush_every=1000),
+        ))
+        for index, record in results.items():
+            df.at[index, "Answers API"] = record["answer"]
+            df.at[index, "API Call Time (s)"] = record["elapsed_s"]
+            df.at[index, "References"] = record["references"]
+        df.to_csv(work / "frame.csv", index=False)
+    else:
+        from vertexchat.eval_io import merge_results, read_rows
+
+        partials = []
+        for shard in range(args.shards):
+            partial = work / f"stream-{shard}.jsonl"
+            partials.append(partial)
+            asyncio.run(run_batch(
+                read_rows(work / "queries.csv", "Query", args.chunksize, (shard, args.shards)), worker, concurrency=8,
+                checkpoint=Checkpoint(partial, flush_every=1000), collect=False,
+            ))
+        counts = merge_results(work / "queries.csv", partials, work / f"stream{args.suffix}", RESULT_COLUMNS, args.chunksize)
+        assert counts["answered"] == counts["rows"], counts
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"seconds": time.perf_counter() - start, "peak_mib": peak}))
+
+
+def run_child(mode: str, work: Path, args, crash_at: int = 0) -> dict:
+    command = [sys.executable, __file__, "--child", mode, "--work", str(work), "--answer-kb", str(args.answer_kb),
+               "--chunksize", str(args.chunksize), "--shards", str(args.shards), "--suffix", args.suffix,
+               "--crash-at", str(crash_at)]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode:
+        return {"exit": result.returncode, "stderr": result.stderr[-500:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--answer-kb", type=float, default=2.0)
+    parser.add_argument("--chunksize", type=int, default=1000)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--suffix", default=".csv", help=".csv or .parquet")
+    parser.add_argument("--crash-at", type=int, default=0, help="kill the stream run after this many rows, then resume")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--work", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    print(f"{args.answer_kb:g} KiB answers, chunks of {args.chunksize}, {args.shards} shard(s), output {args.suffix}")
+    print(f"{'rows':>8} {'mode':<8} {'seconds':>8} {'peak MiB':>9}")
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as work:
+            work = Path(work)
+            make_csv(work / "queries.csv", rows, random.Random(args.seed))
+            for mode in ("frame", "stream"):
+                if mode == "stream" and args.crash_at:
+                    crashed = run_child(mode, work, args, args.crash_at)
+                    print(f"{rows:>8} {'crash':<8} exit {crashed.get('exit')}, resuming")
+                result = run_child(mode, work, args)
+                if "exit" in result:
+                    print(f"{rows:>8} {mode:<8} failed: {result['stderr']}")
+                    continue
+                print(f"{rows:>8} {mode:<8} {result['seconds']:>8.1f} {result['peak_mib']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
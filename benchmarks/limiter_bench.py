@@ -0,0 +1,139 @@
+"""Quota errors and latency during a traffic spike, with and without the adaptive limiter.
+
+A fake backend answers in ``--latency`` seconds and enforces a quota of
+``--quota`` requests per second (a token bucket with one second of burst).
+Calls over the quota fail at once with ``TooManyRequests``, as Discovery
+Engine and Gemini do. Users arrive at ``--base`` per second, then at
+``--spike`` per second for ``--spike-seconds``, then at ``--base`` again.
+
+* ``none`` - every call goes straight to the backend, as before
+* ``aimd`` - calls go through ``AdaptiveLimiter``; a full queue or a wait
+  over ``--queue-timeout`` gets the "busy" reply instead
+
+Every 429 is an error the user sees. "busy" replies are errors too, but they
+come back at once and cost no quota.
+
+    python benchmarks/limiter_bench.py --quota 40 --base 20 --spike 120
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from google.api_core import exceptions as core_exceptions
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vertexchat.limiter import AdaptiveLimiter, Overloaded
+
+
+class QuotaBackend:
+    def __init__(self, quota: float, latency: float):
+        self.quota = quota
+        self.latency = latency
+        self.tokens = quota
+        self.updated = time.monotonic()
+        self.calls = 0
+        self.throttled = 0
+
+    async def answer_query(self):
+        now = time.monotonic()
+        self.tokens = min(self.quota, self.tokens + (now - self.updated) * self.quota)
+        self.updated = now
+        self.calls += 1
+        if self.tokens < 1:
+            self.throttled += 1
+            await asyncio.sleep(0.02)
+            raise core_exceptions.TooManyRequests("Quota exceeded for answer_query requests per minute")
+        self.tokens -= 1
+        await asyncio.sleep(self.latency * random.uniform(0.7, 1.5))
+        return "answer"
+
+
+async def simulate(args, mode: str) -> dict:
+    random.seed(args.seed)
+    backend = QuotaBackend(args.quota, args.latency)
+    limiter = None
+    if mode == "aimd":
+        limiter = AdaptiveLimiter(mode, initial=args.initial, max_queue=args.max_queue, queue_timeout=args.queue_timeout)
+    latencies, busy_latencies = [], []
+    outcomes = {"ok": 0, "429": 0, "busy": 0}
+    trace = []
+
+    async def user():
+        start = time.perf_counter()
+        try:
+            if limiter is None:
+                await backend.answer_query()
+            else:
+                async with limiter.slot():
+                    await backend.answer_query()
+        except core_exceptions.TooManyRequests:
+            outcomes["429"] += 1
+            return
+        except Overloaded:
+            outcomes["busy"] += 1
+            busy_latencies.append(time.perf_counter() - start)
+            return
+        outcomes["ok"] += 1
+        latencies.append(time.perf_counter() - start)
+
+    async def sample():
+        while True:
+            await asyncio.sleep(1.0)
+            if limiter is not None:
+                trace.append((limiter.limit, limiter.queue_depth))
+
+    users = []
+    sampler = asyncio.ensure_future(sample())
+    phases = [(args.base, args.base_seconds), (args.spike, args.spike_seconds), (args.base, args.base_seconds)]
+    for rate, seconds in phases:
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            users.append(asyncio.ensure_future(user()))
+            await asyncio.sleep(random.expovariate(rate))
+    await asyncio.gather(*users)
+    sampler.cancel()
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return {
+        **outcomes,
+        "users": len(users),
+        "calls": backend.calls,
+        "p50": p50,
+        "p99": p99,
+        "busy_p99": np.percentile(busy_latencies, 99) if busy_latencies else None,
+        "trace": trace,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quota", type=float, default=40, help="backend requests per second")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--base", type=float, default=20, help="arrivals per second before and after the spike")
+    parser.add_argument("--base-seconds", type=float, default=5)
+    parser.add_argument("--spike", type=float, default=120, help="arrivals per second during the spike")
+    parser.add_argument("--spike-seconds", type=float, default=10)
+    parser.add_argument("--initial", type=float, default=16)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--queue-timeout", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"quota {args.quota:g}/s, answer in {args.latency:g}s; {args.base:g}/s for {args.base_seconds:g}s, "
+          f"{args.spike:g}/s for {args.spike_seconds:g}s, {args.base:g}/s for {args.base_seconds:g}s")
+    print(f"{'mode':<5} {'users':>6} {'ok':>6} {'429':>6} {'busy':>6} {'backend calls':>13} {'ok p50 s':>8} {'ok p99 s':>8} {'busy p99 s':>10}")
+    traces = {}
+    for mode in ("none", "aimd"):
+        r = asyncio.run(simulate(args, mode))
+        busy_p99 = "-" if r["busy_p99"] is None else f"{r['busy_p99']:.2f}"
+        print(f"{mode:<5} {r['users']:>6} {r['ok']:>6} {r['429']:>6} {r['busy']:>6} {r['calls']:>13} "
+              f"{r['p50']:>8.2f} {r['p99']:>8.2f} {busy_p99:>10}")
+        traces[mode] = r["trace"]
+    print("aimd limit / queue depth each second:", " ".join(f"{limit:.0f}/{depth}" for limit, depth in traces["aimd"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Related-question click latency with and without speculative prefetch.
+
+Simulates ``--users`` chats against a fake ``answer_query`` with
+``--latency`` seconds of service time. After each answer, a user either
+clicks one of its related questions (probability ``--click-rate``) after a
+think time of ``--think`` seconds or types a new question. Reports click
+latency percentiles, backend calls and wasted (cancelled or unused)
+prefetches, with the same Prefetcher the Answers UI uses.
+
+Usage: python benchmarks/prefetch_bench.py --users 200 --turns 5 --click-rate 0.6
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vertexchat.prefetch import Prefetcher
+
+
+class FakeBackend:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def answer_query(self, question: str):
+        self.calls += 1
+        await asyncio.sleep(self.latency * random.uniform(0.8, 1.2))
+        related = [f"{question} / follow-up {i}" for i in range(4)]
+        return SimpleNamespace(answer=SimpleNamespace(answer_text=f"Answer to {question}", related_questions=related))
+
+
+async def simulate(args, prefetch: bool):
+    random.seed(0)
+    backend = FakeBackend(args.latency)
+    prefetcher = Prefetcher(backend.answer_query, top_k=args.top_k, concurrency=args.concurrency, budget=args.budget) if prefetch else None
+    click_latency = []
+
+    async def chat(user):
+        await asyncio.sleep(random.uniform(0, 1))
+        question = f"user {user} question 0"
+        clicked = False
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            response = None
+            if prefetcher is not None:
+                response = await prefetcher.take(user, question)
+            if response is None:
+                response = await backend.answer_query(question)
+            if clicked:
+                click_latency.append(time.perf_counter() - start)
+            if prefetcher is not None:
+                prefetcher.schedule(user, response.answer.related_questions)
+            await asyncio.sleep(args.think * random.uniform(0.5, 1.5))
+            clicked = random.random() < args.click_rate
+            if clicked:
+                question = random.choice(response.answer.related_questions[:args.top_k])
+            else:
+                question = f"user {user} question {turn + 1}"
+        if prefetcher is not None:
+            prefetcher.forget(user)
+
+    await asyncio.gather(*(chat(user) for user in range(args.users)))
+    return backend, prefetcher, click_latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--think", type=float, default=4.0)
+    parser.add_argument("--click-rate", type=float, default=0.6)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--budget", type=int, default=20)
+    args = parser.parse_args()
+    print(f"{'mode':<10} {'click p50':>10} {'click p95':>10} {'backend calls':>14}")
+    for label, prefetch in (("inline", False), ("prefetch", True)):
+        backend, prefetcher, latency = asyncio.run(simulate(args, prefetch))
+        q = statistics.quantiles(latency, n=100, method="inclusive")
+        print(f"{label:<10} {q[49] * 1e3:8.1f}ms {q[94] * 1e3:8.1f}ms {backend.calls:>14}")
+        if prefetcher is not None:
+            print(f"{'':<10} {prefetcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
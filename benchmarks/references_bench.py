@@ -0,0 +1,100 @@
+"""Microbenchmark: old per-app reference renderers vs vertexchat.references.
+
+Builds large synthetic answers (``--references`` sources, ``--citations``
+markers / citations) and times the previous implementations - per-reference
+``str.replace`` with per-URL ``re.match``/``re.sub``, and the Answers
+renderer's ``any(url in link ...)`` de-duplication - against the shared
+single-pass renderer.
+
+Usage: python benchmarks/references_bench.py --references 300 --citations 2000
+"""
+import argparse
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vertexchat.references import answer_references, render_summary
+
+
+def old_parse_external_link(url=''):
+    protocol_regex = r'^(gs)://'
+    match = re.match(protocol_regex, url)
+    protocol = match.group(1) if match else None
+    if protocol == 'gs':
+        return re.sub(protocol_regex, 'https://storage.cloud.google.com/', url)
+    else:
+        return url
+
+
+def old_replace_references(text, references):
+    for i, reference in enumerate(references):
+        placeholder = f"[{i + 1}]"
+        text = text.replace(placeholder, f"{placeholder}({old_parse_external_link(reference.uri)})")
+    return text
+
+
+def old_add_references_answers(citations, response):
+    textref = f"\n References:"
+    textlinks = []
+    for i, citation in enumerate(citations):
+        citindex = int(citation.sources[0].reference_id)
+        url = response.answer.references[citindex].chunk_info.document_metadata.uri
+        title = response.answer.references[citindex].chunk_info.document_metadata.title
+        if not any(url in link for link in textlinks):
+            textlinks.append(f"\n [{title}]({url})")
+    return textref + "".join(textlinks)
+
+
+def build(references: int, citations: int, seed: int = 0):
+    rng = random.Random(seed)
+    refs = [SimpleNamespace(uri=f"gs://bucket/docs/document-{i}.pdf", title=f"Document {i}") for i in range(references)]
+    sentences = []
+    for _ in range(citations):
+        sentences.append("The permit office processes renewals within ten business days "
+                         f"[{rng.randint(1, references)}].")
+    summary = SimpleNamespace(
+        summary_text=" ".join(sentences),
+        summary_with_metadata=SimpleNamespace(references=refs),
+    )
+    answer_refs = [
+        SimpleNamespace(chunk_info=SimpleNamespace(document_metadata=SimpleNamespace(uri=r.uri, title=r.title))) for r in refs
+    ]
+    answer = SimpleNamespace(
+        answer_text=summary.summary_text,
+        references=answer_refs,
+        citations=[
+            SimpleNamespace(sources=[SimpleNamespace(reference_id=str(rng.randrange(references)))]) for _ in range(citations)
+        ],
+    )
+    return summary, answer
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    print(f"{label:<40} {seconds * 1e3:9.3f} ms")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--references", type=int, default=300)
+    parser.add_argument("--citations", type=int, default=2000)
+    parser.add_argument("--number", type=int, default=5)
+    args = parser.parse_args()
+    summary, answer = build(args.references, args.citations)
+    print(f"{args.references} references, {args.citations} citations, {len(summary.summary_text)} chars")
+
+    old = bench("inline citations: old replace loop", lambda: old_replace_references(summary.summary_text, summary.summary_with_metadata.references), args.number)
+    new = bench("inline citations: single pass", lambda: render_summary(summary), args.number)
+    print(f"{'':<40} {old / new:9.1f}x")
+    old = bench("answer references: old any() dedup", lambda: old_add_references_answers(answer.citations, SimpleNamespace(answer=answer)), args.number)
+    new = bench("answer references: set dedup", lambda: answer_references(answer), args.number)
+    print(f"{'':<40} {old / new:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
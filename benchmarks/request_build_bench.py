@@ -0,0 +1,98 @@
+"""Microbenchmark: per-request proto construction vs prebuilt request templates.
+
+Times building an ``AnswerQueryRequest`` and a ``ConverseConversationRequest``
+the way the apps used to (every nested spec message constructed per call)
+against ``vertexchat.request_templates``, and measures the peak Python heap
+each approach allocates per request with tracemalloc. Also checks both produce
+identical requests.
+
+Usage: python benchmarks/request_build_bench.py --number 20000
+"""
+import argparse
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+from google.cloud import discoveryengine_v1beta as discoveryengine
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vertexchat.request_templates import AnswerRequestTemplate, ConverseRequestTemplate
+
+SERVING_CONFIG = "projects/my-project/locations/global/collections/default_collection/dataStores/my-data-store/servingConfigs/default_serving_config"
+SESSION = "projects/my-project/locations/global/collections/default_collection/dataStores/my-data-store/sessions/1234567890"
+CONVERSATION = "projects/my-project/locations/global/collections/default_collection/dataStores/my-data-store/conversations/1234567890"
+MODEL_VERSION = "gemini-1.5-flash-001/answer_gen/v1"
+PREAMBLE = "Given the conversation between a user and a helpful assistant and some search results, create a final answer for the assistant."
+QUERY = "How do I renew a business permit?"
+
+
+def old_answer_request(query_text):
+    query = discoveryengine.Query()
+    query.text = query_text
+    model_spec1 = discoveryengine.AnswerQueryRequest.AnswerGenerationSpec.ModelSpec(model_version=MODEL_VERSION)
+    prompt_spec1 = discoveryengine.AnswerQueryRequest.AnswerGenerationSpec.PromptSpec(preamble=PREAMBLE)
+    related_question_spec = discoveryengine.AnswerQueryRequest.RelatedQuestionsSpec(enable=True)
+    answer_generation_spec = discoveryengine.AnswerQueryRequest.AnswerGenerationSpec(model_spec=model_spec1, prompt_spec=prompt_spec1, include_citations=True, ignore_low_relevant_content=False)
+    return discoveryengine.AnswerQueryRequest(
+        query=query,
+        session=SESSION,
+        serving_config=SERVING_CONFIG, answer_generation_spec=answer_generation_spec, related_questions_spec=related_question_spec)
+
+
+def old_converse_request(query_text):
+    return discoveryengine.ConverseConversationRequest(
+        name=CONVERSATION,
+        query=discoveryengine.TextInput(input=query_text),
+        serving_config=SERVING_CONFIG,
+        summary_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec(
+            summary_result_count=3,
+            model_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec.ModelSpec(version=MODEL_VERSION),
+            model_prompt_spec=discoveryengine.SearchRequest.ContentSearchSpec.SummarySpec.ModelPromptSpec(preamble=PREAMBLE),
+            include_citations=True,
+        ),
+    )
+
+
+def transient_peak(func, number):
+    """Mean peak Python-heap bytes allocated while building one request."""
+    tracemalloc.start()
+    total = 0
+    for _ in range(number):
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        request = func()
+        total += tracemalloc.get_traced_memory()[1] - start
+        del request
+    tracemalloc.stop()
+    return total / number
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    peak = transient_peak(func, min(number, 2000))
+    print(f"{label:<28} {seconds * 1e6:9.1f} us {peak:9.0f} B")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    answer_template = AnswerRequestTemplate(discoveryengine, SERVING_CONFIG, MODEL_VERSION, PREAMBLE)
+    converse_template = ConverseRequestTemplate(discoveryengine, SERVING_CONFIG, MODEL_VERSION, PREAMBLE)
+    assert old_answer_request(QUERY) == answer_template.build(QUERY, SESSION)
+    assert old_converse_request(QUERY) == converse_template.build(QUERY, CONVERSATION)
+
+    print(f"{'':<28} {'per call':>12} {'peak heap':>11}")
+    old = bench("answer: per-request build", lambda: old_answer_request(QUERY), args.number)
+    new = bench("answer: template", lambda: answer_template.build(QUERY, SESSION), args.number)
+    print(f"{'':<28} {old / new:9.1f}x")
+    old = bench("converse: per-request build", lambda: old_converse_request(QUERY), args.number)
+    new = bench("converse: template", lambda: converse_template.build(QUERY, CONVERSATION), args.number)
+    print(f"{'':<28} {old / new:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""answer_query latency through one endpoint vs latency-aware routing and hedging.
+
+Runs ``--calls`` sessionless ``answer_query`` calls, ``--concurrency`` at a
+time, against local stand-in endpoints served by the fake backend. The
+endpoints are configured through ``VERTEXCHAT_FAKE_ENDPOINTS``:
+
+* ``a.fake`` - the current single endpoint
+* ``b.fake`` - 1.3x slower median
+* ``c.fake`` - 0.8x, the fastest median, but fails ``--error-rate`` of calls
+
+On every endpoint ``--stall-rate`` of calls stall for an extra
+``VERTEXCHAT_FAKE_STALL_SECONDS``: the slow tail.
+
+Modes:
+
+* ``single`` - ``ConversationalSearch`` on ``a.fake``, as the apps did
+* ``routed`` - ``RoutedSearch`` over all three
+* ``hedged`` - plus a hedge to the runner-up after the p95 delay
+
+    python benchmarks/routing_bench.py --calls 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ["VERTEXCHAT_FAKE_BACKEND"] = "true"
+# Measure routing alone; the process-wide admission limit would add its own queueing
+os.environ["BACKEND_LIMITER_ENABLED"] = "false"
+
+
+async def run(mode: str, args) -> dict:
+    from google.cloud import discoveryengine_v1beta as discoveryengine
+
+    from vertexchat import fakes
+    from vertexchat.aio import ConversationalSearch, client_options_for
+    from vertexchat.routing import RoutedSearch
+
+    # Fresh backends per mode, so each mode sees the same random stalls and failures
+    fakes._endpoint_backends.clear()
+    if mode == "single":
+        client = ConversationalSearch(discoveryengine, client_options=client_options_for("global", api_endpoint="a.fake"))
+    else:
+        client = RoutedSearch(discoveryengine, ["a.fake", "b.fake", "c.fake"], hedge=mode == "hedged", hedge_budget=args.hedge_budget)
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(args.calls):
+        queue.put_nowait(discoveryengine.AnswerQueryRequest(query=discoveryengine.Query(text=f"how do I renew permit {i}")))
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            request = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                await client.answer_query(request)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    wall = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    result = {"p50": p50, "p95": p95, "p99": p99, "max": max(latencies), "errors": errors, "wall": wall}
+    if mode != "single":
+        snapshot = client.snapshot()
+        result["hedges"] = snapshot["hedges"]
+        result["failovers"] = snapshot["failovers"]
+        result["share"] = {endpoint: stats["calls"] for endpoint, stats in snapshot["endpoints"].items()}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--scale", type=float, default=0.1, help="multiplies every fake latency")
+    parser.add_argument("--stall-rate", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--hedge-budget", type=float, default=0.1)
+    args = parser.parse_args()
+
+    os.environ["VERTEXCHAT_FAKE_SEED"] = "0"
+    os.environ.setdefault("VERTEXCHAT_FAKE_STALL_SECONDS", "20")
+    os.environ["VERTEXCHAT_FAKE_ENDPOINTS"] = (
+        f"a.fake={args.scale},0,{args.stall_rate};b.fake={args.scale * 1.3},0,{args.stall_rate};"
+        f"c.fake={args.scale * 0.8},{args.error_rate},{args.stall_rate}"
+    )
+    print(f"{args.calls} calls x {args.concurrency} concurrent; answer_query median {2.5 * args.scale:.2f}s, "
+          f"{args.stall_rate:.0%} of calls stall +{float(os.environ['VERTEXCHAT_FAKE_STALL_SECONDS']) * args.scale:.1f}s, "
+          f"c.fake fails {args.error_rate:.0%}")
+    print(f"{'mode':<8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7} {'hedges':>7} {'failover':>9}  calls per endpoint")
+    for mode in ("single", "routed", "hedged"):
+        r = asyncio.run(run(mode, args))
+        print(f"{mode:<8} {r['p50'] * 1e3:>8.0f} {r['p95'] * 1e3:>8.0f} {r['p99'] * 1e3:>8.0f} {r['max'] * 1e3:>8.0f} "
+              f"{r['errors']:>7} {r.get('hedges', '-'):>7} {r.get('failovers', '-'):>9}  {r.get('share', '')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Lookup latency and hit rate of the semantic cache tier on the eval query set.
+
+Half of the queries (by default) are indexed as if they had been answered.
+Lookups are then run for:
+
+* paraphrased variants of the indexed queries (case, punctuation, plural and
+  filler-word changes) - these should hit
+* the held-out queries - a hit here is a *false* hit on an unseen question
+
+Usage: python benchmarks/semantic_cache_bench.py --csv ~/Downloads/OTI-Complete.csv
+"""
+import argparse
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vertexchat.semantic_cache import SemanticCache
+
+SAMPLE_QUERIES = [
+    "how about dry cleaner",
+    "how do I renew my permit",
+    "how do I cancel my permit",
+    "what are the library hours",
+    "where can I pay a parking ticket",
+    "how do I report a noise complaint",
+    "when is bulk trash pickup",
+    "how do I apply for a business license",
+    "what documents do I need for a marriage license",
+    "how do I dispute a property tax assessment",
+    "where is the nearest cooling center",
+    "how do I get a copy of a birth certificate",
+]
+
+
+def paraphrase(query: str, rng: random.Random) -> str:
+    variants = [
+        lambda q: q.upper(),
+        lambda q: q + "?",
+        lambda q: re.sub(r"\b(\w{4,})\b", lambda m: m.group(1) + "s", q, count=1),
+        lambda q: re.sub(r"^how", "what about how", q),
+        lambda q: "  ".join(q.split()) + " please",
+    ]
+    return rng.choice(variants)(query)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", help="eval CSV with a Query column (built-in sample queries if omitted)")
+    parser.add_argument("--threshold", type=float, nargs="+", default=[0.8, 0.85, 0.9, 0.95])
+    parser.add_argument("--indexed-fraction", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    queries = pd.read_csv(args.csv)["Query"].dropna().astype(str).tolist() if args.csv else SAMPLE_QUERIES
+    queries = list(dict.fromkeys(queries))
+    rng = random.Random(args.seed)
+    rng.shuffle(queries)
+    split = max(1, int(len(queries) * args.indexed_fraction))
+    indexed, held_out = queries[:split], queries[split:]
+    paraphrases = [paraphrase(q, rng) for q in indexed]
+    print(f"{len(indexed)} indexed, {len(paraphrases)} paraphrase lookups, {len(held_out)} held-out lookups")
+
+    print(f"{'threshold':>9} {'insert us':>9} {'p50 us':>7} {'p99 us':>7} {'paraphrase hit':>14} {'false hit':>9}")
+    for threshold in args.threshold:
+        cache = SemanticCache(threshold=threshold)
+        start = time.perf_counter()
+        for q in indexed:
+            cache.set("bench", q, q)
+        insert_us = (time.perf_counter() - start) / len(indexed) * 1e6
+
+        latencies = []
+        correct = 0
+        for original, q in zip(indexed, paraphrases):
+            start = time.perf_counter()
+            match = cache.get("bench", q)
+            latencies.append((time.perf_counter() - start) * 1e6)
+            correct += match is not None and match[0] == original
+        false_hits = 0
+        for q in held_out:
+            start = time.perf_counter()
+            false_hits += cache.get("bench", q) is not None
+            latencies.append((time.perf_counter() - start) * 1e6)
+        print(
+            f"{threshold:>9.2f} {insert_us:>9.1f} {statistics.median(latencies):>7.1f} {percentile(latencies, 0.99):>7.1f}"
+            f" {correct / len(paraphrases):>14.1%} {false_hits / max(1, len(held_out)):>9.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
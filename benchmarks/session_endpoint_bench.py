@@ -0,0 +1,136 @@
+"""Latency of creating Answers API sessions: per-call refresh + requests.post vs TokenCache + pooled httpx.
+
+Runs against a local HTTPS stand-in for the ``/sessions`` endpoint (self-signed
+certificate generated with the ``openssl`` CLI) and fake credentials whose
+``refresh`` takes ``--refresh-ms``, so the numbers isolate token refresh and
+connection setup from server time.
+
+Usage: python benchmarks/session_endpoint_bench.py --calls 200 --refresh-ms 80
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vertexchat.auth import TokenCache
+from vertexchat.rest import create_session
+
+
+class SessionsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Avoid Nagle/delayed-ACK stalls on the header+body writes
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"name": "projects/p/locations/global/collections/default_collection/dataStores/d/sessions/1"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeCredentials:
+    def __init__(self, refresh_s: float):
+        self.refresh_s = refresh_s
+        self.token = None
+        self.expiry = None
+
+    def refresh(self, request):
+        time.sleep(self.refresh_s)
+        self.token = "fake-token"
+        self.expiry = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + datetime.timedelta(hours=1)
+
+
+def start_server(tmp: Path) -> str:
+    cert, key = tmp / "cert.pem", tmp / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", str(key), "-out", str(cert),
+         "-days", "1", "-subj", "/CN=localhost"],
+        check=True, capture_output=True,
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SessionsHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    # Handshake in the handler thread, not serially in accept()
+    server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"https://127.0.0.1:{server.server_address[1]}/v1beta"
+
+
+def before(base_url: str, credentials: FakeCredentials) -> str:
+    # The old set_session_variables(): refresh every call, new connection every call
+    credentials.refresh(None)
+    url = f"{base_url}/projects/p/locations/global/collections/default_collection/dataStores/d/sessions"
+    headers = {"Authorization": f"Bearer {credentials.token}", "Content-Type": "application/json"}
+    return requests.post(url, headers=headers, json={"userPseudoId": ""}, verify=False).json()["name"]
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{label:<28} mean {statistics.mean(latencies) * 1e3:7.2f} ms  p50 {statistics.median(latencies) * 1e3:7.2f} ms  p95 {p95 * 1e3:7.2f} ms")
+
+
+async def run_after(base_url, refresh_s, calls, concurrency):
+    token_cache = TokenCache(FakeCredentials(refresh_s))
+    latencies = []
+    async with httpx.AsyncClient(verify=False) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                await create_session(token_cache, "p", "d", base_url=base_url, client=client)
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one() for _ in range(calls)))
+    return latencies, token_cache.refreshes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--refresh-ms", type=float, default=80)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+    refresh_s = args.refresh_ms / 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_url = start_server(Path(tmp))
+        credentials = FakeCredentials(refresh_s)
+        latencies = []
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            before(base_url, credentials)
+            latencies.append(time.perf_counter() - start)
+        report("before (sequential)", latencies)
+
+        latencies, refreshes = asyncio.run(run_after(base_url, refresh_s, args.calls, 1))
+        report("after (sequential)", latencies)
+        latencies, refreshes = asyncio.run(run_after(base_url, refresh_s, args.calls, args.concurrency))
+        report(f"after (concurrency {args.concurrency})", latencies)
+        print(f"token refreshes with {args.concurrency} concurrent callers: {refreshes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Load test for the Answers UI session store: isolation and per-session memory.
+
+Simulates ``--users`` concurrent Chainlit sessions, each sending ``--turns``
+messages through the same get-or-create logic as ``on_message`` against a fake
+session factory and a fake ``answer_query`` that records which user each
+session served. Then measures store memory (tracemalloc) at increasing user
+counts to show bytes per session stays flat.
+
+Usage: python benchmarks/session_store_load.py --users 10000 --turns 3
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import sys
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from vertexchat.pool import WarmPool
+from vertexchat.session_store import SessionStore
+
+PREFIX = "projects/my-project/locations/global/collections/default_collection/dataStores/my-data-store/sessions/"
+
+
+async def run_isolation(users: int, turns: int) -> None:
+    counter = itertools.count(10**15)
+
+    async def create_session():
+        await asyncio.sleep(random.uniform(0, 0.01))
+        return f"{PREFIX}{next(counter)}"
+
+    store = SessionStore(max_sessions=users, session_prefix=PREFIX)
+    pool = WarmPool(create_session, size=64)
+    served = defaultdict(set)
+    used = defaultdict(set)
+
+    async def answer_query(session, user):
+        await asyncio.sleep(random.uniform(0, 0.005))
+        served[session].add(user)
+
+    async def user_session(user):
+        # Users arrive over a one-second burst
+        await asyncio.sleep(random.uniform(0, 1))
+        session = pool.take_nowait()
+        if session is not None:
+            store.put(user, session)
+        for _ in range(turns):
+            # Same get-or-create path as on_message
+            record = store.get(user)
+            if record is None:
+                record = store.put(user, await pool.get())
+            name = store.session_name(record)
+            used[user].add(name)
+            record.turns += 1
+            await answer_query(name, user)
+
+    await asyncio.gather(*(user_session(f"user-{i}") for i in range(users)))
+    shared = sum(1 for users_of in served.values() if len(users_of) > 1)
+    switched = sum(1 for sessions in used.values() if len(sessions) > 1)
+    print(f"{users} users x {turns} turns: {len(served)} sessions, {shared} shared between users, "
+          f"{switched} users switched session, {pool.served_warm} warm / {pool.served_cold} cold")
+
+
+def measure_memory(counts):
+    print(f"{'sessions':>8} {'store bytes':>12} {'bytes/session':>14}")
+    for count in counts:
+        names = [f"{PREFIX}{10**15 + i}" for i in range(count)]
+        keys = [f"chainlit-{i:032x}" for i in range(count)]
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        store = SessionStore(max_sessions=count, session_prefix=PREFIX)
+        for key, name in zip(keys, names):
+            store.put(key, name)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        # Names and keys exist before the store does; only the store's own allocations count
+        size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        print(f"{count:>8} {size:>12} {size / count:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run_isolation(args.users, args.turns))
+    measure_memory([args.users // 10, args.users // 2, args.users])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Per-message overhead of tracing the chat handlers.
+
+Runs an ``on_message``-shaped coroutine with a nested traced call, a
+``cl.Message``-like argument and a proto response, many times in a row. The
+handler does no I/O, so the time per call is the decorator's overhead. Modes:
+
+* ``none``              - undecorated
+* ``off``               - ``vertexchat.tracing`` with tracing off (the default without an API key)
+* ``local@RATE``        - head-sampled at RATE, spans to a local JSON lines file
+* ``sqlite@1.0``        - every call, spans to a local SQLite file
+* ``langsmith-full``    - ``langsmith.run_helpers.traceable`` as the apps used it:
+  every call, full payloads. Runs are uploaded to a local stub server that
+  accepts everything, so the cost includes serialization and the upload
+  thread but no network.
+* ``langsmith@0.1``     - ``vertexchat.tracing`` sending 10% of traces to the same stub
+
+    python benchmarks/tracing_overhead_bench.py --calls 20000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.cloud import discoveryengine_v1beta as discoveryengine
+
+from vertexchat import tracing
+
+
+class Message:
+    """Stands in for ``cl.Message``: the handler argument LangSmith would serialize."""
+
+    def __init__(self, content: str):
+        self.content = content
+        self.id = "message-id"
+        self.elements = []
+
+
+def make_response() -> discoveryengine.AnswerQueryResponse:
+    answer = discoveryengine.Answer(answer_text="Permits are renewed online. " * 60)
+    for i in range(10):
+        answer.references.append(discoveryengine.Answer.Reference(
+            chunk_info=discoveryengine.Answer.Reference.ChunkInfo(content="Relevant passage text. " * 40, relevance_score=0.5)
+        ))
+    return discoveryengine.AnswerQueryResponse(answer=answer)
+
+
+def build_handler(decorate):
+    @decorate(run_type="chain")
+    def render(response):
+        return response.answer.answer_text[:1500]
+
+    @decorate(run_type="llm")
+    async def on_message(message):
+        return render(RESPONSE) + message.content[:10]
+
+    return on_message
+
+
+RESPONSE = make_response()
+
+
+async def time_calls(handler, calls: int) -> float:
+    message = Message("How do I renew a business permit for a food truck? " * 20)
+    for _ in range(min(500, calls)):
+        await handler(message)
+    start = time.perf_counter()
+    for _ in range(calls):
+        await handler(message)
+    return (time.perf_counter() - start) / calls
+
+
+def local_tracer(path: str, rate: float) -> tracing.Tracer:
+    return tracing.Tracer("local", sample_rate=rate, sink=tracing.LocalSink(path))
+
+
+class AcceptAll(BaseHTTPRequestHandler):
+    def _ok(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    do_GET = do_POST = do_PATCH = _ok
+
+    def log_message(self, *args):
+        pass
+
+
+def langsmith_decorator():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AcceptAll)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.update({
+        "LANGCHAIN_TRACING_V2": "true",
+        "LANGCHAIN_API_KEY": "bench",
+        "LANGCHAIN_ENDPOINT": f"http://127.0.0.1:{server.server_port}",
+        "LANGCHAIN_PROJECT": "bench",
+    })
+    logging.getLogger("langsmith").setLevel(logging.CRITICAL)
+    from langsmith.run_helpers import traceable
+
+    return traceable
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--rates", default="0.01,0.1,1.0", help="sample rates for the local sink")
+    parser.add_argument("--no-langsmith", dest="langsmith", action="store_false")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    modes = [
+        ("none", lambda **kw: (lambda f: f)),
+        ("off", tracing.Tracer("off").trace),
+    ]
+    for rate in (float(r) for r in args.rates.split(",")):
+        modes.append((f"local@{rate:g}", local_tracer(os.path.join(tmp, f"traces-{rate:g}.jsonl"), rate).trace))
+    modes.append(("sqlite@1.0", local_tracer(os.path.join(tmp, "traces.sqlite"), 1.0).trace))
+    if args.langsmith:
+        modes.append(("langsmith-full", langsmith_decorator()))
+        modes.append(("langsmith@0.1", tracing.Tracer("langsmith", 0.1, sink=tracing.LangSmithSink()).trace))
+
+    baseline = None
+    print(f"{'mode':<16} {'per call':>10} {'overhead':>10}")
+    for name, decorate in modes:
+        per_call = asyncio.run(time_calls(build_handler(decorate), args.calls))
+        baseline = per_call if baseline is None else baseline
+        print(f"{name:<16} {per_call * 1e6:>8.1f}us {(per_call - baseline) * 1e6:>8.1f}us")
+    for name, decorate in modes:
+        sink = getattr(getattr(decorate, "__self__", None), "sink", None)
+        if sink is not None:
+            sink.close()
+    for path in sorted(os.listdir(tmp)):
+        print(f"{path}: {os.path.getsize(os.path.join(tmp, path))} bytes")
+
+
+if __name__ == "__main__":
+    main()
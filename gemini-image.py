@@ -1,45 +1,89 @@
+import os
 import vertexai
 from vertexai.generative_models import GenerativeModel, Part, Image
 import chainlit as cl
 import base64
 from pathlib import Path
 import textwrap
+from vertexchat.attachments import AttachmentCache, prepare_attachments
+from vertexchat.preprocess import ReduceOptions
+from vertexchat.context_cache import context_cache_from_env
+from vertexchat.gemini import generative_model, stream_reply
+from vertexchat.history import ChatHistory
+from vertexchat.limiter import busy_on_overload
+from vertexchat.metrics import StageMetrics, serve_metrics
 
 
 project_id = ""
 
-vertexai.init(project=project_id, location="us-central1")
-model = GenerativeModel(model_name="gemini-1.5-pro-001")
-chat = model.start_chat(history=[])
+# Run as `python gemini-image.py`, this script is __main__, and each worker of the attachment
+# process pool re-imports it as __mp_main__. The workers only preprocess files, so they skip
+# the app's setup: vertexai.init, the metrics server and the rest.
+if __name__ != "__mp_main__":
+    vertexai.init(project=project_id, location="us-central1")
+    model = generative_model("gemini-1.5-pro-001")
+    # Attached documents are uploaded once and referenced by handle (CONTEXT_CACHE=vertex)
+    context_cache = context_cache_from_env("gemini-1.5-pro-001")
+    metrics = StageMetrics("gemini-image")
+    serve_metrics()
+    # Identical uploads share one prepared Part instead of being re-read per message
+    attachment_cache = AttachmentCache.from_env()
+    # "text" sends the text layer of PDFs that have one instead of the whole file
+    attachment_pdf_mode = os.environ.get("ATTACHMENT_PDF_MODE", "inline")
+    # Photos and scans are downscaled/recompressed before upload; None when ATTACHMENT_REDUCE=false
+    attachment_reduce = ReduceOptions.from_env()
+
+@cl.on_chat_end
+async def on_chat_end():
+    history = cl.user_session.get("history")
+    if history is not None:
+        await history.close()
 
 @cl.on_message
+@busy_on_overload
 async def main(message: cl.Message):
     # cookie_picture = {
     #     'mime_type': 'image/png',
     #     'data': pathlib.Path('OTI-MyCity-Dev1/cookie.png').read_bytes()
     # }
-    
-    try:
-        pdf_file_path = Path(message.elements[0].path)
-        with open(pdf_file_path, "rb") as f:
-            pdf_bytes = f.read()
-            pdf_file = Part.from_data(pdf_bytes,mime_type= "application/pdf")
-            prompt = message.content
-            response = chat.send_message(content=[prompt, pdf_file])
-        #await cl.Message(content=response.text).send()
-        msg = cl.Message(content="")
-        for token in response.text:
-            await msg.stream_token(token)
-        await msg.send()
-    except:
-        response = chat.send_message(content=[message.content])
-        #await cl.Message(content=response.text).send()
+
+    with metrics.message():
+        with metrics.stage("request_build"):
+            content = [message.content]
+            if message.elements:
+                # Every attached file, of any supported type, preprocessed in parallel
+                parts, infos, errors = await prepare_attachments(
+                    message.elements, attachment_cache, attachment_pdf_mode, attachment_reduce
+                )
+                content.extend(parts)
+                for info in infos:
+                    metrics.observe("attachment_preprocess", info.seconds)
+                if errors:
+                    await cl.Message(
+                        content="I couldn't use some of your files:\n" + "\n".join(f"- {error}" for error in errors)
+                    ).send()
+            # Each session has its own bounded history instead of one chat shared by every user
+            history = cl.user_session.get("history")
+            if history is None:
+                history = ChatHistory.from_env(model, context_cache=context_cache)
+                cl.user_session.set("history", history)
+            content = await history.attach(content)
+            chat = history.start_chat()
+        # Stream the reply chunk by chunk as Gemini generates it
         msg = cl.Message(content="")
-        for token in response.text:
-            await msg.stream_token(token)
-        await msg.send()
+        with metrics.stage("rpc"):
+            timings = await stream_reply(chat, content, msg)
+        history.record(content, msg.content)
+        if timings["ttft_s"] is not None:
+            metrics.observe("first_token", timings["ttft_s"])
+        ttft = cl.user_session.get("ttft_s") or []
+        ttft.append(timings["ttft_s"])
+        cl.user_session.set("ttft_s", ttft)
+        with metrics.stage("send"):
+            await msg.send()
 
 
 if __name__ == "__main__":
     from chainlit.cli import run_chainlit
-    run_chainlit(__file__)
\ No newline at end of file
+
+    run_chainlit(__file__)
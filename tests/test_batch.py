@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+from google.api_core import exceptions as core_exceptions
+
+from vertexchat.batch import Checkpoint, run_batch
+from vertexchat.limiter import Overloaded
+
+
+def rows(n):
+    return [(key, f"query {key}") for key in range(n)]
+
+
+def test_resume_runs_only_unfinished_rows(tmp_path):
+    checkpoint_path = tmp_path / "run.checkpoint.jsonl"
+    calls = []
+
+    async def flaky(item):
+        calls.append(item)
+        if item == "query 3":
+            raise ValueError("bad row")
+        return {"answer": item.upper()}
+
+    first = asyncio.run(run_batch(rows(5), flaky, concurrency=2, checkpoint=Checkpoint(checkpoint_path)))
+    assert first[3]["error"] == "ValueError('bad row')"
+    assert len(checkpoint_path.read_text().splitlines()) == 5
+
+    calls.clear()
+
+    async def fixed(item):
+        calls.append(item)
+        return {"answer": item.upper()}
+
+    second = asyncio.run(run_batch(rows(5), fixed, concurrency=2, checkpoint=Checkpoint(checkpoint_path)))
+    assert calls == ["query 3"]
+    assert sorted(second) == [0, 1, 2, 3, 4]
+    assert all("error" not in record for record in second.values())
+    assert Checkpoint(checkpoint_path).completed_keys() == {0, 1, 2, 3, 4}
+
+
+def test_retryable_errors_are_retried(tmp_path):
+    attempts = {}
+
+    async def worker(item):
+        attempts[item] = attempts.get(item, 0) + 1
+        if attempts[item] == 1:
+            raise core_exceptions.ServiceUnavailable("try again")
+        if attempts[item] == 2:
+            raise Overloaded("discoveryengine", "queue_full")
+        return {"answer": item}
+
+    results = asyncio.run(run_batch(rows(3), worker, backoff_base=0, checkpoint=Checkpoint(tmp_path / "c.jsonl")))
+    assert [results[key]["attempts"] for key in range(3)] == [3, 3, 3]
+
+
+def test_gives_up_after_max_attempts():
+    async def worker(item):
+        raise core_exceptions.TooManyRequests("quota")
+
+    results = asyncio.run(run_batch(rows(1), worker, max_attempts=2, backoff_base=0))
+    assert results[0]["attempts"] == 2
+    assert "TooManyRequests" in results[0]["error"]
+
+
+def test_collect_false_returns_only_failures(tmp_path):
+    checkpoint_path = tmp_path / "c.jsonl"
+
+    async def worker(item):
+        if item == "query 1":
+            raise ValueError("bad row")
+        return {"answer": item}
+
+    failed = asyncio.run(run_batch(rows(4), worker, checkpoint=Checkpoint(checkpoint_path), collect=False))
+    assert list(failed) == [1]
+    assert Checkpoint(checkpoint_path).completed_keys() == {0, 2, 3}
+
+
+def test_torn_final_line_is_ignored(tmp_path):
+    checkpoint_path = tmp_path / "c.jsonl"
+    checkpoint_path.write_text(json.dumps({"key": 0, "answer": "a"}) + "\n" + '{"key": 1, "ans')
+    checkpoint = Checkpoint(checkpoint_path)
+    assert list(checkpoint.load()) == [0]
+    assert checkpoint.completed_keys() == {0}
+
+
+def test_failing_input_stops_workers_before_closing_checkpoint(tmp_path):
+    checkpoint_path = tmp_path / "c.jsonl"
+
+    def items():
+        yield from rows(8)
+        raise OSError("input went away")
+
+    async def worker(item):
+        await asyncio.sleep(0.01)
+        return {"answer": item}
+
+    with pytest.raises(OSError):
+        asyncio.run(run_batch(items(), worker, concurrency=4, checkpoint=Checkpoint(checkpoint_path)))
+    # Every line that made it to disk is whole, and a resume finishes the rest
+    lines = checkpoint_path.read_text().splitlines() if checkpoint_path.exists() else []
+    done = [json.loads(line)["key"] for line in lines]
+    results = asyncio.run(run_batch(rows(8), worker, concurrency=4, checkpoint=Checkpoint(checkpoint_path)))
+    assert sorted(results) == list(range(8))
+    assert len(checkpoint_path.read_text().splitlines()) == 8
+    assert len(done) == len(set(done))
@@ -0,0 +1,235 @@
+import asyncio
+
+from vertexchat.cache import AnswerCache, TurnRecorder, cache_key, normalize_query
+from vertexchat.semantic_cache import SemanticCache
+
+SERVING_CONFIG = "projects/p/locations/global/collections/default_collection/dataStores/d/servingConfigs/default_config"
+
+
+class Text:
+    """Stands in for a proto-plus response class in the SQLite tier."""
+
+    @staticmethod
+    def serialize(value):
+        return value.encode("utf-8")
+
+    @staticmethod
+    def deserialize(payload):
+        return payload.decode("utf-8")
+
+
+class Backend:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = []
+        self.records = []
+
+    def call(self, query, fail=False):
+        async def answer():
+            self.calls.append(query)
+            await asyncio.sleep(self.latency)
+            if fail:
+                raise RuntimeError("backend down")
+            return f"answer to {query}"
+        return answer
+
+    async def record(self, session, value):
+        self.records.append((session, value))
+
+
+def test_normalize_query_folds_trivial_variants():
+    assert normalize_query("  How do I  renew my Permit?? ") == "how do i renew my permit"
+    assert cache_key("Renew permit?", SERVING_CONFIG) == cache_key("renew  permit", SERVING_CONFIG)
+    assert cache_key("renew permit", SERVING_CONFIG) != cache_key("renew permit", SERVING_CONFIG, "other-model")
+
+
+def test_memory_hit_and_ttl_expiry():
+    async def scenario():
+        backend = Backend()
+        cache = AnswerCache(ttl=0.05)
+        assert await cache.get_or_call(backend.call("q"), "q", SERVING_CONFIG) == "answer to q"
+        assert await cache.get_or_call(backend.call("q"), "Q?", SERVING_CONFIG) == "answer to q"
+        assert len(backend.calls) == 1
+        await asyncio.sleep(0.1)
+        await cache.get_or_call(backend.call("q"), "q", SERVING_CONFIG)
+        assert len(backend.calls) == 2
+        assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_tier_survives_a_restart_and_expires(tmp_path):
+    path = str(tmp_path / "answers.db")
+
+    async def scenario():
+        backend = Backend()
+        first = AnswerCache(sqlite_path=path, response_type=Text, ttl=60)
+        await first.get_or_call(backend.call("q"), "q", SERVING_CONFIG)
+        second = AnswerCache(sqlite_path=path, response_type=Text, ttl=60)
+        assert await second.get_or_call(backend.call("q"), "q", SERVING_CONFIG) == "answer to q"
+        assert len(backend.calls) == 1
+        assert second.stats()["persistent_hits"] == 1
+
+        expiring = AnswerCache(sqlite_path=path, response_type=Text, ttl=0.05)
+        await expiring.get_or_call(backend.call("other"), "other", SERVING_CONFIG)
+        await asyncio.sleep(0.1)
+        assert AnswerCache(sqlite_path=path, response_type=Text).get(cache_key("other", SERVING_CONFIG)) is None
+
+    asyncio.run(scenario())
+
+
+def test_bypass_always_calls():
+    async def scenario():
+        backend = Backend()
+        cache = AnswerCache()
+        await cache.get_or_call(backend.call("q"), "q", SERVING_CONFIG)
+        await cache.get_or_call(backend.call("q"), "q", SERVING_CONFIG, bypass=True)
+        assert len(backend.calls) == 2
+        assert cache.stats()["bypassed"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_identical_misses_share_one_call():
+    async def scenario():
+        backend = Backend(latency=0.05)
+        cache = AnswerCache()
+        results = await asyncio.gather(*(
+            cache.get_or_call(
+                backend.call(f"q {i}"), "same question?" if i % 2 else "Same question", SERVING_CONFIG,
+                session=f"session-{i}", record=lambda value, i=i: backend.record(f"session-{i}", value),
+            )
+            for i in range(10)
+        ))
+        assert len(backend.calls) == 1
+        assert len(set(results)) == 1
+        for i in range(10):
+            await cache.recorder.wait(f"session-{i}")
+        # Every waiter's session gets the shared answer; the leader's call already went to its own
+        assert len(backend.records) == 9
+        assert {value for _, value in backend.records} == set(results)
+        stats = cache.stats()
+        assert stats["misses"] == 1 and stats["coalesced"] == 9 and stats["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_coalesced_error_reaches_every_waiter_and_is_not_cached():
+    async def scenario():
+        backend = Backend(latency=0.02)
+        cache = AnswerCache()
+        results = await asyncio.gather(
+            *(cache.get_or_call(backend.call("q", fail=True), "q", SERVING_CONFIG) for _ in range(3)),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert len(backend.calls) == 1
+        assert await cache.get_or_call(backend.call("q"), "q", SERVING_CONFIG) == "answer to q"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_leader_does_not_cancel_the_shared_call():
+    async def scenario():
+        backend = Backend(latency=0.05)
+        cache = AnswerCache()
+        leader = asyncio.ensure_future(cache.get_or_call(backend.call("q"), "q", SERVING_CONFIG))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_call(backend.call("q"), "q", SERVING_CONFIG))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await waiter == "answer to q"
+        assert len(backend.calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_hit_is_recorded_in_the_background_before_the_next_turn():
+    async def scenario():
+        order = []
+        cache = AnswerCache()
+        await cache.get_or_call(Backend().call("q"), "q", SERVING_CONFIG)
+
+        async def record(value):
+            await asyncio.sleep(0.05)
+            order.append(("record", value))
+
+        async def follow_up():
+            order.append(("follow-up", None))
+            return "follow-up answer"
+
+        assert await cache.get_or_call(None, "q", SERVING_CONFIG, session="s", record=record) == "answer to q"
+        assert order == []
+        await cache.get_or_call(follow_up, "and then?", SERVING_CONFIG, bypass=True, session="s")
+        assert order == [("record", "answer to q"), ("follow-up", None)]
+
+    asyncio.run(scenario())
+
+
+def test_record_hits_false_skips_recording():
+    async def scenario():
+        backend = Backend()
+        cache = AnswerCache(record_hits=False)
+        await cache.get_or_call(backend.call("q"), "q", SERVING_CONFIG)
+        await cache.get_or_call(backend.call("q"), "q", SERVING_CONFIG, session="s",
+                                record=lambda value: backend.record("s", value))
+        assert len(cache.recorder) == 0 and backend.records == []
+
+    asyncio.run(scenario())
+
+
+def test_turn_recorder_keeps_order_and_counts_failures():
+    async def scenario():
+        recorder = TurnRecorder()
+        order = []
+
+        def turn(name, delay, fail=False):
+            async def call():
+                await asyncio.sleep(delay)
+                order.append(name)
+                if fail:
+                    raise RuntimeError(name)
+            return call
+
+        recorder.record("s", turn("first", 0.05, fail=True))
+        recorder.record("s", turn("second", 0.0))
+        recorder.record("other", turn("other", 0.0))
+        await recorder.wait("s")
+        await recorder.wait("other")
+        assert order.index("first") < order.index("second")
+        assert (recorder.recorded, recorder.failed, len(recorder)) == (2, 1, 0)
+
+    asyncio.run(scenario())
+
+
+def test_semantic_hit_expires_with_the_ttl_and_is_not_copied_to_the_exact_tier():
+    async def scenario():
+        backend = Backend()
+        cache = AnswerCache(ttl=0.1, semantic=SemanticCache(threshold=0.8, ttl=0.1))
+        await cache.get_or_call(backend.call("a"), "how do I renew my parking permit", SERVING_CONFIG)
+        value = await cache.get_or_call(backend.call("b"), "how can I renew my parking permit", SERVING_CONFIG)
+        assert value == "answer to a"
+        assert cache.stats()["semantic_hits"] == 1
+        assert cache.stats()["memory_entries"] == 1
+        await asyncio.sleep(0.15)
+        await cache.get_or_call(backend.call("c"), "how can I renew my parking permit", SERVING_CONFIG)
+        assert backend.calls == ["a", "c"]
+
+    asyncio.run(scenario())
+
+
+def test_semantic_index_replaces_a_repeated_query():
+    semantic = SemanticCache(threshold=0.8)
+    semantic.set("ns", "Renew permit?", "old")
+    semantic.set("ns", "renew  permit", "new")
+    assert len(semantic._indexes["ns"]) == 1
+    assert semantic.get("ns", "renew permit")[0] == "new"
+    assert semantic.get("other", "renew permit") is None
+
+
+def test_from_env_can_disable_the_cache(monkeypatch):
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "false")
+    assert AnswerCache.from_env() is None
+    monkeypatch.setenv("ANSWER_CACHE_ENABLED", "true")
+    monkeypatch.setenv("ANSWER_CACHE_RECORD_HITS", "false")
+    assert AnswerCache.from_env().record_hits is False
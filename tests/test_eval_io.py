@@ -0,0 +1,69 @@
+import json
+
+import pandas as pd
+import pytest
+
+from vertexchat.eval_io import merge_results, parse_shard, read_rows, shard_path, shard_paths
+
+COLUMNS = {"Answer": "answer"}
+
+
+def write_jsonl(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    return path
+
+
+@pytest.fixture
+def queries(tmp_path):
+    path = tmp_path / "queries.csv"
+    pd.DataFrame({"Query": [f"q{i}" for i in range(6)]}).to_csv(path, index=False)
+    return path
+
+
+def test_parse_shard():
+    assert parse_shard("2/8") == (2, 8)
+    with pytest.raises(ValueError):
+        parse_shard("8/8")
+
+
+def test_read_rows_shards_by_row_index(queries):
+    assert list(read_rows(queries, "Query", chunksize=4, shard=(1, 3))) == [(1, "q1"), (4, "q4")]
+
+
+def test_shard_paths_finds_every_shard(tmp_path):
+    base = tmp_path / "out.checkpoint.jsonl"
+    assert shard_path(base, (0, 1)) == base
+    assert shard_path(base, (2, 8)).name == "out.shard2of8.checkpoint.jsonl"
+    assert shard_paths(base) == [base]
+    for index in range(2):
+        shard_path(base, (index, 2)).write_text("")
+    assert [path.name for path in shard_paths(base)] == ["out.shard0of2.checkpoint.jsonl", "out.shard1of2.checkpoint.jsonl"]
+    base.write_text("")
+    assert shard_paths(base)[0] == base
+
+
+def test_success_wins_over_error_in_either_order(tmp_path, queries):
+    errors = write_jsonl(tmp_path / "errors.jsonl", [{"key": 0, "error": "boom"}, {"key": 1, "error": "boom"}])
+    answers = write_jsonl(tmp_path / "answers.jsonl", [{"key": 0, "answer": "a0"}, {"key": 1, "answer": "a1"}])
+    for order in ([errors, answers], [answers, errors]):
+        output = tmp_path / "merged.csv"
+        counts = merge_results(queries, order, output, COLUMNS, chunksize=4)
+        assert counts == {"rows": 6, "answered": 2, "failed": 0, "missing": 4}
+        assert pd.read_csv(output)["Answer"].tolist()[:2] == ["a0", "a1"]
+
+
+def test_later_file_wins_between_successes_and_between_errors(tmp_path, queries):
+    first = write_jsonl(tmp_path / "first.jsonl", [{"key": 0, "answer": "old"}, {"key": 1, "error": "old"}])
+    second = write_jsonl(tmp_path / "second.jsonl", [{"key": 0, "answer": "new"}, {"key": 1, "error": "new"}])
+    output = tmp_path / "merged.parquet"
+    counts = merge_results(queries, [first, second], output, COLUMNS, chunksize=4)
+    assert counts == {"rows": 6, "answered": 1, "failed": 1, "missing": 4}
+    merged = pd.read_parquet(output)
+    assert merged["Answer"].tolist()[0] == "new"
+    assert merged["Answer"].isna().tolist() == [False, True, True, True, True, True]
+
+
+def test_missing_partial_is_skipped(tmp_path, queries):
+    counts = merge_results(queries, [tmp_path / "absent.jsonl"], tmp_path / "merged.csv", COLUMNS)
+    assert counts["missing"] == 6
+    assert not list(tmp_path.glob("*.partial"))
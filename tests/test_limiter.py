@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions as core_exceptions
+
+from vertexchat.limiter import AdaptiveLimiter, Overloaded, is_overload
+
+
+def test_calls_beyond_the_limit_queue_in_order():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", initial=2, max_limit=2)
+        order = []
+
+        async def call(i):
+            async with limiter.slot():
+                order.append(i)
+                await asyncio.sleep(0.02)
+
+        tasks = [asyncio.ensure_future(call(i)) for i in range(5)]
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 2 and limiter.queue_depth == 3
+        await asyncio.gather(*tasks)
+        assert order == [0, 1, 2, 3, 4]
+        assert limiter.stats()["in_flight"] == 0 and limiter.stats()["admitted"] == 5
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_and_queue_timeout_are_rejected():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", initial=1, max_queue=1, queue_timeout=0.05)
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as rejected:
+            await limiter.acquire()
+        assert rejected.value.reason == "queue_full"
+        with pytest.raises(Overloaded) as timed_out:
+            await waiting
+        assert timed_out.value.reason == "queue_timeout"
+        assert limiter.rejected == 2 and limiter.queue_depth == 0
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_overload_halves_the_limit_once_per_cooldown():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", initial=16, cooldown=60)
+        for _ in range(3):
+            await limiter.acquire()
+        for _ in range(3):
+            limiter.release(core_exceptions.TooManyRequests("quota"))
+        assert limiter.limit == 8 and limiter.overloads == 1
+        await limiter.acquire()
+        limiter.release(ValueError("not an overload"))
+        assert limiter.limit == 8 and limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_limit_grows_only_while_in_use():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", initial=4)
+        await limiter.acquire()
+        limiter.release()
+        assert limiter.limit == 4
+        for _ in range(4):
+            await limiter.acquire()
+        limiter.release()
+        assert limiter.limit == pytest.approx(4.25)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", initial=1)
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        # The slot is granted and the waiter cancelled in the same loop iteration
+        limiter.release()
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert limiter.in_flight == 0 and limiter.queue_depth == 0
+
+    asyncio.run(scenario())
+
+
+def test_stream_holds_its_slot_until_drained():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", initial=1)
+
+        async def responses():
+            for i in range(3):
+                yield i
+
+        async def open_stream():
+            return responses()
+
+        stream = await limiter.stream(open_stream)
+        assert limiter.in_flight == 1
+        assert [item async for item in stream] == [0, 1, 2]
+        assert limiter.in_flight == 0
+
+        async def refused():
+            raise core_exceptions.ResourceExhausted("quota")
+
+        with pytest.raises(core_exceptions.ResourceExhausted):
+            await limiter.stream(refused)
+        assert limiter.in_flight == 0 and limiter.overloads == 1
+
+    asyncio.run(scenario())
+
+
+def test_is_overload_recognises_rest_status_codes():
+    class Response:
+        status_code = 429
+
+    class HTTPError(Exception):
+        response = Response()
+
+    assert is_overload(HTTPError())
+    assert is_overload(core_exceptions.ServiceUnavailable("busy"))
+    assert not is_overload(core_exceptions.InvalidArgument("bad"))
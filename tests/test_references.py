@@ -0,0 +1,83 @@
+from google.cloud import discoveryengine_v1beta as discoveryengine
+
+from vertexchat.references import (
+    answer_references,
+    link_citations,
+    parse_external_link,
+    references_block,
+    render_answer,
+    render_search_results,
+    render_summary,
+)
+
+Answer = discoveryengine.Answer
+SearchResponse = discoveryengine.SearchResponse
+
+
+def test_parse_external_link():
+    assert parse_external_link("gs://bucket/dir/file.pdf") == "https://storage.cloud.google.com/bucket/dir/file.pdf"
+    assert parse_external_link("https://example.com/gs://x") == "https://example.com/gs://x"
+
+
+def test_link_citations_resolves_single_and_grouped_markers():
+    urls = ["https://a", "", "https://c"]
+    text = "One [1]. Both [1, 3]. Missing [2] and [9]."
+    assert link_citations(text, urls) == (
+        "One [1](https://a). Both [1](https://a), [3](https://c). Missing [2] and [9]."
+    )
+    assert link_citations(text, []) == text
+
+
+def test_references_block_skips_repeats_but_keeps_positions():
+    references = [("A", "https://a"), ("A again", "https://a"), ("None", None), ("C", "https://c")]
+    assert references_block(references, numbered=True) == (
+        "\n References:\n [[1] A](https://a)\n [[4] C](https://c)"
+    )
+    assert references_block(references) == "\n References:\n [A](https://a)\n [C](https://c)"
+    assert references_block([]) == ""
+
+
+def test_render_summary_links_to_summary_references():
+    summary = SearchResponse.Summary(
+        summary_text="Renew online [1].",
+        summary_with_metadata=SearchResponse.Summary.SummaryWithMetadata(
+            references=[SearchResponse.Summary.Reference(uri="gs://docs/permits.pdf")]
+        ),
+    )
+    assert render_summary(summary) == "Renew online [1](https://storage.cloud.google.com/docs/permits.pdf)."
+
+
+def test_render_search_results_lists_the_top_results():
+    results = [
+        SearchResponse.SearchResult(document=discoveryengine.Document(
+            derived_struct_data={"title": f"Doc {i}", "link": f"gs://docs/{i}.pdf"}
+        ))
+        for i in range(7)
+    ]
+    rendered = render_search_results("Summary", results, limit=2)
+    assert rendered == (
+        "Summary\n References:"
+        "\n [[1] Doc 0](https://storage.cloud.google.com/docs/0.pdf)"
+        "\n [[2] Doc 1](https://storage.cloud.google.com/docs/1.pdf)"
+    )
+
+
+def test_answer_references_follow_citations():
+    def reference(title, uri):
+        return Answer.Reference(chunk_info=Answer.Reference.ChunkInfo(
+            document_metadata=Answer.Reference.ChunkInfo.DocumentMetadata(title=title, uri=uri)
+        ))
+
+    def citation(*reference_ids):
+        return Answer.Citation(sources=[Answer.CitationSource(reference_id=str(i)) for i in reference_ids])
+
+    answer = Answer(
+        answer_text="Answer.",
+        references=[reference("First", "gs://docs/1.pdf"), reference("Second", "https://second")],
+        # Only each citation's first source is listed; out-of-range ids and repeats are dropped
+        citations=[citation(1, 0), citation(0), citation(5), citation(1)],
+    )
+    assert answer_references(answer) == (
+        "\n References:\n [Second](https://second)\n [First](https://storage.cloud.google.com/docs/1.pdf)"
+    )
+    assert render_answer(answer) == "Answer." + answer_references(answer)
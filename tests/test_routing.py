@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions as core_exceptions
+from google.cloud import discoveryengine_v1beta as discoveryengine
+
+from vertexchat import limiter
+from vertexchat.limiter import AdaptiveLimiter
+from vertexchat.routing import RoutedSearch
+
+SESSION = "projects/p/locations/global/collections/default_collection/dataStores/d/sessions/1"
+
+
+class FakeEndpoint:
+    """Stands in for one endpoint's ``ConversationalSearch``."""
+
+    def __init__(self, name: str, latency: float = 0.0, errors=()):
+        self.name = name
+        self.latency = latency
+        self.errors = list(errors)
+        self.calls = []
+
+    async def invoke(self, method, *args, **kwargs):
+        self.calls.append(method)
+        await asyncio.sleep(self.latency)
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.name
+
+    async def open_stream(self, request):
+        await asyncio.sleep(self.latency)
+        return iter([self.name])
+
+
+@pytest.fixture(autouse=True)
+def no_limiter(monkeypatch):
+    monkeypatch.setenv("BACKEND_LIMITER_ENABLED", "false")
+    monkeypatch.setattr(limiter, "_limiters", {})
+
+
+def router(*endpoints, **kwargs):
+    kwargs.setdefault("explore", 0)
+    kwargs.setdefault("min_samples", 5)
+    routed = RoutedSearch(discoveryengine, [endpoint.name for endpoint in endpoints], **kwargs)
+    routed.clients = {endpoint.name: endpoint for endpoint in endpoints}
+    return routed
+
+
+def prefill(routed, endpoint, seconds, count=20):
+    routed.stats[endpoint].latencies.extend([seconds] * count)
+
+
+def answer_request(session=""):
+    return discoveryengine.AnswerQueryRequest(query=discoveryengine.Query(text="q"), session=session)
+
+
+def test_ranks_unmeasured_then_by_median_and_skips_ejected():
+    routed = router(FakeEndpoint("a"), FakeEndpoint("b"), FakeEndpoint("c"))
+    prefill(routed, "a", 0.3)
+    prefill(routed, "b", 0.1)
+    assert [stats.endpoint for stats in routed.ranked()] == ["c", "b", "a"]
+    prefill(routed, "c", 0.2)
+    routed.stats["b"].ejected_until = float("inf")
+    assert [stats.endpoint for stats in routed.ranked()] == ["c", "a", "b"]
+
+
+@pytest.mark.parametrize("method, session, error, fails_over", [
+    ("answer_query", "", core_exceptions.DeadlineExceeded("slow"), True),
+    ("answer_query", SESSION, core_exceptions.DeadlineExceeded("slow"), False),
+    ("answer_query", SESSION, core_exceptions.ServiceUnavailable("down"), False),
+    ("answer_query", SESSION, core_exceptions.TooManyRequests("quota"), True),
+    ("converse_conversation", "", core_exceptions.InternalServerError("boom"), False),
+    ("create_conversation", "", core_exceptions.DeadlineExceeded("slow"), True),
+])
+def test_fails_over_only_when_repeating_is_safe(method, session, error, fails_over):
+    primary, secondary = FakeEndpoint("a", errors=[error]), FakeEndpoint("b")
+    routed = router(primary, secondary)
+    prefill(routed, "a", 0.1)
+    prefill(routed, "b", 0.2)
+    call = routed.call(method, request=answer_request(session))
+    if fails_over:
+        assert asyncio.run(call) == "b"
+        assert routed.failovers == 1
+    else:
+        with pytest.raises(type(error)):
+            asyncio.run(call)
+        assert secondary.calls == []
+    assert routed.stats["a"].errors == 1
+
+
+def test_non_retryable_errors_do_not_fail_over():
+    routed = router(FakeEndpoint("a", errors=[core_exceptions.InvalidArgument("bad")]), FakeEndpoint("b"))
+    with pytest.raises(core_exceptions.InvalidArgument):
+        asyncio.run(routed.answer_query(answer_request()))
+    assert routed.failovers == 0 and routed.stats["a"].errors == 0
+
+
+def test_repeated_failures_eject_an_endpoint():
+    errors = [core_exceptions.ServiceUnavailable("down")] * 2
+    routed = router(FakeEndpoint("a", errors=errors), FakeEndpoint("b"), eject_after=2)
+    prefill(routed, "a", 0.1)
+    prefill(routed, "b", 0.2)
+
+    async def scenario():
+        for _ in range(2):
+            assert await routed.answer_query(answer_request()) == "b"
+        return await routed.answer_query(answer_request())
+
+    assert asyncio.run(scenario()) == "b"
+    # Ejected after the second failure, so the third call went straight to b
+    assert routed.clients["a"].calls == ["answer_query"] * 2
+    assert routed.snapshot()["endpoints"]["a"]["healthy"] is False
+
+
+def test_slow_sessionless_call_is_hedged_to_the_runner_up():
+    primary, secondary = FakeEndpoint("a", latency=0.5), FakeEndpoint("b", latency=0.01)
+    routed = router(primary, secondary, hedge=True, hedge_budget=1, min_hedge_delay=0.01)
+    prefill(routed, "a", 0.02)
+    prefill(routed, "b", 0.03)
+    assert asyncio.run(routed.answer_query(answer_request())) == "b"
+    assert routed.hedges == 1 and routed.stats["b"].hedges_won == 1
+    # The cancelled primary still reports how long it had been running
+    assert routed.stats["a"].latencies[-1] >= 0.02
+
+
+def test_session_calls_and_spent_budget_are_not_hedged():
+    primary, secondary = FakeEndpoint("a", latency=0.1), FakeEndpoint("b")
+    routed = router(primary, secondary, hedge=True, hedge_budget=1, min_hedge_delay=0.01)
+    prefill(routed, "a", 0.02)
+    prefill(routed, "b", 0.03)
+    assert asyncio.run(routed.answer_query(answer_request(SESSION))) == "a"
+    assert routed.hedges == 0 and secondary.calls == []
+
+    routed.hedge_budget = 0
+    assert asyncio.run(routed.answer_query(answer_request())) == "a"
+    assert routed.hedges == 0
+
+
+def test_failover_runs_under_one_limiter_slot(monkeypatch):
+    shared = AdaptiveLimiter("discoveryengine", initial=1, max_limit=1)
+    monkeypatch.setattr(limiter, "_limiters", {"discoveryengine": shared})
+    routed = router(FakeEndpoint("a", errors=[core_exceptions.DeadlineExceeded("slow")]), FakeEndpoint("b"))
+    prefill(routed, "a", 0.1)
+    prefill(routed, "b", 0.2)
+    assert asyncio.run(asyncio.wait_for(routed.answer_query(answer_request()), 1)) == "b"
+    assert shared.admitted == 1 and shared.in_flight == 0
+
+
+def test_stream_open_is_kept_apart_from_unary_latency():
+    routed = router(FakeEndpoint("a", latency=0.01), FakeEndpoint("b"))
+    prefill(routed, "a", 0.1)
+    prefill(routed, "b", 0.2)
+    assert list(asyncio.run(routed.stream_answer_query(answer_request()))) == ["a"]
+    assert len(routed.stats["a"].stream_opens) == 1
+    assert len(routed.stats["a"].latencies) == 20
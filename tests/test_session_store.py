@@ -0,0 +1,41 @@
+from vertexchat.session_store import SessionStore
+
+PREFIX = "projects/p/locations/global/collections/default_collection/engines/e/sessions/"
+
+
+def test_keeps_only_the_id_after_the_prefix():
+    store = SessionStore(session_prefix=PREFIX)
+    record = store.put("user", PREFIX + "123")
+    assert record.session_id == "123"
+    assert store.session_name(record) == PREFIX + "123"
+    other = store.put("other", "projects/q/locations/us/sessions/9")
+    assert store.session_name(other) == "projects/q/locations/us/sessions/9"
+
+
+def test_evicts_least_recently_used_beyond_max_sessions():
+    store = SessionStore(max_sessions=2)
+    store.put("a", "1")
+    store.put("b", "2")
+    assert store.get("a") is not None
+    store.put("c", "3")
+    assert store.get("b") is None
+    assert store.get("a").session_id == "1" and store.get("c").session_id == "3"
+    assert len(store) == 2 and store.evicted == 1
+
+
+def test_evicts_idle_sessions():
+    store = SessionStore(idle_ttl=10)
+    store.put("a", "1").last_used -= 20
+    store.put("b", "2")
+    assert store.get("a") is None
+    store.get("b").last_used -= 20
+    assert store.evict_idle() == 1
+    assert len(store) == 0 and store.evicted == 2
+
+
+def test_pop_and_turns():
+    store = SessionStore()
+    store.put("a", "1").turns += 1
+    assert store.get("a").turns == 1
+    assert store.pop("a").session_id == "1"
+    assert store.pop("a") is None
@@ -0,0 +1,139 @@
+from google.cloud import discoveryengine_v1beta as discoveryengine_v1
+from dotenv import load_dotenv
+load_dotenv()
+import os
+import argparse
+import asyncio
+import itertools
+import logging
+from pathlib import Path
+from typing import NamedTuple
+from vertexchat.batch import Checkpoint, TokenBucket, run_batch
+from vertexchat.eval_io import read_rows
+from vertexchat.eval_report import format_summary, load_records, pick_fastest, summarize
+from vertexchat.request_templates import AnswerRequestTemplate
+from vertexchat.routing import search_client_from_env
+
+# Runs the eval query set through the Answers API once per combination of
+# model version, preamble and ignore_low_relevant_content, and reports latency
+# percentiles, error rate, answer length and citations per combination.
+#
+#   python vertex-answers-matrix-eval.py --input queries.csv \
+#       --model-version gemini-1.5-flash-001/answer_gen/v1 gemini-1.5-pro-001/answer_gen/v1 \
+#       --preamble default short=prompts/short.txt --ignore-low-relevant false true
+
+DEFAULT_PREAMBLE = "Given the conversation between a user and a helpful assistant and some search results, create a final answer for the assistant. Always respond back to the user in the same language as the user. The answer should use all relevant information from the search results, not introduce any additional information, and use exactly the same words as the search results when possible. The assistant's answer should be formatted as a bulleted list."
+
+parser = argparse.ArgumentParser(description="Benchmark the eval query set across Answers API configs")
+parser.add_argument("--input", default="~/Downloads/OTI-Complete.csv")
+parser.add_argument("--limit", type=int, default=0, help="only the first N queries (0: all)")
+parser.add_argument("--model-version", nargs="+", default=["gemini-1.5-flash-001/answer_gen/v1"])
+parser.add_argument("--preamble", nargs="+", default=["default"], help="'default' or NAME=FILE with the preamble text")
+parser.add_argument("--ignore-low-relevant", nargs="+", choices=("true", "false"), default=["true"])
+parser.add_argument("--results", default="matrix.checkpoint.jsonl", help="one record per call; rerun to resume")
+parser.add_argument("--report", default="matrix_report.csv")
+parser.add_argument("--report-only", action="store_true", help="summarize existing results without querying")
+parser.add_argument("--max-error-rate", type=float, default=0.01)
+parser.add_argument("--min-answered-rate", type=float, default=0.0)
+parser.add_argument("--concurrency", type=int, default=int(os.environ.get("EVAL_CONCURRENCY", "8")))
+parser.add_argument("--qps", type=float, default=float(os.environ.get("EVAL_QPS", "5")), help="answer_query quota in requests per second")
+parser.add_argument("--max-attempts", type=int, default=6)
+args = parser.parse_args()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+
+class MatrixConfig(NamedTuple):
+    model_version: str
+    preamble_name: str
+    preamble: str
+    ignore_low_relevant_content: bool
+
+    @property
+    def name(self) -> str:
+        return f"{self.model_version}|{self.preamble_name}|ignore_low={str(self.ignore_low_relevant_content).lower()}"
+
+
+def preambles(specs):
+    for spec in specs:
+        if spec == "default":
+            yield "default", DEFAULT_PREAMBLE
+        else:
+            name, _, path = spec.partition("=")
+            yield name, Path(path).expanduser().read_text().strip()
+
+
+configs = [
+    MatrixConfig(model_version, preamble_name, preamble, ignore == "true")
+    for model_version, (preamble_name, preamble), ignore in itertools.product(
+        args.model_version, list(preambles(args.preamble)), args.ignore_low_relevant
+    )
+]
+
+if not args.report_only:
+    project_id = os.environ["project_id"]
+    location = os.environ["location"]  # Values: "global", "us", "eu"
+    data_store_id = os.environ["data_store_id"]
+    serving_config = f"projects/{project_id}/locations/{location}/collections/default_collection/dataStores/{data_store_id}/servingConfigs/default_serving_config"
+
+    # run_batch already bounds concurrency and rate. Without the process-wide limiter
+    # on top, the recorded elapsed_s is the call alone, not time queued for a slot
+    os.environ.setdefault("BACKEND_LIMITER_ENABLED", "false")
+
+    # Several DISCOVERYENGINE_ENDPOINTS: routed by latency, and hedged (ROUTER_HEDGE=true) since eval calls are sessionless
+    client = search_client_from_env(discoveryengine_v1, location, api_endpoint="discoveryengine.googleapis.com")
+    templates = {
+        config.name: AnswerRequestTemplate(
+            discoveryengine_v1,
+            serving_config=serving_config,
+            model_version=config.model_version,
+            preamble=config.preamble,
+            include_citations=True,
+            ignore_low_relevant_content=config.ignore_low_relevant_content,
+            disable_query_rephraser=True,
+            related_questions=True,
+        )
+        for config in configs
+    }
+
+    async def answer_row(item) -> dict:
+        config_name, query_text = item
+        response = await client.answer_query(templates[config_name].build(query_text))
+        answer = response.answer
+        return {
+            "config": config_name,
+            "answer": answer.answer_text,
+            "answer_chars": len(answer.answer_text),
+            "citations": len(answer.citations),
+            "skipped": bool(answer.answer_skipped_reasons),
+            "skipped_reasons": [getattr(reason, "name", str(reason)) for reason in answer.answer_skipped_reasons],
+        }
+
+    def items():
+        # Every config gets each query back to back, so drifts in service latency hit them all alike
+        rows = read_rows(args.input, "Query")
+        for index, query in itertools.islice(rows, args.limit or None):
+            for config in configs:
+                yield f"{config.name}#{index}", (config.name, query)
+
+    failed = asyncio.run(run_batch(
+        items(),
+        answer_row,
+        concurrency=args.concurrency,
+        limiter=TokenBucket(rate=args.qps),
+        checkpoint=Checkpoint(args.results),
+        max_attempts=args.max_attempts,
+        collect=False,
+    ))
+    print(f"{len(failed)} calls failed after retries")
+
+records = load_records(args.results)
+# Failed calls carry no config field; it is the part of the key before the row index
+records["config"] = records["config"].fillna(records["key"].astype(str).str.rpartition("#")[0])
+summary = summarize(records[records["config"].isin([config.name for config in configs])])
+summary.to_csv(args.report)
+print(format_summary(summary))
+best = pick_fastest(summary, args.max_error_rate, args.min_answered_rate)
+if best is None:
+    print(f"No config stays within {args.max_error_rate:.1%} errors and {args.min_answered_rate:.1%} answered")
+else:
+    print(f"Fastest acceptable config (p90): {best}")
@@ -1,20 +1,33 @@
 from google.cloud import discoveryengine_v1beta as discoveryengine_v1
-from google.api_core.client_options import ClientOptions
 from dotenv import load_dotenv
 load_dotenv()
 import os
-import requests
-from google.auth import default
-from google.auth.transport.requests import Request
-import pandas as pd
-import time
-from typing import List, Optional, Tuple
+import argparse
+import asyncio
+import logging
+from vertexchat.batch import Checkpoint, TokenBucket, run_batch
+from vertexchat.eval_io import merge_results, parse_shard, read_rows, shard_path, shard_paths
+from vertexchat.references import answer_references
+from vertexchat.request_templates import AnswerRequestTemplate
+from vertexchat.routing import search_client_from_env
 
-df = pd.read_csv("~/Downloads/OTI-Complete.csv")
-queries = df["Query"]
+parser = argparse.ArgumentParser(description="Run the eval query set through the Answers API")
+parser.add_argument("--input", default="~/Downloads/OTI-Complete.csv")
+parser.add_argument("--output", default="output_complete.csv", help="a .parquet name writes Parquet")
+parser.add_argument("--checkpoint", default="output_complete.checkpoint.jsonl",
+                    help="completed rows; rerun to resume. With --shard I/N each shard writes NAME.shardIofN.checkpoint.jsonl")
+parser.add_argument("--chunksize", type=int, default=1000, help="input rows read (and output rows written) at a time")
+parser.add_argument("--shard", type=parse_shard, default=(0, 1), help="I/N: only run rows whose index is I modulo N")
+parser.add_argument("--merge", nargs="*", default=[], help="more partial JSONL outputs (other shards or runs) to merge in")
+parser.add_argument("--merge-only", action="store_true", help="skip the queries and only merge partial outputs")
+parser.add_argument("--concurrency", type=int, default=int(os.environ.get("EVAL_CONCURRENCY", "8")))
+parser.add_argument("--qps", type=float, default=float(os.environ.get("EVAL_QPS", "5")), help="answer_query quota in requests per second")
+parser.add_argument("--max-attempts", type=int, default=6)
+args = parser.parse_args()
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-df["Answers API"] = None
-df["API Call Time (s)"] = None
+# Output column -> field of the per-row record in the checkpoint
+RESULT_COLUMNS = {"Answers API": "answer", "API Call Time (s)": "elapsed_s", "References": "references"}
 
 
 # Get the access token from gcloud (assumes gcloud is installed)
@@ -23,58 +36,53 @@ location = os.environ["location"]  # Values: "global", "us", "eu"
 data_store_id = os.environ["data_store_id"]
 
 
-def add_references_answers(citations: List,response):
-    textref = f"\n References:"
-    textlinks = []
-    for i, citation in enumerate(citations):
-        citindex = int(citation.sources[0].reference_id)
-        url = response.answer.references[citindex].chunk_info.document_metadata.uri
-        title = response.answer.references[citindex].chunk_info.document_metadata.title
-        if not any(url in link for link in textlinks):
-            textlinks.append(f"\n [{title}]({url})")
-    text1 = textref + "".join(textlinks)
-    return text1
+# run_batch already bounds concurrency and rate. Without the process-wide limiter
+# on top, the recorded elapsed_s is the call alone, not time queued for a slot
+os.environ.setdefault("BACKEND_LIMITER_ENABLED", "false")
 
+# Several DISCOVERYENGINE_ENDPOINTS: routed by latency, and hedged (ROUTER_HEDGE=true) since eval calls are sessionless
+client = search_client_from_env(discoveryengine_v1, location, api_endpoint="discoveryengine.googleapis.com")
 
 
-client_options = (
-    ClientOptions(api_endpoint="discoveryengine.googleapis.com")
+# Built once for the whole run; each row only stamps in its query
+answer_template = AnswerRequestTemplate(
+    discoveryengine_v1,
+    serving_config=f"projects/{project_id}/locations/{location}/collections/default_collection/dataStores/{data_store_id}/servingConfigs/default_serving_config",
+    model_version="gemini-1.5-flash-001/answer_gen/v1",
+    preamble="Given the conversation between a user and a helpful assistant and some search results, create a final answer for the assistant. Always respond back to the user in the same language as the user. The answer should use all relevant information from the search results, not introduce any additional information, and use exactly the same words as the search results when possible. The assistant's answer should be formatted as a bulleted list.",
+    include_citations=True,
+    ignore_low_relevant_content=True,
+    disable_query_rephraser=True,
+    related_questions=True,
 )
-client = discoveryengine_v1.ConversationalSearchServiceClient(client_options=client_options)
-query = discoveryengine_v1.Query()
-for index, row in df.iterrows():
-    query.text = row["Query"]
-    query_rephraser_spec1 = discoveryengine_v1.AnswerQueryRequest.QueryUnderstandingSpec.QueryRephraserSpec(disable=True)
-    query_understand_spec1 = discoveryengine_v1.AnswerQueryRequest.QueryUnderstandingSpec(query_rephraser_spec=query_rephraser_spec1)
-    model_spec1 = discoveryengine_v1.AnswerQueryRequest.AnswerGenerationSpec.ModelSpec(model_version="gemini-1.5-flash-001/answer_gen/v1",)
-    prompt_spec1 = discoveryengine_v1.AnswerQueryRequest.AnswerGenerationSpec.PromptSpec(preamble="Given the conversation between a user and a helpful assistant and some search results, create a final answer for the assistant. Always respond back to the user in the same language as the user. The answer should use all relevant information from the search results, not introduce any additional information, and use exactly the same words as the search results when possible. The assistant's answer should be formatted as a bulleted list.")
-    related_question_spec = discoveryengine_v1.AnswerQueryRequest.RelatedQuestionsSpec(enable=True)
-    answer_generation_spec = discoveryengine_v1.AnswerQueryRequest.AnswerGenerationSpec(model_spec=model_spec1,prompt_spec=prompt_spec1,include_citations=True,ignore_low_relevant_content=True)
-    request = discoveryengine_v1.AnswerQueryRequest(
-            query=query,
-            serving_config= f"projects/{project_id}/locations/{location}/collections/default_collection/dataStores/{data_store_id}/servingConfigs/default_serving_config",
-            query_understanding_spec = query_understand_spec1,answer_generation_spec=answer_generation_spec,related_questions_spec=related_question_spec
-        )
-    start_time = time.monotonic()
-    try:
-        response = client.answer_query(request=request)
-    except:
-        print("errored out - sleeping now")
-        time.sleep(500)
-        start_time = time.monotonic()
-        try:
-            response = client.answer_query(request=request)
-        except:
-            df.to_csv("output_complete.csv", index=False)
-    end_time = time.monotonic()
-    elapsed_time = end_time - start_time
-    references = f"{add_references_answers(response.answer.citations,response)}"
-    df.at[index,"Answers API"] = response.answer.answer_text
-    df.at[index, "API Call Time (s)"] = elapsed_time
-    df.at[index, "References"] = references
-    print(response.answer.answer_text)
-    print(f"Completed processing {index}")
-df.to_csv("output_complete.csv", index=False)
 
 
+async def answer_row(query_text: str) -> dict:
+    request = answer_template.build(query_text)
+    response = await client.answer_query(request)
+    return {
+        "answer": response.answer.answer_text,
+        "references": answer_references(response.answer),
+    }
 
+
+# Bounded concurrency under a token bucket; per-row jittered backoff and a
+# JSONL checkpoint replace the old global sleep(500) and single retry.
+# Queries are read in chunks and each result is appended to the checkpoint as
+# it lands, so memory stays flat and a crash loses nothing.
+if not args.merge_only:
+    failed = asyncio.run(run_batch(
+        read_rows(args.input, "Query", args.chunksize, args.shard),
+        answer_row,
+        concurrency=args.concurrency,
+        limiter=TokenBucket(rate=args.qps),
+        checkpoint=Checkpoint(shard_path(args.checkpoint, args.shard)),
+        max_attempts=args.max_attempts,
+        collect=False,
+    ))
+    for index, record in failed.items():
+        print(f"Row {index} failed after {record['attempts']} attempts: {record['error']}")
+# The unsharded checkpoint and every shard's, finished or not, plus any --merge files
+counts = merge_results(args.input, [*shard_paths(args.checkpoint), *args.merge], args.output, RESULT_COLUMNS, args.chunksize)
+print(f"Completed processing {counts['rows']} rows: {counts['answered']} answered, "
+      f"{counts['failed']} failed, {counts['missing']} not run yet")
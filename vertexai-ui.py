@@ -6,6 +6,8 @@ from typing import List
 
 from google.api_core.client_options import ClientOptions
 from google.cloud import discoveryengine_v1 as discoveryengine
+from vertexchat.aio import run_sync
+from vertexchat.limiter import busy_on_overload, limited
 
 project_id = ""
 location = "global"                    # Values: "global", "us", "eu"
@@ -49,9 +51,10 @@ client1, conversation1 = multi_turn_search_sample(project_id=project_id,location
 
 @cl.on_chat_start
 async def on_chat_start():
-    multi_turn_search_sample(project_id=project_id,location=location,data_store_id=data_store_id,search_queries=["hello"])
+    await run_sync(multi_turn_search_sample, project_id=project_id,location=location,data_store_id=data_store_id,search_queries=["hello"])
 
 @cl.on_message
+@busy_on_overload
 async def main(message: cl.Message, client = client1, conversation1 = conversation1):
     request = discoveryengine.ConverseConversationRequest(
         name=conversation1.name,
@@ -71,7 +74,8 @@ async def main(message: cl.Message, client = client1, conversation1 = conversati
             include_citations=True,
         ),
     )
-    response = client1.converse_conversation(request)
+    async with limited("discoveryengine"):
+        response = await run_sync(client1.converse_conversation, request)
     # Send a response back to the user
     await cl.Message(
         content=f"{response.reply.summary.summary_text}",
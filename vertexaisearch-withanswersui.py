@@ -5,7 +5,6 @@ import os
 from typing import Dict, Optional
 from datetime import datetime
 from typing import List, Optional, Tuple
-from langsmith.run_helpers import traceable 
 from google.oauth2 import id_token
 
 # Update with your API URL if using a hosted instance of Langsmith.
@@ -17,54 +16,51 @@ from google.cloud.discoveryengine_v1 import Conversation
 import requests
 from google.auth import default
 from google.auth.transport.requests import Request
+from vertexchat.answers import stream_answer
+from vertexchat.auth import TokenCache, default_credentials
+from vertexchat.cache import AnswerCache, TurnRecorder
+from vertexchat.limiter import busy_on_overload
+from vertexchat.metrics import StageMetrics, serve_metrics
+from vertexchat.pool import WarmPool
+from vertexchat.prefetch import Prefetcher
+from vertexchat.references import render_answer
+from vertexchat.request_templates import AnswerRequestTemplate
+from vertexchat.rest import create_session
+from vertexchat.routing import search_client_from_env
+from vertexchat.session_store import SessionStore
+from vertexchat.tracing import traceable
 
 
 os.environ["LANGCHAIN_ENDPOINT"] = "https://api.smith.langchain.com"
-os.environ["LANGCHAIN_TRACING_V2"] = "true"
 project_name = os.environ["LANGCHAIN_PROJECT"]  # Update with your project name
-credentials, project = default()
+credentials, project = default_credentials()
 model_version = os.environ["model_version"]
 project_id = os.environ["project_id"]
 location = os.environ["location"]  # Values: "global", "us", "eu"
 data_store_id = os.environ["data_store_id"]
 prompt=os.environ["prompt"]
+# Stream answer text as it is generated; "false" waits for the whole answer
+answer_streaming = os.environ.get("ANSWER_STREAMING", "true").lower() != "false"
 
 
 authorizedDomainList=os.environ["authorizedDomainList"]
 
 #query_rephraser_spec1 = discoveryengine.AnswerQueryRequest.QueryUnderstandingSpec.QueryRephraserSpec(disable=False)
 #query_understand_spec1 = discoveryengine.AnswerQueryRequest.QueryUnderstandingSpec(query_rephraser_spec=query_rephraser_spec1)
-model_spec1 = discoveryengine.AnswerQueryRequest.AnswerGenerationSpec.ModelSpec(model_version=model_version)
-prompt_spec1 = discoveryengine.AnswerQueryRequest.AnswerGenerationSpec.PromptSpec(preamble=prompt)
-related_question_spec = discoveryengine.AnswerQueryRequest.RelatedQuestionsSpec(enable=True)
-answer_generation_spec = discoveryengine.AnswerQueryRequest.AnswerGenerationSpec(model_spec=model_spec1,prompt_spec=prompt_spec1,include_citations=True,ignore_low_relevant_content=False)
+# Spec messages and serving config are built once; each message only stamps in its query and session
+answer_template = AnswerRequestTemplate(
+    discoveryengine,
+    serving_config=f"projects/{project_id}/locations/{location}/collections/default_collection/dataStores/{data_store_id}/servingConfigs/default_serving_config",
+    model_version=model_version,
+    preamble=prompt,
+    include_citations=True,
+    ignore_low_relevant_content=False,
+    related_questions=True,
+)
 
 
 
 
-def parse_external_link(url=''):
-    protocol_regex = r'^(gs)://'
-    match = re.match(protocol_regex, url)
-    protocol = match.group(1) if match else None
-    if protocol == 'gs':
-        return re.sub(protocol_regex, 'https://storage.cloud.google.com/', url)
-    else:
-        return url
-
-
-def add_references_answers(text: str, citations: List,response):
-    textref = f"\n References:"
-    textlinks = []
-    for i, citation in enumerate(citations):
-        citindex = int(citation.sources[0].reference_id)
-        url = response.answer.references[citindex].chunk_info.document_metadata.uri
-        title = response.answer.references[citindex].chunk_info.document_metadata.title
-        if not any(url in link for link in textlinks):
-            textlinks.append(f"\n [{title}]({url})")
-    text = text + textref + "".join(textlinks)
-    return text
-
-
 @cl.oauth_callback
 def oauth_callback(
   provider_id: str,
@@ -80,59 +76,136 @@ def oauth_callback(
 
 @traceable(run_type="llm")
 def initialize_client():
-    client_options = (
-        ClientOptions(api_endpoint="discoveryengine.googleapis.com")
-    )
-    client = discoveryengine.ConversationalSearchServiceClient(client_options=client_options)
+    # One endpoint as before, or latency-routed (and, for sessionless prefetches, hedged)
+    # across DISCOVERYENGINE_ENDPOINTS
+    client = search_client_from_env(discoveryengine, location, api_endpoint="discoveryengine.googleapis.com")
     return client
 
 
 client = initialize_client()
+metrics = StageMetrics("vertexaisearch-withanswersui")
+serve_metrics()
+# Sends turns answered from the cache or a prefetch to the user's session, in order
+turn_recorder = TurnRecorder()
+answer_cache = AnswerCache.from_env(response_type=discoveryengine.AnswerQueryResponse, recorder=turn_recorder)
+
+
+
+# Refreshes the access token only when it is close to expiry
+token_cache = TokenCache(credentials)
+
 
+async def set_session_variables():
+    # Pooled keep-alive connection instead of a new TLS handshake per session
+    return await create_session(token_cache, project_id, data_store_id, user_pseudo_id="")  # Set your user ID
 
 
-def set_session_variables():
-    credentials.refresh(Request())
-    access_token = credentials.token
-    url = (f"https://discoveryengine.googleapis.com/v1beta/projects/{project_id}/locations/global/collections/default_collection/dataStores/{data_store_id}/sessions")
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "userPseudoId": "",  # Set your user ID
-    }
-    response = requests.post(url, headers=headers,json=data)
-    return response.json()['name']
+# Sessions created ahead of time so the welcome message does not wait on a token refresh and REST call
+session_pool = WarmPool.from_env(set_session_variables, prefix="SESSION_POOL")
+# Filled as the server starts, so the first chat after a cold start does not wait either
+session_pool.start_with_server()
+# One Answers API session per Chainlit user session, with idle and size-based eviction
+session_store = SessionStore.from_env(
+    session_prefix=f"projects/{project_id}/locations/global/collections/default_collection/dataStores/{data_store_id}/sessions/"
+)
+
+
+async def prefetch_answer(question):
+    # Sessionless: a speculative call must not add turns to the user's session.
+    # The answer is valid for anyone, so it goes through the shared cache
+    request = answer_template.build(question)
+    if answer_cache is None:
+        return await client.answer_query(request)
+    return await answer_cache.get_or_call(
+        lambda: client.answer_query(request),
+        question, answer_template.serving_config, model_version, prompt,
+    )
+
+
+# Answers the related questions under each reply before the user clicks one
+prefetcher = Prefetcher.from_env(prefetch_answer)
 
 
 @cl.on_chat_start
 async def on_chat_start():
-    current_session_local = set_session_variables()
-    global current_session
-    current_session = current_session_local
-    cl.user_session.set("conversation", current_session)
+    # Empty pool: on_message then creates the session lazily
+    current_session = session_pool.take_nowait()
+    if current_session is not None:
+        session_store.put(cl.user_session.get("id"), current_session)
     await cl.Message(content=f"Welcome to the Chatbot. Please ask your question below.", type="system_message").send()
 
 
+@cl.on_chat_end
+async def on_chat_end():
+    session_store.pop(cl.user_session.get("id"))
+    if prefetcher is not None:
+        prefetcher.forget(cl.user_session.get("id"))
+
+
+@cl.action_callback("related_question")
+async def on_related_question(action):
+    await cl.Message(content=action.value, type="user_message").send()
+    await on_message(cl.Message(content=action.value))
+
+
 
 @cl.on_message
+@busy_on_overload
 @traceable(run_type="llm")
 async def on_message(message: cl.Message):
-    query = discoveryengine.Query()
-    query.text = message.content
-    request = discoveryengine.AnswerQueryRequest(
-    query=query,
-    session=current_session,
-    serving_config= f"projects/{project_id}/locations/{location}/collections/default_collection/dataStores/{data_store_id}/servingConfigs/default_serving_config",answer_generation_spec=answer_generation_spec,related_questions_spec=related_question_spec )
-    response = client.answer_query(request=request)
-    content = f"{add_references_answers(response.answer.answer_text, response.answer.citations,response)}"
-    async with cl.Step(name="Related questions") as parent_step:
-        parent_step.output = response.answer.related_questions
-    await cl.Message(
-        content=content
-    ).send()
-    return content
+    with metrics.message():
+        user_key = cl.user_session.get("id")
+        msg = cl.Message(content="")
+        # A clicked (or retyped) related question; anything else cancels the user's prefetches
+        with metrics.stage("prefetch_lookup"):
+            response = None if prefetcher is None else await prefetcher.take(user_key, message.content)
+        with metrics.stage("session_lookup"):
+            session_record = session_store.get(user_key)
+            if session_record is None:
+                session_record = session_store.put(user_key, await session_pool.get())
+        with metrics.stage("request_build"):
+            request = answer_template.build(message.content, session_store.session_name(session_record))
+        # Only the first turn of a session is cacheable; follow-ups depend on session context
+        turns = session_record.turns
+        session_record.turns += 1
+        if response is not None:
+            # Answered by a sessionless prefetch; the turn is sent to the session in the background
+            turn_recorder.record(request.session, lambda: client.answer_query(request))
+        else:
+            # A cached or prefetched turn still being recorded goes to the session first
+            await turn_recorder.wait(request.session)
+            if answer_streaming:
+                call = lambda: stream_answer(client, request, msg)
+            else:
+                call = lambda: client.answer_query(request)
+            with metrics.stage("rpc"):
+                if answer_cache is None:
+                    response = await call()
+                else:
+                    response = await answer_cache.get_or_call(
+                        call,
+                        message.content, answer_template.serving_config, model_version, prompt,
+                        bypass=turns > 0,
+                        # A hit is still sent to the session in the background, so follow-ups have its context.
+                        # A session only gains a turn by answering it; ANSWER_CACHE_RECORD_HITS=false skips that load
+                        session=request.session,
+                        record=lambda cached: client.answer_query(request),
+                    )
+            if msg.metadata and msg.metadata.get("ttfb_s") is not None:
+                metrics.observe("first_token", msg.metadata["ttfb_s"])
+        related_questions = list(response.answer.related_questions)
+        # References only arrive with the final response; send() replaces the streamed text
+        with metrics.stage("render"):
+            content = render_answer(response.answer)
+        with metrics.stage("send"):
+            msg.content = content
+            msg.actions = [cl.Action(name="related_question", value=question, label=question) for question in related_questions]
+            await msg.send()
+            async with cl.Step(name="Related questions") as parent_step:
+                parent_step.output = related_questions
+        if prefetcher is not None:
+            prefetcher.schedule(user_key, related_questions)
+        return content
     
    
 
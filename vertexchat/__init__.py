@@ -0,0 +1,5 @@
+"""Shared helpers for the Vertex AI Search / Gemini Chainlit apps in this repo.
+
+Each submodule is imported explicitly by the apps that need it so a script
+only pulls in the Google client libraries it actually uses.
+"""
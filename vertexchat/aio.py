@@ -0,0 +1,181 @@
+"""Non-blocking access to the Discovery Engine conversational search service.
+
+Chainlit runs every handler on one event loop, so calling the synchronous
+``ConversationalSearchServiceClient`` from ``on_message`` stalls all connected
+users for the length of the RPC. ``ConversationalSearch`` wraps the async gRPC
+client instead and falls back to a shared thread pool for anything that only
+exists as a blocking call.
+"""
+import asyncio
+import functools
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple, Type
+
+from google.api_core import exceptions as core_exceptions
+from google.api_core.client_options import ClientOptions
+from google.protobuf import field_mask_pb2
+
+from vertexchat import fakes
+from vertexchat.limiter import backend_limiter, limited
+
+# Errors worth retrying: quota, overload and transient server/network failures.
+# Shared by the request router and the offline batch runner.
+RETRYABLE_ERRORS: Tuple[Type[BaseException], ...] = (
+    core_exceptions.TooManyRequests,
+    core_exceptions.ResourceExhausted,
+    core_exceptions.ServiceUnavailable,
+    core_exceptions.DeadlineExceeded,
+    core_exceptions.InternalServerError,
+    core_exceptions.BadGateway,
+    core_exceptions.GatewayTimeout,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+SYNC_WORKERS = int(os.environ.get("VERTEXCHAT_SYNC_WORKERS", "32"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="vertexchat-sync")
+    return _executor
+
+
+async def run_sync(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking callable on the shared worker pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def client_options_for(location: str, api_endpoint: Optional[str] = None) -> Optional[ClientOptions]:
+    #  For more information, refer to:
+    # https://cloud.google.com/generative-ai-app-builder/docs/locations#specify_a_multi-region_for_your_data_store
+    if api_endpoint:
+        return ClientOptions(api_endpoint=api_endpoint)
+    if location != "global":
+        return ClientOptions(api_endpoint=f"{location}-discoveryengine.googleapis.com")
+    return None
+
+
+def conversation_turn(discoveryengine, conversation: str, query: str, reply) -> dict:
+    """``update_conversation`` arguments that make ``query`` and ``reply`` the conversation's messages."""
+    return {
+        "conversation": discoveryengine.Conversation(
+            name=conversation,
+            messages=[
+                discoveryengine.ConversationMessage(user_input=discoveryengine.TextInput(input=query)),
+                discoveryengine.ConversationMessage(reply=reply),
+            ],
+        ),
+        "update_mask": field_mask_pb2.FieldMask(paths=["messages"]),
+    }
+
+
+class ConversationalSearch:
+    """Async facade over ``ConversationalSearchService`` for one API version.
+
+    ``discoveryengine`` is the generated module (``discoveryengine_v1`` or
+    ``discoveryengine_v1beta``). The async client is created lazily per event
+    loop because gRPC asyncio channels are bound to the loop they start on.
+    """
+
+    def __init__(self, discoveryengine, client_options: Optional[ClientOptions] = None):
+        self.discoveryengine = discoveryengine
+        self.client_options = client_options
+        self._sync_client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def sync_client(self):
+        if self._sync_client is None:
+            self._sync_client = self.discoveryengine.ConversationalSearchServiceClient(
+                client_options=self.client_options
+            )
+        return self._sync_client
+
+    def _async_client(self):
+        async_client_cls = getattr(self.discoveryengine, "ConversationalSearchServiceAsyncClient", None)
+        if fakes.enabled():
+            async_client_cls = functools.partial(fakes.FakeConversationalSearchAsyncClient, self.discoveryengine)
+        if async_client_cls is None:
+            return None
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = async_client_cls(client_options=self.client_options)
+            self._async_clients[loop] = client
+        return client
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """Invoke ``method`` under the ``discoveryengine`` limiter."""
+        async with limited("discoveryengine"):
+            return await self.invoke(method, *args, **kwargs)
+
+    async def invoke(self, method: str, *args, **kwargs) -> Any:
+        """Invoke ``method`` on the async client, or on the sync client in a worker thread.
+
+        No admission control: the caller holds the limiter slot, once per
+        logical call (``vertexchat.routing`` retries and hedges under one).
+        """
+        client = self._async_client()
+        if client is not None and hasattr(client, method):
+            return await getattr(client, method)(*args, **kwargs)
+        return await run_sync(getattr(self.sync_client, method), *args, **kwargs)
+
+    def data_store_path(self, project_id: str, location: str, data_store_id: str) -> str:
+        return self.discoveryengine.ConversationalSearchServiceClient.data_store_path(
+            project=project_id, location=location, data_store=data_store_id
+        )
+
+    def serving_config_path(self, project_id: str, location: str, data_store_id: str, serving_config: str) -> str:
+        return self.discoveryengine.ConversationalSearchServiceClient.serving_config_path(
+            project=project_id, location=location, data_store=data_store_id, serving_config=serving_config
+        )
+
+    async def create_conversation(self, project_id: str, location: str, data_store_id: str):
+        return await self.call(
+            "create_conversation",
+            # The full resource name of the data store
+            # e.g. projects/{project_id}/locations/{location}/dataStores/{data_store_id}
+            parent=self.data_store_path(project_id, location, data_store_id),
+            conversation=self.discoveryengine.Conversation(),
+        )
+
+    async def converse_conversation(self, request):
+        return await self.call("converse_conversation", request=request)
+
+    async def record_turn(self, conversation: str, query: str, reply):
+        """Write ``query`` and its ``reply`` into ``conversation`` without generating the reply again.
+
+        For the first turn of a conversation, e.g. one answered from the cache:
+        the conversation's messages are replaced by this turn.
+        """
+        return await self.call("update_conversation", **conversation_turn(self.discoveryengine, conversation, query, reply))
+
+    async def answer_query(self, request):
+        return await self.call("answer_query", request=request)
+
+    async def stream_answer_query(self, request):
+        """Async iterator of partial ``AnswerQueryResponse`` messages.
+
+        Raises ``NotImplementedError`` when the API version has no async
+        streaming answer method; a blocking server stream cannot be driven
+        from the worker pool without tying up a thread per reply.
+        """
+        limiter = backend_limiter("discoveryengine")
+        if limiter is None:
+            return await self.open_stream(request)
+        # The slot is held until the stream is drained or closed, not just until it opens
+        return await limiter.stream(lambda: self.open_stream(request))
+
+    async def open_stream(self, request):
+        """``stream_answer_query`` without admission control; see ``invoke``."""
+        client = self._async_client()
+        if client is None or not hasattr(client, "stream_answer_query"):
+            raise NotImplementedError(f"{self.discoveryengine.__name__} has no stream_answer_query")
+        return await client.stream_answer_query(request=request)
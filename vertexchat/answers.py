@@ -0,0 +1,65 @@
+"""Streaming Answers API replies rendered in Chainlit.
+
+``stream_answer`` calls ``stream_answer_query`` and pushes answer text into a
+Chainlit message as it is generated. The references and related questions
+only arrive with the final response, so the caller renders those once the
+stream ends. When the client or the endpoint does not support streaming, it
+falls back to the unary ``answer_query``.
+"""
+import logging
+import time
+
+from google.api_core import exceptions
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean "this endpoint cannot stream", as opposed to a failed answer
+STREAMING_UNAVAILABLE = (exceptions.MethodNotImplemented, NotImplementedError)
+
+
+async def stream_answer(client, request, msg):
+    """Answer ``request`` through ``client`` (a ``ConversationalSearch``), streaming text into ``msg``.
+
+    Returns one ``AnswerQueryResponse`` equivalent to the unary response: the
+    final streamed response with the full answer text. Timings are recorded
+    on ``msg.metadata``: ``ttfb_s`` is the time to the first answer text
+    (the whole call when falling back), ``total_s`` the time to the final
+    response, and ``streamed`` whether the streaming endpoint was used.
+    """
+    start = time.perf_counter()
+    ttfb = None
+    text = ""
+    final = None
+    try:
+        responses = await client.stream_answer_query(request)
+        async for response in responses:
+            chunk = response.answer.answer_text
+            # Tolerate both incremental and cumulative answer_text chunks
+            if text and chunk.startswith(text):
+                chunk = chunk[len(text):]
+            if chunk:
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+                text += chunk
+                await msg.stream_token(chunk)
+            final = response
+    except STREAMING_UNAVAILABLE as error:
+        if text:
+            raise
+        logger.info("streaming answers unavailable (%s); using answer_query", error)
+        final = await client.answer_query(request)
+        ttfb = time.perf_counter() - start
+        streamed = False
+    else:
+        streamed = True
+    if final is None:
+        raise exceptions.ServiceUnavailable("stream_answer_query returned no responses")
+    if streamed:
+        final.answer.answer_text = text
+    timings = {"ttfb_s": ttfb, "total_s": time.perf_counter() - start, "streamed": streamed}
+    msg.metadata = {**(msg.metadata or {}), **timings}
+    logger.info(
+        "answer streamed=%s ttfb=%s total=%.3fs",
+        streamed, "n/a" if ttfb is None else f"{ttfb:.3f}s", timings["total_s"],
+    )
+    return final
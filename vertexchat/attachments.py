@@ -0,0 +1,263 @@
+"""Content-addressed cache of prepared Gemini attachment parts.
+
+Chainlit writes every upload to a new path, so the same PDF uploaded by many
+users used to be read into memory and wrapped in a fresh ``Part`` each time.
+``AttachmentCache`` keys parts by the SHA-256 of the file contents instead.
+The file is hashed through ``mmap``, so a hit never copies the file into
+Python memory, and a miss reads it only once. Inline parts are kept under a
+byte budget with LRU eviction.
+
+With an object store configured, each distinct file is uploaded once and the
+cache holds a small ``Part.from_uri`` reference instead of the bytes:
+
+* ``gs://bucket/prefix`` - Cloud Storage, readable by Gemini
+* any other value - a local directory standing in for the bucket (``file://``
+  URIs; only for the fake backend and offline benchmarks)
+
+``prepare_attachments`` turns all the files of a message into parts at once.
+Type sniffing, PDF page counting and text extraction
+(``vertexchat.preprocess``) run in parallel on a process pool of
+``ATTACHMENT_WORKERS`` processes, forked from a clean forkserver that has
+already imported the preprocessing code. A file that cannot be used yields an
+``AttachmentError`` with a reason to show the user, and the other files
+are still sent. With ``ReduceOptions`` the workers also downscale images and
+shrink PDFs, and the reduced files are sent instead of the uploads; each file
+logs its bytes in and out.
+
+Environment: ``ATTACHMENT_CACHE_ENABLED`` (default ``true``),
+``ATTACHMENT_CACHE_MAX_BYTES`` (default 256 MiB), ``ATTACHMENT_STORE``,
+``ATTACHMENT_WORKERS`` (default: CPUs, at most 4), and the reduction
+variables listed in ``vertexchat.preprocess.ReduceOptions.from_env``.
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from vertexchat.aio import run_sync
+from vertexchat.history import set_pdf_pages
+from vertexchat.preprocess import AttachmentError, FileInfo, ReduceOptions, content_hash, preprocess_file
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20
+ATTACHMENT_WORKERS = int(os.environ.get("ATTACHMENT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # Not fork: forking a process with live gRPC channels and threads is unsafe. Workers fork
+        # from a forkserver instead, a fresh interpreter that preloads only the worker modules
+        # (missing optional ones are skipped), so each starts without re-importing them.
+        # They still re-import a script run as __main__, as __mp_main__; apps guard their setup against that
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["vertexchat.preprocess", "PIL.Image", "pypdf"])
+        else:
+            context = multiprocessing.get_context("spawn")
+        _process_pool = ProcessPoolExecutor(max_workers=ATTACHMENT_WORKERS, mp_context=context)
+    return _process_pool
+
+
+async def run_in_process(func, *args, **kwargs) -> Any:
+    """Run a picklable CPU-bound callable on the shared process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_process_pool(), functools.partial(func, *args, **kwargs))
+
+
+class LocalObjectStore:
+    """Stand-in for a bucket: blobs are files named by digest under ``root``."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def put(self, digest: str, path, mime_type: str) -> str:
+        target = self.root / digest
+        if not target.exists():
+            tmp = target.with_suffix(".partial")
+            with open(path, "rb") as src, open(tmp, "wb") as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    dst.write(chunk)
+            tmp.replace(target)
+        return target.resolve().as_uri()
+
+
+class GcsObjectStore:
+    """Uploads each distinct attachment once to ``gs://bucket/prefix/<digest>``."""
+
+    def __init__(self, uri: str):
+        from google.cloud import storage
+
+        bucket, _, prefix = uri[len("gs://"):].partition("/")
+        self.bucket = storage.Client().bucket(bucket)
+        self.prefix = prefix.strip("/")
+
+    def put(self, digest: str, path, mime_type: str) -> str:
+        name = f"{self.prefix}/{digest}" if self.prefix else digest
+        blob = self.bucket.blob(name)
+        if not blob.exists():
+            blob.upload_from_filename(str(path), content_type=mime_type)
+        return f"gs://{self.bucket.name}/{name}"
+
+
+class AttachmentCache:
+    """LRU of prepared parts keyed by content hash and MIME type, bounded by ``max_bytes``."""
+
+    def __init__(self, max_bytes: int = 256 << 20, store=None):
+        self.max_bytes = max_bytes
+        self.store = store
+        # key -> (part, resident bytes, file size)
+        self._entries: "OrderedDict[str, Tuple[Any, int, int]]" = OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["AttachmentCache"]:
+        """Build from ``ATTACHMENT_*`` variables; ``None`` when ``ATTACHMENT_CACHE_ENABLED=false``."""
+        if os.environ.get("ATTACHMENT_CACHE_ENABLED", "true").lower() == "false":
+            return None
+        store_uri = os.environ.get("ATTACHMENT_STORE")
+        store = None
+        if store_uri:
+            store = GcsObjectStore(store_uri) if store_uri.startswith("gs://") else LocalObjectStore(store_uri)
+        return cls(max_bytes=int(os.environ.get("ATTACHMENT_CACHE_MAX_BYTES", str(256 << 20))), store=store)
+
+    def _prepare(self, path, mime_type: str) -> Tuple[str, Any, int, int]:
+        """Hash ``path`` and build its part on a miss; runs on a worker thread."""
+        from vertexai.generative_models import Part
+
+        digest = content_hash(path)
+        key = f"{digest}:{mime_type}"
+        size = os.path.getsize(path)
+        if key in self._entries:
+            return key, None, 0, size
+        if self.store is not None:
+            uri = self.store.put(digest, path, mime_type)
+            return key, Part.from_uri(uri, mime_type=mime_type), len(uri), size
+        with open(path, "rb") as f:
+            data = f.read()
+        return key, Part.from_data(data, mime_type=mime_type), len(data), size
+
+    async def part_for(self, path, mime_type: str):
+        """The ``Part`` for the file at ``path``, reused when the same content was seen before."""
+        key, part, resident, size = await run_sync(self._prepare, path, mime_type)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += entry[2]
+            logger.info("attachment cache hit %s: saved reading %d bytes (%d saved so far)", key[:12], entry[2], self.bytes_saved)
+            return entry[0]
+        if part is None:
+            # Evicted between the hash and now; build it again
+            key, part, resident, size = await run_sync(self._prepare, path, mime_type)
+        self.misses += 1
+        if resident <= self.max_bytes:
+            self._entries[key] = (part, resident, size)
+            self.resident_bytes += resident
+            self._evict()
+        return part
+
+    def _evict(self) -> None:
+        while self.resident_bytes > self.max_bytes and self._entries:
+            _, (_, resident, _) = self._entries.popitem(last=False)
+            self.resident_bytes -= resident
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "resident_bytes": self.resident_bytes,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+def _read_part(path, mime_type: str):
+    from vertexai.generative_models import Part
+
+    with open(path, "rb") as f:
+        return Part.from_data(f.read(), mime_type=mime_type)
+
+
+async def _file_part(path, mime_type: str, cache: Optional[AttachmentCache]):
+    if cache is not None:
+        return await cache.part_for(path, mime_type)
+    return await run_sync(_read_part, path, mime_type)
+
+
+async def _prepare_one(element, cache: Optional[AttachmentCache], extract_text: bool, reduce: Optional[ReduceOptions]):
+    from vertexai.generative_models import Part
+
+    path = str(element.path)
+    name = getattr(element, "name", None) or Path(path).name
+    start = time.perf_counter()
+    try:
+        info = await run_in_process(preprocess_file, path, getattr(element, "mime", None), name, extract_text, reduce)
+        if info.text is not None and (info.has_text_layer or info.mime_type.startswith("text/")):
+            parts = [Part.from_text(f"[{info.name}]\n{info.text}")]
+        else:
+            outputs = info.outputs or [(path, info.mime_type)]
+            parts = list(await asyncio.gather(*(_file_part(p, mime, cache) for p, mime in outputs)))
+            if info.pages is not None:
+                # Counted by pypdf; the history's token budget cannot see pages in compressed object streams
+                for part, (_, mime) in zip(parts, outputs):
+                    if mime == "application/pdf":
+                        set_pdf_pages(part, info.pages_out or info.pages)
+    except AttachmentError:
+        raise
+    except Exception as error:
+        logger.exception("Preprocessing %s failed", name)
+        raise AttachmentError(name, f"could not be processed ({type(error).__name__})") from error
+    logger.info(
+        "attachment %s: %s, %d bytes in, %d bytes out (%s), %s pages, preprocessed in %.3fs, ready in %.3fs",
+        info.name, info.mime_type, info.size, info.bytes_out, info.reduction or "as uploaded",
+        info.pages if info.pages is not None else "-", info.seconds, time.perf_counter() - start,
+    )
+    return parts, info
+
+
+async def prepare_attachments(
+    elements: Sequence,
+    cache: Optional[AttachmentCache] = None,
+    pdf_mode: str = "inline",
+    reduce: Optional[ReduceOptions] = None,
+) -> Tuple[list, List[FileInfo], List[AttachmentError]]:
+    """Turn a message's file elements into parts, all files in parallel.
+
+    ``pdf_mode="text"`` sends the text layer of PDFs that have one instead
+    of the file itself. ``reduce`` shrinks images and PDFs before they are
+    sent; a rasterized PDF becomes one image part per page. Returns the
+    parts, a ``FileInfo`` (with timing and bytes out) per usable file, and
+    an ``AttachmentError`` per file that was skipped.
+    """
+    results = await asyncio.gather(
+        *(_prepare_one(element, cache, pdf_mode == "text", reduce) for element in elements), return_exceptions=True
+    )
+    parts, infos, errors = [], [], []
+    for result in results:
+        if isinstance(result, AttachmentError):
+            errors.append(result)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            parts.extend(result[0])
+            infos.append(result[1])
+    return parts, infos, errors
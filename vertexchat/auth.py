@@ -0,0 +1,72 @@
+"""Expiry-aware access-token cache for REST calls to Discovery Engine.
+
+``credentials.refresh(Request())`` costs a round trip to the token endpoint
+(or metadata server). ``TokenCache`` reuses the current token until it is
+within ``refresh_margin`` seconds of expiry and lets only one caller refresh
+at a time; everyone else waits for that refresh instead of starting their own.
+"""
+import asyncio
+import datetime
+import threading
+from typing import Optional
+
+import google.auth
+from google.auth.transport.requests import Request
+
+from vertexchat import fakes
+from vertexchat.aio import run_sync
+
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+
+def default_credentials(scopes=SCOPES):
+    """``google.auth.default()``, or fake credentials when the fake backend is enabled."""
+    if fakes.enabled():
+        return fakes.FakeCredentials(), None
+    return google.auth.default(scopes=scopes)
+
+
+class TokenCache:
+    def __init__(self, credentials=None, refresh_margin: float = 300):
+        if credentials is None:
+            credentials, _ = default_credentials()
+        self.credentials = credentials
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._async_lock: Optional[asyncio.Lock] = None
+
+    def _fresh(self) -> bool:
+        if not self.credentials.token:
+            return False
+        expiry = self.credentials.expiry
+        if expiry is None:
+            return True
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return expiry - now > self.refresh_margin
+
+    def _refresh(self) -> str:
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            if not self._fresh():
+                self.credentials.refresh(Request())
+                self.refreshes += 1
+            return self.credentials.token
+
+    def token(self) -> str:
+        """Return a valid access token, refreshing on this thread if needed."""
+        if self._fresh():
+            return self.credentials.token
+        return self._refresh()
+
+    async def atoken(self) -> str:
+        """Return a valid access token without blocking the event loop."""
+        if self._fresh():
+            return self.credentials.token
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if self._fresh():
+                return self.credentials.token
+            return await run_sync(self._refresh)
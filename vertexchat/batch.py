@@ -0,0 +1,208 @@
+"""Concurrent, rate-limited, resumable batch runner for offline evaluations.
+
+``run_batch`` feeds ``(key, item)`` pairs through an async worker with bounded
+concurrency. Every call first takes a token from a ``TokenBucket`` sized to the
+project quota, transient API errors are retried per row with jittered
+exponential backoff, and each finished row is appended to a JSONL
+``Checkpoint`` so a crashed run picks up where it stopped.
+
+Items are pulled from the iterable as workers free up, so a lazily read input
+(``vertexchat.eval_io.read_rows``) is never held in memory whole. With
+``collect=False`` only failed rows are returned and completed ones live in the
+checkpoint alone.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple, Type
+
+from vertexchat.aio import RETRYABLE_ERRORS
+from vertexchat.limiter import Overloaded
+
+logger = logging.getLogger(__name__)
+
+# A row the process-wide backend limiter refused (queue full or timed out) is
+# retried like a 429 instead of being recorded as a failed row
+BATCH_RETRYABLE_ERRORS: Tuple[Type[BaseException], ...] = RETRYABLE_ERRORS + (Overloaded,)
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, bursts of up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        # The lock keeps waiters in FIFO order so no caller starves
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Full-jitter exponential backoff for retry number ``attempt`` (starting at 1)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class Checkpoint:
+    """Append-only JSONL record of completed rows, keyed by ``key``."""
+
+    def __init__(self, path, flush_every: int = 10):
+        self.path = Path(path).expanduser()
+        self.flush_every = flush_every
+        self._file = None
+        self._pending = 0
+
+    def load(self) -> Dict[Any, Dict[str, Any]]:
+        completed = {}
+        if not self.path.exists():
+            return completed
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    continue
+                completed[record["key"]] = record
+        return completed
+
+    def completed_keys(self) -> Set[Hashable]:
+        """Keys of rows that finished without an error, without keeping their records."""
+        done = set()
+        if not self.path.exists():
+            return done
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "error" in record:
+                    done.discard(record["key"])
+                else:
+                    done.add(record["key"])
+        return done
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+        self._pending = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+async def run_batch(
+    items: Iterable[Tuple[Hashable, Any]],
+    worker: Callable[[Any], Awaitable[Dict[str, Any]]],
+    concurrency: int = 8,
+    limiter: Optional[TokenBucket] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    max_attempts: int = 6,
+    retryable: Tuple[Type[BaseException], ...] = BATCH_RETRYABLE_ERRORS,
+    backoff_base: float = 1.0,
+    backoff_cap: float = 60.0,
+    collect: bool = True,
+) -> Dict[Hashable, Dict[str, Any]]:
+    """Run ``worker`` over ``items`` and return ``{key: record}`` for every row.
+
+    ``worker`` returns a JSON-serialisable dict for one item. Rows already
+    completed in ``checkpoint`` are skipped and returned as loaded. A row that
+    still fails after ``max_attempts`` (or with a non-retryable error) is
+    recorded with an ``error`` field instead of aborting the run.
+
+    With ``collect=False`` only the failed rows are returned, so memory
+    stays flat however many rows there are; read the rest from the checkpoint.
+    """
+    # Rows that ended in an error are retried on resume
+    if collect:
+        results = {key: record for key, record in (checkpoint.load() if checkpoint else {}).items() if "error" not in record}
+        done = results.keys()
+    else:
+        results = {}
+        done = checkpoint.completed_keys() if checkpoint else set()
+    if done:
+        logger.info("resuming: %d rows already completed", len(done))
+    # Bounded, so items are read from the iterable only as fast as workers take them
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, concurrency) * 2)
+    workers = max(1, concurrency)
+
+    async def produce():
+        for key, item in items:
+            if key not in done:
+                await queue.put((key, item))
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def process(key, item) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            attempt += 1
+            if limiter is not None:
+                await limiter.acquire()
+            start = time.monotonic()
+            try:
+                record = await worker(item)
+            except retryable as e:
+                if attempt >= max_attempts:
+                    return {"key": key, "error": repr(e), "attempts": attempt}
+                delay = backoff_delay(attempt, backoff_base, backoff_cap)
+                logger.warning("row %s attempt %d failed (%r), retrying in %.1fs", key, attempt, e, delay)
+                await asyncio.sleep(delay)
+                continue
+            except Exception as e:
+                return {"key": key, "error": repr(e), "attempts": attempt}
+            return {"key": key, "elapsed_s": time.monotonic() - start, "attempts": attempt, **record}
+
+    async def consume():
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            key, item = entry
+            record = await process(key, item)
+            if collect or "error" in record:
+                results[key] = record
+            if checkpoint is not None:
+                checkpoint.write(record)
+            logger.info("completed row %s", key)
+
+    tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(consume()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # When reading items or writing a record fails, stop the other tasks before the
+        # checkpoint is closed; rows cut short are not recorded and run again on resume
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if checkpoint is not None:
+            checkpoint.close()
+    return results
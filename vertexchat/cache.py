@@ -0,0 +1,323 @@
+"""Answer cache for ``answer_query`` / ``converse_conversation``.
+
+Responses are keyed on the normalized query text plus everything else that
+shapes the answer (serving config, model version, preamble). Lookups go to an
+in-memory TTL/LRU tier first and then to an optional SQLite tier that survives
+restarts and is shared by workers on the same host.
+
+Only single-turn queries should be cached: a follow-up question depends on the
+conversation so far, so callers pass ``bypass=True`` once a session has
+history. The server-side session or conversation still has to see the first
+turn, or a follow-up would be answered without it: with ``session`` set, a hit
+is returned at once while ``record(response)`` sends the turn to the session in
+the background, and the next call for that session waits for it
+(``TurnRecorder``).
+
+What recording costs is up to ``record``. A conversation can be given the turn
+without generating it again (``ConversationalSearch.record_turn``), so there a
+hit saves the backend generation as well as the wait. An Answers API session
+only gains a turn through ``answer_query`` itself, so recording a hit there
+repeats the generation off the user's path: the user waits less, but the
+backend does the same work. ``ANSWER_CACHE_RECORD_HITS=false`` skips recording
+to save that load, at the price of follow-ups that do not know the first turn.
+
+Misses are coalesced: while a call for a key is in flight, identical queries
+arriving at the same moment (a notice goes out and hundreds of users ask the
+same thing) wait for that call instead of issuing their own, and all of them
+get its response. If the call fails, every waiter gets the error. A waiter
+with a ``session`` is treated like a hit: its turn is sent to its own session
+in the background.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from cachetools import TTLCache
+
+from vertexchat.aio import run_sync
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def normalize_query(text: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing ``?!.`` so trivial variants share a key."""
+    text = _WHITESPACE.sub(" ", text.casefold()).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def cache_key(query: str, serving_config: str, model_version: str = "", preamble: str = "") -> str:
+    parts = (normalize_query(query), serving_config, model_version, preamble)
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class _SqliteTier:
+    def __init__(self, path: str, response_type, ttl: float):
+        self.response_type = response_type
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.expanduser(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, expires REAL NOT NULL, payload BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT expires, payload FROM answers WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] < time.time():
+            return None
+        return self.response_type.deserialize(row[1])
+
+    def set(self, key: str, value) -> None:
+        payload = self.response_type.serialize(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, expires, payload) VALUES (?, ?, ?)",
+                (key, time.time() + self.ttl, payload),
+            )
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM answers WHERE expires < ?", (time.time(),)).rowcount
+            self._conn.commit()
+        return deleted
+
+
+class SingleFlight:
+    """At most one in-flight call per key; concurrent callers for the key share its result."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]):
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # Shielded: one waiter giving up (its user left) must not cancel the call for the rest
+            return await asyncio.shield(future)
+        self.leaders += 1
+        future = asyncio.ensure_future(call())
+        self._calls[key] = future
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(future)
+
+    def _finish(self, key: str, future: asyncio.Future) -> None:
+        self._calls.pop(key, None)
+        if not future.cancelled():
+            # Marks the error as retrieved when every waiter had already gone
+            future.exception()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+class TurnRecorder:
+    """Background calls that send a turn answered from elsewhere to its session, in order.
+
+    A turn answered from the cache or from a prefetch never went to the user's
+    session or conversation. ``record(session, call)`` sends it there in the
+    background, after any turn already being recorded for that session, and
+    every call for the session should ``await wait(session)`` first so the
+    backend sees the turns in the order the user asked them.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.recorded = 0
+        self.failed = 0
+
+    def record(self, session: str, call: Callable[[], Awaitable[Any]]) -> None:
+        previous = self._pending.get(session)
+        task = asyncio.ensure_future(self._record(previous, call))
+        self._pending[session] = task
+        task.add_done_callback(lambda done: self._done(session, done))
+
+    async def _record(self, previous: Optional[asyncio.Future], call: Callable[[], Awaitable[Any]]):
+        if previous is not None:
+            await asyncio.wait({previous})
+        return await call()
+
+    def _done(self, session: str, task: asyncio.Future) -> None:
+        if self._pending.get(session) is task:
+            del self._pending[session]
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.failed += 1
+            logger.warning("Could not record a turn in %s; its follow-ups lack that context", session, exc_info=task.exception())
+        else:
+            self.recorded += 1
+
+    async def wait(self, session: str) -> None:
+        """Wait until every turn being recorded for ``session`` has reached it."""
+        task = self._pending.get(session)
+        if task is not None:
+            await asyncio.wait({task})
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+class AnswerCache:
+    """Tiered response cache with hit/miss counters.
+
+    ``response_type`` is the proto-plus response class; it is only needed when
+    ``sqlite_path`` enables the persistent tier. ``semantic`` adds a
+    near-duplicate tier (``vertexchat.semantic_cache.SemanticCache``) consulted
+    after an exact miss. ``recorder`` sends cached turns to their sessions;
+    pass the app's own ``TurnRecorder`` when other code records turns too.
+    With ``record_hits=False`` cached turns are not sent to sessions at all.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, sqlite_path: Optional[str] = None, response_type=None, semantic=None, coalesce: bool = True, recorder: Optional[TurnRecorder] = None, record_hits: bool = True):
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight = SingleFlight() if coalesce else None
+        self._persistent = _SqliteTier(sqlite_path, response_type, ttl) if sqlite_path else None
+        self._semantic = semantic
+        self.recorder = recorder if recorder is not None else TurnRecorder()
+        self.record_hits = record_hits
+        self.hits = 0
+        self.persistent_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @classmethod
+    def from_env(cls, response_type=None, recorder: Optional[TurnRecorder] = None) -> Optional["AnswerCache"]:
+        """Build from ``ANSWER_CACHE_*`` variables; ``None`` when ``ANSWER_CACHE_ENABLED=false``."""
+        if os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "false":
+            return None
+        ttl = float(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+        semantic = None
+        if os.environ.get("ANSWER_CACHE_SEMANTIC", "false").lower() == "true":
+            # Imported here so numpy is only needed when the semantic tier is on
+            from vertexchat.semantic_cache import SemanticCache
+            semantic = SemanticCache(threshold=float(os.environ.get("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0.95")), ttl=ttl)
+        return cls(
+            maxsize=int(os.environ.get("ANSWER_CACHE_SIZE", "1024")),
+            ttl=ttl,
+            sqlite_path=os.environ.get("ANSWER_CACHE_DB") or None,
+            response_type=response_type,
+            semantic=semantic,
+            coalesce=os.environ.get("ANSWER_CACHE_COALESCE", "true").lower() != "false",
+            recorder=recorder,
+            record_hits=os.environ.get("ANSWER_CACHE_RECORD_HITS", "true").lower() != "false",
+        )
+
+    def get(self, key: str):
+        value = self._memory.get(key)
+        if value is None and self._persistent is not None:
+            value = self._persistent.get(key)
+            if value is not None:
+                self.persistent_hits += 1
+                self._memory[key] = value
+        return value
+
+    def set(self, key: str, value) -> None:
+        self._memory[key] = value
+        if self._persistent is not None:
+            self._persistent.set(key, value)
+
+    async def _lookup(self, key: str):
+        """``get`` with the SQLite read on the worker pool instead of the event loop."""
+        value = self._memory.get(key)
+        if value is None and self._persistent is not None:
+            value = await run_sync(self._persistent.get, key)
+            if value is not None:
+                self.persistent_hits += 1
+                self._memory[key] = value
+        return value
+
+    async def get_or_call(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        query: str,
+        serving_config: str,
+        model_version: str = "",
+        preamble: str = "",
+        bypass: bool = False,
+        session: str = "",
+        record: Optional[Callable[[Any], Awaitable[Any]]] = None,
+    ):
+        """Return the cached response for ``query`` under this config, or await ``call()`` and cache it.
+
+        ``session`` names the session or conversation ``call`` sends the turn
+        to. On a hit, or when the response is shared from another caller's
+        identical in-flight call, ``record(response)`` (by default ``call()``)
+        still runs in the background, so the session records the turn.
+        """
+        if session:
+            await self.recorder.wait(session)
+        if bypass:
+            self.bypassed += 1
+            return await call()
+        key = cache_key(query, serving_config, model_version, preamble)
+        value = await self._lookup(key)
+        if value is not None:
+            self.hits += 1
+            logger.debug("answer cache hit %s", key[:12])
+            return self._hit(value, session, record, call)
+        namespace = cache_key("", serving_config, model_version, preamble)
+        if self._semantic is not None:
+            match = self._semantic.get(namespace, query)
+            if match is not None:
+                value, score = match
+                self.hits += 1
+                self.semantic_hits += 1
+                logger.debug("semantic cache hit %s (similarity %.3f)", key[:12], score)
+                # Not copied into the exact tiers: that would restart its TTL there
+                return self._hit(value, session, record, call)
+        if self._inflight is None:
+            self.misses += 1
+            return await self._call_and_store(call, key, namespace, query)
+        leader = key not in self._inflight
+        if leader:
+            self.misses += 1
+        value = await self._inflight.do(key, lambda: self._call_and_store(call, key, namespace, query))
+        # The leader's call went to the leader's session; a waiter's turn still has to reach its own
+        return value if leader else self._hit(value, session, record, call)
+
+    def _hit(self, value, session: str, record: Optional[Callable[[Any], Awaitable[Any]]], call: Callable[[], Awaitable[Any]]):
+        if session and self.record_hits:
+            self.recorder.record(session, (lambda: record(value)) if record is not None else call)
+        return value
+
+    async def _call_and_store(self, call: Callable[[], Awaitable[Any]], key: str, namespace: str, query: str):
+        value = await call()
+        self._memory[key] = value
+        if self._persistent is not None:
+            await run_sync(self._persistent.set, key, value)
+        if self._semantic is not None:
+            self._semantic.set(namespace, query, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "coalesced": self._inflight.coalesced if self._inflight is not None else 0,
+            "in_flight": len(self._inflight) if self._inflight is not None else 0,
+            "recording": len(self.recorder),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
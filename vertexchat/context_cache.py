@@ -0,0 +1,78 @@
+"""Upload a chat's attached documents once and refer to them by handle.
+
+A PDF attached to a Gemini chat turn stays in the history, so every follow-up
+question re-uploads the whole document. With a context cache,
+``ChatHistory.attach`` puts the session's documents in a Vertex AI
+``CachedContent``. Later requests go to a model bound to that cache, and the
+history keeps a one-line placeholder where the document was.
+
+``CONTEXT_CACHE``:
+
+* ``off`` (default) - attachments travel inline, as before
+* ``vertex`` - Vertex AI context caching (google-cloud-aiplatform >= 1.56).
+  With ``VERTEXCHAT_FAKE_BACKEND=true`` an in-process stand-in is used instead.
+
+Vertex only caches contexts above a minimum size, 32,768 tokens for Gemini
+1.5 (``CONTEXT_CACHE_MIN_TOKENS``). Smaller documents stay inline, where
+``ChatHistory``'s byte cap still bounds them. A cache lives for
+``CONTEXT_CACHE_TTL`` seconds (default 3600). A session that outlives it, or
+attaches another document, gets a new cache holding all of its documents,
+and the old cache is deleted.
+"""
+import datetime
+import logging
+import os
+import time
+from typing import Optional
+
+from vertexchat import fakes
+
+logger = logging.getLogger(__name__)
+
+
+class VertexContextCache:
+    """Creates ``CachedContent`` for ``model_name`` and models bound to it."""
+
+    def __init__(self, model_name: str, ttl: float = 3600, min_tokens: int = 32768, **model_kwargs):
+        self.model_name = model_name
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.model_kwargs = model_kwargs
+
+    def create(self, contents: list):
+        """Upload ``contents``; blocking, so call it through ``run_sync``."""
+        from vertexai.preview import caching
+
+        return caching.CachedContent.create(
+            model_name=self.model_name, contents=contents, ttl=datetime.timedelta(seconds=self.ttl)
+        )
+
+    def model(self, handle):
+        from vertexai.preview.generative_models import GenerativeModel
+
+        return GenerativeModel.from_cached_content(cached_content=handle, **self.model_kwargs)
+
+    def expires_at(self, handle) -> float:
+        return handle.expire_time.timestamp()
+
+    def delete(self, handle) -> None:
+        handle.delete()
+
+
+def context_cache_from_env(model_name: str, **model_kwargs) -> Optional[VertexContextCache]:
+    """The cache selected by ``CONTEXT_CACHE``, or ``None`` when it is off."""
+    mode = os.environ.get("CONTEXT_CACHE", "off").lower()
+    if mode == "off":
+        return None
+    if mode != "vertex":
+        raise ValueError(f"CONTEXT_CACHE must be off or vertex, not {mode!r}")
+    ttl = float(os.environ.get("CONTEXT_CACHE_TTL", "3600"))
+    min_tokens = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", "32768"))
+    if fakes.enabled():
+        return fakes.FakeContextCache(model_name, ttl=ttl, min_tokens=min_tokens)
+    return VertexContextCache(model_name, ttl=ttl, min_tokens=min_tokens, **model_kwargs)
+
+
+def expiring(cache, handle, margin: float = 60) -> bool:
+    """True when ``handle`` is gone or expires within ``margin`` seconds."""
+    return cache.expires_at(handle) - margin < time.time()
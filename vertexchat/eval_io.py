@@ -0,0 +1,206 @@
+"""Chunked input and incremental, mergeable output for offline evaluations.
+
+The eval script used to load the whole query CSV into a DataFrame, fill it in
+row by row and write it out at the end, so memory grew with the input and a
+crash lost everything not in the checkpoint. The pieces here keep memory flat:
+
+* ``read_rows`` streams ``(row index, query)`` pairs from the CSV ``chunksize``
+  rows at a time, optionally only one shard of them
+* results land in the ``Checkpoint`` JSONL as they finish (``run_batch`` with
+  ``collect=False`` keeps only the failures in memory)
+* ``merge_results`` joins one or more of those partial JSONL files back onto
+  the input, chunk by chunk, and writes CSV or Parquet (by the output's
+  extension) as it goes. Only a byte offset per row is held in memory.
+
+Each shard keeps its own checkpoint (``shard_path``), so shards running side
+by side never append to the same file, and ``shard_paths`` finds them all
+again for the merge. Partial files from several shards or from interrupted
+runs can be merged in any order. For a row found in more than one file, a successful record wins
+over an error, and otherwise the later file wins.
+"""
+import glob
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """``"2/8"`` -> ``(2, 8)``: this process handles rows whose index is 2 modulo 8."""
+    index, _, count = value.partition("/")
+    shard = (int(index), int(count or 1))
+    if not 0 <= shard[0] < shard[1]:
+        raise ValueError(f"shard must be I/N with 0 <= I < N, got {value!r}")
+    return shard
+
+
+def shard_path(path, shard: Tuple[int, int]) -> Path:
+    """``out.checkpoint.jsonl`` for shard ``(2, 8)`` -> ``out.shard2of8.checkpoint.jsonl``; unchanged for ``(0, 1)``."""
+    path = Path(path).expanduser()
+    index, count = shard
+    if count == 1:
+        return path
+    stem, _, rest = path.name.partition(".")
+    return path.with_name(f"{stem}.shard{index}of{count}.{rest}")
+
+
+def shard_paths(path) -> List[Path]:
+    """``path`` and every per-shard file of it (``shard_path``) on disk; ``path`` alone if there are none."""
+    path = Path(path).expanduser()
+    stem, _, rest = path.name.partition(".")
+    shards = sorted(path.parent.glob(f"{glob.escape(stem)}.shard*of*.{glob.escape(rest)}"))
+    return [path, *shards] if path.exists() or not shards else shards
+
+
+def read_rows(path, column: str, chunksize: int = 1000, shard: Tuple[int, int] = (0, 1)) -> Iterator[Tuple[int, Any]]:
+    """Yield ``(row index, value of column)`` for the CSV at ``path`` without loading it whole."""
+    import pandas as pd
+
+    index, count = shard
+    with pd.read_csv(Path(path).expanduser(), usecols=[column], chunksize=chunksize) as reader:
+        for chunk in reader:
+            for key, value in chunk[column].items():
+                if key % count == index:
+                    yield int(key), value
+
+
+class ResultIndex:
+    """Where the best record for each row is, across one or more partial JSONL files."""
+
+    def __init__(self, paths: Sequence):
+        self._files = []
+        # key -> (file number, byte offset, record is an error)
+        self._offsets: Dict[Hashable, Tuple[int, int, bool]] = {}
+        for path in paths:
+            path = Path(path).expanduser()
+            if not path.exists():
+                logger.warning("no partial results at %s", path)
+                continue
+            self._scan(len(self._files), path)
+            self._files.append(open(path, "rb"))
+
+    def _scan(self, number: int, path: Path) -> None:
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    record = None
+                if record is not None:
+                    error = "error" in record
+                    previous = self._offsets.get(record["key"])
+                    if previous is None or not error or previous[2]:
+                        self._offsets[record["key"]] = (number, offset, error)
+                offset += len(line)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        location = self._offsets.get(key)
+        if location is None:
+            return None
+        f = self._files[location[0]]
+        f.seek(location[1])
+        return json.loads(f.readline())
+
+    def close(self) -> None:
+        for f in self._files:
+            f.close()
+        self._files = []
+
+
+class _ParquetOutput:
+    def __init__(self, path: Path):
+        self.path = path
+        self._writer = None
+
+    def write(self, frame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            schema = table.schema
+            for number, column in enumerate(schema):
+                if pa.types.is_null(column.type):
+                    # Empty throughout the first chunk; results and free-text columns are strings
+                    schema = schema.set(number, pa.field(column.name, pa.string()))
+            table = table.cast(schema)
+            self._writer = pq.ParquetWriter(self.path, schema)
+        else:
+            # Later chunks take the first chunk's column types, e.g. when a column is empty in one chunk
+            table = pa.Table.from_pandas(frame, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+class _CsvOutput:
+    def __init__(self, path: Path):
+        self.path = path
+        self._header = True
+
+    def write(self, frame) -> None:
+        frame.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+        self._header = False
+
+    def close(self) -> None:
+        pass
+
+
+def merge_results(
+    input_path,
+    partials: Sequence,
+    output_path,
+    columns: Mapping[str, str],
+    chunksize: int = 1000,
+) -> Dict[str, Any]:
+    """Write the input rows with result columns joined on from ``partials``.
+
+    ``columns`` maps output column name -> record field, e.g.
+    ``{"Answers API": "answer"}``. Rows without a successful record get
+    empty result columns. Returns counts of rows written, answered, failed
+    (an error record only) and missing (no record at all).
+    """
+    import pandas as pd
+
+    output_path = Path(output_path).expanduser()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write next to the target and rename at the end, so a crash never leaves a truncated output;
+    # per process, as shards finishing together may merge at the same time
+    tmp_path = output_path.with_name(f"{output_path.name}.{os.getpid()}.partial")
+    output = _ParquetOutput(tmp_path) if output_path.suffix == ".parquet" else _CsvOutput(tmp_path)
+    index = ResultIndex(partials)
+    counts = {"rows": 0, "answered": 0, "failed": 0, "missing": 0}
+    try:
+        with pd.read_csv(Path(input_path).expanduser(), chunksize=chunksize) as reader:
+            for chunk in reader:
+                values: Dict[str, List[Any]] = {column: [] for column in columns}
+                for key in chunk.index:
+                    record = index.get(int(key))
+                    if record is None:
+                        counts["missing"] += 1
+                    elif "error" in record:
+                        counts["failed"] += 1
+                    else:
+                        counts["answered"] += 1
+                    ok = record is not None and "error" not in record
+                    for column, field in columns.items():
+                        values[column].append(record.get(field) if ok else None)
+                for column, column_values in values.items():
+                    chunk[column] = pd.Series(column_values, index=chunk.index, dtype="object")
+                output.write(chunk)
+                counts["rows"] += len(chunk)
+    finally:
+        output.close()
+        index.close()
+    tmp_path.replace(output_path)
+    return counts
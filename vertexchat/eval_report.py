@@ -0,0 +1,90 @@
+"""Per-config latency and answer-quality summaries of eval runs.
+
+Input is the JSONL records ``run_batch`` writes to its checkpoint, one per
+(config, query) pair, with at least ``config`` and either ``elapsed_s`` or
+``error``. Everything is computed with grouped pandas/NumPy operations over
+the whole frame, never a Python loop per record, so a matrix of a few
+hundred thousand calls summarizes in well under a second.
+
+``summarize`` returns one row per config:
+
+* ``calls``, ``error_rate``
+* ``p50_s``, ``p90_s``, ``p99_s``, ``mean_s`` - latency of successful calls
+* ``answered_rate`` - successful calls with an answer that was not skipped
+  (e.g. for ``ignore_low_relevant_content``)
+* ``answer_chars_p50``, ``answer_chars_mean``, ``citations_mean``,
+  ``cited_rate`` (answers with at least one citation)
+
+``pick_fastest`` chooses the lowest-p90 config that meets the error and
+answered-rate floors.
+"""
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+REPORT_FIELDS = ("key", "config", "elapsed_s", "error", "answer_chars", "citations", "skipped")
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def load_records(path, chunksize: int = 50000) -> pd.DataFrame:
+    """The report fields of every record in a checkpoint, read in chunks so answer texts are never all in memory."""
+    frames = []
+    with pd.read_json(Path(path).expanduser(), lines=True, chunksize=chunksize, dtype=False) as reader:
+        for chunk in reader:
+            frames.append(chunk.reindex(columns=list(REPORT_FIELDS)))
+    if not frames:
+        return pd.DataFrame(columns=list(REPORT_FIELDS))
+    records = pd.concat(frames, ignore_index=True)
+    # A resumed run appends a retry after the failed record; as in eval_io, a success wins, then the later record
+    order = records["error"].isna().sort_values(kind="stable").index
+    return records.loc[order].drop_duplicates("key", keep="last").sort_index()
+
+
+def summarize(records: pd.DataFrame, by: Sequence[str] = ("config",)) -> pd.DataFrame:
+    """One row of latency and answer statistics per config."""
+    by = list(by)
+    failed = records["error"].notna()
+    ok = records[~failed]
+    groups = records.groupby(by, sort=True)
+    ok_groups = ok.groupby(by, sort=True)
+
+    summary = pd.DataFrame({"calls": groups.size(), "error_rate": failed.groupby([records[key] for key in by]).mean()})
+    latency = ok_groups["elapsed_s"].quantile(list(QUANTILES)).unstack()
+    latency.columns = [f"p{round(q * 100)}_s" for q in latency.columns]
+    summary = summary.join(latency).join(ok_groups["elapsed_s"].mean().rename("mean_s"))
+
+    chars = pd.to_numeric(ok["answer_chars"], errors="coerce").fillna(0)
+    citations = pd.to_numeric(ok["citations"], errors="coerce").fillna(0)
+    skipped = ok["skipped"].eq(True)
+    answered = (chars > 0) & ~skipped
+    keys = [ok[key] for key in by]
+    summary = summary.join(pd.DataFrame({
+        # Over all calls, so errors count against it too
+        "answered_rate": answered.groupby(keys).sum(),
+        "answer_chars_p50": chars.groupby(keys).median(),
+        "answer_chars_mean": chars.groupby(keys).mean(),
+        "citations_mean": citations.groupby(keys).mean(),
+        "cited_rate": (citations > 0).groupby(keys).mean(),
+    }))
+    summary["answered_rate"] = summary["answered_rate"].fillna(0) / summary["calls"]
+    return summary
+
+
+def pick_fastest(summary: pd.DataFrame, max_error_rate: float = 0.01, min_answered_rate: float = 0.0) -> Optional[str]:
+    """The config with the lowest p90 among those within the error and answered-rate limits."""
+    acceptable = summary[(summary["error_rate"] <= max_error_rate) & (summary["answered_rate"] >= min_answered_rate)]
+    acceptable = acceptable[np.isfinite(acceptable["p90_s"])]
+    if acceptable.empty:
+        return None
+    return acceptable["p90_s"].idxmin()
+
+
+def format_summary(summary: pd.DataFrame) -> str:
+    formats = {
+        "error_rate": "{:.1%}".format, "answered_rate": "{:.1%}".format, "cited_rate": "{:.1%}".format,
+        "p50_s": "{:.2f}".format, "p90_s": "{:.2f}".format, "p99_s": "{:.2f}".format, "mean_s": "{:.2f}".format,
+        "answer_chars_p50": "{:.0f}".format, "answer_chars_mean": "{:.0f}".format, "citations_mean": "{:.1f}".format,
+    }
+    return summary.to_string(formatters=formats, na_rep="-")
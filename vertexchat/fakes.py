@@ -0,0 +1,444 @@
+"""In-process fake Discovery Engine and Gemini backends for load testing.
+
+Set ``VERTEXCHAT_FAKE_BACKEND=true`` and the apps talk to these stand-ins
+instead of Google Cloud, with no credentials or quota involved:
+
+* ``ConversationalSearch`` uses ``FakeConversationalSearchAsyncClient`` for
+  ``create_conversation``, ``converse_conversation``, ``update_conversation``,
+  ``answer_query`` and ``stream_answer_query``
+* the REST ``create_session`` call goes through an ``httpx.MockTransport``
+* ``vertexchat.auth.default_credentials`` returns ``FakeCredentials``
+* ``vertexchat.gemini.generative_model`` returns ``FakeGenerativeModel``
+* ``vertexchat.context_cache`` uses ``FakeContextCache``
+
+Each method draws its service time from a latency distribution and fails
+with ``ServiceUnavailable`` (HTTP 503 for REST) at a configurable rate:
+
+* ``VERTEXCHAT_FAKE_LATENCY_<METHOD>`` - ``fixed:S``, ``uniform:LO,HI`` or
+  ``lognormal:MEDIAN,SIGMA`` in seconds. For example,
+  ``VERTEXCHAT_FAKE_LATENCY_ANSWER_QUERY=lognormal:2.5,0.35``.
+  Streaming methods also have ``<METHOD>_FIRST_CHUNK`` for time to first chunk.
+* ``VERTEXCHAT_FAKE_LATENCY_SCALE`` - multiplies every latency (default 1)
+* ``VERTEXCHAT_FAKE_ERROR_RATE`` / ``VERTEXCHAT_FAKE_ERROR_RATE_<METHOD>`` -
+  probability that a call fails (default 0)
+* ``VERTEXCHAT_FAKE_STALL_RATE`` / ``VERTEXCHAT_FAKE_STALL_SECONDS`` - probability
+  that a call stalls, and for how much longer (default 0 / 5): a slow tail
+* ``VERTEXCHAT_FAKE_ENDPOINTS`` - per-endpoint overrides for the conversational
+  search client, ``HOST=SCALE[,ERROR_RATE[,STALL_RATE]];HOST=...``. Each listed
+  ``api_endpoint`` gets its own backend, so several local stand-in endpoints
+  can differ in speed, failures and tail.
+* ``VERTEXCHAT_FAKE_PREFILL_PER_1K_TOKENS`` - extra seconds before a Gemini
+  chat replies per 1000 input tokens, history included (default 0.02).
+  Tokens read from a cached context cost a quarter of that.
+* ``VERTEXCHAT_FAKE_SEED`` - seed for reproducible runs
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+from google.api_core import exceptions
+
+DEFAULT_LATENCY = {
+    "create_conversation": "lognormal:0.15,0.3",
+    "create_session": "lognormal:0.15,0.3",
+    "converse_conversation": "lognormal:2.0,0.35",
+    "update_conversation": "lognormal:0.1,0.3",
+    "answer_query": "lognormal:2.5,0.35",
+    "stream_answer_query": "lognormal:2.5,0.35",
+    "stream_answer_query_first_chunk": "lognormal:0.6,0.3",
+    "send_message": "lognormal:3.0,0.35",
+    "send_message_first_chunk": "lognormal:0.8,0.3",
+    "generate_content": "lognormal:1.5,0.35",
+    "create_cached_content": "lognormal:1.0,0.3",
+}
+
+_TOPICS = ["permit renewals", "parking tickets", "property tax", "trash pickup", "business licenses", "street repairs"]
+
+
+def enabled() -> bool:
+    return os.environ.get("VERTEXCHAT_FAKE_BACKEND", "false").lower() == "true"
+
+
+class Latency:
+    """A service-time distribution parsed from ``kind:args``."""
+
+    def __init__(self, spec: str, scale: float = 1.0):
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(arg) for arg in args.split(",") if arg]
+        self.scale = scale
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"unknown latency distribution {spec!r}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            seconds = self.args[0]
+        elif self.kind == "uniform":
+            seconds = rng.uniform(self.args[0], self.args[1])
+        else:
+            median, sigma = self.args
+            seconds = rng.lognormvariate(math.log(median), sigma)
+        return seconds * self.scale
+
+
+class FakeBackend:
+    """Latency and fault injection shared by all the fakes in a process."""
+
+    def __init__(self, latency: Dict[str, str], error_rates: Dict[str, float], default_error_rate: float = 0.0, scale: float = 1.0, seed: Optional[int] = None, prefill_per_1k_tokens: float = 0.02, stall_rate: float = 0.0, stall_seconds: float = 5.0):
+        self.latency = {method: Latency(spec, scale) for method, spec in latency.items()}
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds * scale
+        self.prefill_per_1k_tokens = prefill_per_1k_tokens * scale
+        self.error_rates = error_rates
+        self.default_error_rate = default_error_rate
+        self.rng = random.Random(seed)
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._ids = itertools.count(10**15)
+
+    @classmethod
+    def from_env(cls, scale: Optional[float] = None, error_rate: Optional[float] = None, stall_rate: Optional[float] = None) -> "FakeBackend":
+        """Configured from ``VERTEXCHAT_FAKE_*``; the arguments override the process-wide values."""
+        latency = {
+            method: os.environ.get(f"VERTEXCHAT_FAKE_LATENCY_{method.upper()}", spec)
+            for method, spec in DEFAULT_LATENCY.items()
+        }
+        error_rates = {
+            method: float(os.environ[f"VERTEXCHAT_FAKE_ERROR_RATE_{method.upper()}"])
+            for method in DEFAULT_LATENCY
+            if f"VERTEXCHAT_FAKE_ERROR_RATE_{method.upper()}" in os.environ
+        }
+        seed = os.environ.get("VERTEXCHAT_FAKE_SEED")
+        return cls(
+            latency,
+            error_rates,
+            default_error_rate=error_rate if error_rate is not None else float(os.environ.get("VERTEXCHAT_FAKE_ERROR_RATE", "0")),
+            scale=scale if scale is not None else float(os.environ.get("VERTEXCHAT_FAKE_LATENCY_SCALE", "1")),
+            seed=int(seed) if seed is not None else None,
+            prefill_per_1k_tokens=float(os.environ.get("VERTEXCHAT_FAKE_PREFILL_PER_1K_TOKENS", "0.02")),
+            stall_rate=stall_rate if stall_rate is not None else float(os.environ.get("VERTEXCHAT_FAKE_STALL_RATE", "0")),
+            stall_seconds=float(os.environ.get("VERTEXCHAT_FAKE_STALL_SECONDS", "5")),
+        )
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def sample(self, method: str) -> float:
+        seconds = self.latency[method].sample(self.rng)
+        if self.stall_rate and self.rng.random() < self.stall_rate:
+            seconds += self.stall_seconds
+        return seconds
+
+    def check(self, method: str) -> None:
+        """Count a call to ``method`` and raise if it is chosen to fail."""
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.rng.random() < self.error_rates.get(method, self.default_error_rate):
+            self.errors[method] = self.errors.get(method, 0) + 1
+            raise exceptions.ServiceUnavailable(f"fake {method} failure")
+
+    async def delay(self, method: str) -> None:
+        await asyncio.sleep(self.sample(method))
+        self.check(method)
+
+
+_backend: Optional[FakeBackend] = None
+
+
+_endpoint_backends: Dict[str, FakeBackend] = {}
+
+
+def backend(endpoint: Optional[str] = None) -> FakeBackend:
+    """The shared fake backend, or the one for ``endpoint`` when ``VERTEXCHAT_FAKE_ENDPOINTS`` lists it."""
+    global _backend
+    overrides = _endpoint_overrides()
+    if endpoint is not None and endpoint in overrides:
+        if endpoint not in _endpoint_backends:
+            _endpoint_backends[endpoint] = FakeBackend.from_env(*overrides[endpoint])
+        return _endpoint_backends[endpoint]
+    if _backend is None:
+        _backend = FakeBackend.from_env()
+    return _backend
+
+
+def _endpoint_overrides() -> Dict[str, tuple]:
+    overrides = {}
+    for entry in os.environ.get("VERTEXCHAT_FAKE_ENDPOINTS", "").split(";"):
+        host, _, values = entry.strip().partition("=")
+        if host:
+            overrides[host] = tuple(float(value) for value in values.split(",") if value)
+    return overrides
+
+
+def _topic(query: str) -> str:
+    return _TOPICS[int(hashlib.sha256(query.encode()).hexdigest(), 16) % len(_TOPICS)]
+
+
+def _answer_text(query: str) -> str:
+    topic = _topic(query)
+    return (
+        f"Here is what the city publishes about {topic}. "
+        f"Requests about {topic} can be submitted online or in person at any service center [1]. "
+        f"Most {topic} requests are processed within ten business days [1, 2]. "
+        f"Fees depend on the type of request and are listed on the fee schedule [3]."
+    )
+
+
+def _sources(query: str) -> List[Dict[str, str]]:
+    slug = _topic(query).replace(" ", "-")
+    return [
+        {"title": f"{_topic(query).title()} - part {i}", "uri": f"gs://fake-city-docs/{slug}/part-{i}.pdf"}
+        for i in range(1, 4)
+    ]
+
+
+class FakeConversationalSearchAsyncClient:
+    """Stand-in for ``ConversationalSearchServiceAsyncClient`` returning canned, query-derived responses."""
+
+    def __init__(self, discoveryengine, fake_backend: Optional[FakeBackend] = None, **client_kwargs):
+        self.discoveryengine = discoveryengine
+        endpoint = getattr(client_kwargs.get("client_options"), "api_endpoint", None)
+        self.backend = fake_backend or backend(endpoint)
+
+    async def create_conversation(self, parent: str, conversation=None, **kwargs):
+        await self.backend.delay("create_conversation")
+        return self.discoveryengine.Conversation(
+            name=f"{parent}/conversations/{self.backend.next_id()}",
+            state=self.discoveryengine.Conversation.State.IN_PROGRESS,
+        )
+
+    async def converse_conversation(self, request, **kwargs):
+        await self.backend.delay("converse_conversation")
+        de = self.discoveryengine
+        sources = _sources(request.query.input)
+        summary = de.SearchResponse.Summary(
+            summary_text=_answer_text(request.query.input),
+            summary_with_metadata=de.SearchResponse.Summary.SummaryWithMetadata(
+                references=[de.SearchResponse.Summary.Reference(title=s["title"], uri=s["uri"]) for s in sources],
+            ),
+        )
+        results = []
+        for i, source in enumerate(sources):
+            document = de.Document(id=str(i), name=f"documents/{i}")
+            document.derived_struct_data = {"title": source["title"], "link": source["uri"]}
+            results.append(de.SearchResponse.SearchResult(id=str(i), document=document))
+        return de.ConverseConversationResponse(
+            reply=de.Reply(summary=summary),
+            conversation=de.Conversation(name=request.name),
+            search_results=results,
+        )
+
+    async def update_conversation(self, conversation=None, update_mask=None, **kwargs):
+        await self.backend.delay("update_conversation")
+        return conversation
+
+    def _answer(self, query: str):
+        de = self.discoveryengine
+        sources = _sources(query)
+        references = [
+            de.Answer.Reference(
+                chunk_info=de.Answer.Reference.ChunkInfo(
+                    content="...",
+                    document_metadata=de.Answer.Reference.ChunkInfo.DocumentMetadata(title=s["title"], uri=s["uri"]),
+                )
+            )
+            for s in sources
+        ]
+        topic = _topic(query)
+        return de.Answer(
+            state=de.Answer.State.SUCCEEDED,
+            answer_text=_answer_text(query),
+            citations=[
+                de.Answer.Citation(sources=[de.Answer.CitationSource(reference_id=str(i))]) for i in range(len(sources))
+            ],
+            references=references,
+            related_questions=[
+                f"How long do {topic} take?",
+                f"What documents are needed for {topic}?",
+                f"How much do {topic} cost?",
+            ],
+        )
+
+    async def answer_query(self, request, **kwargs):
+        await self.backend.delay("answer_query")
+        return self.discoveryengine.AnswerQueryResponse(answer=self._answer(request.query.text), session=self.discoveryengine.Session(name=request.session))
+
+    async def stream_answer_query(self, request, **kwargs):
+        first = self.backend.sample("stream_answer_query_first_chunk")
+        total = max(first, self.backend.sample("stream_answer_query"))
+        await asyncio.sleep(first)
+        self.backend.check("stream_answer_query")
+        answer = self._answer(request.query.text)
+        words = answer.answer_text.split(" ")
+        chunks = [" ".join(words[i:i + 6]) + " " for i in range(0, len(words), 6)]
+        chunks[-1] = chunks[-1].rstrip()
+        de = self.discoveryengine
+
+        async def responses():
+            for i, chunk in enumerate(chunks):
+                if i:
+                    await asyncio.sleep((total - first) / (len(chunks) - 1))
+                if i < len(chunks) - 1:
+                    yield de.AnswerQueryResponse(answer=de.Answer(answer_text=chunk, state=de.Answer.State.STREAMING))
+            answer.answer_text = chunks[-1]
+            yield de.AnswerQueryResponse(answer=answer, session=de.Session(name=request.session))
+
+        return responses()
+
+
+def http_transport():
+    """``httpx.MockTransport`` answering the Discovery Engine REST calls the apps make."""
+    import httpx
+
+    fake = backend()
+
+    async def handle(request: "httpx.Request") -> "httpx.Response":
+        path = request.url.path
+        if request.method == "POST" and path.endswith("/sessions"):
+            await asyncio.sleep(fake.sample("create_session"))
+            try:
+                fake.check("create_session")
+            except exceptions.ServiceUnavailable as error:
+                return httpx.Response(503, json={"error": {"code": 503, "message": str(error)}})
+            parent = path.split("/v1beta/", 1)[-1].rsplit("/sessions", 1)[0]
+            body = json.loads(request.content or b"{}")
+            return httpx.Response(200, json={
+                "name": f"{parent}/sessions/{fake.next_id()}",
+                "state": "IN_PROGRESS",
+                "userPseudoId": body.get("userPseudoId", ""),
+            })
+        return httpx.Response(404, json={"error": {"code": 404, "message": f"fake backend has no {request.method} {path}"}})
+
+    return httpx.MockTransport(handle)
+
+
+class FakeCredentials:
+    """Credentials with a token that never needs refreshing."""
+
+    token = "fake-access-token"
+    expiry = None
+
+    def refresh(self, request) -> None:
+        pass
+
+
+class _Chunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeChatSession:
+    def __init__(self, fake_backend: FakeBackend, history=None, cached_contents=None):
+        self.backend = fake_backend
+        self.history = list(history or [])
+        self.cached_contents = list(cached_contents or [])
+
+    def _reply(self, content) -> str:
+        parts = content if isinstance(content, list) else [content]
+        prompt = " ".join(part for part in parts if isinstance(part, str))
+        attachments = len(parts) - sum(1 for part in parts if isinstance(part, str))
+        text = _answer_text(prompt)
+        if attachments:
+            text = f"The attached document ({attachments} file{'s' if attachments > 1 else ''}) covers this. " + text
+        return text
+
+    def _prefill(self) -> float:
+        """Seconds to read the whole input, which grows with the history."""
+        from vertexchat.history import part_tokens
+
+        def tokens(entries) -> int:
+            total = 0
+            for entry in entries:
+                parts = getattr(entry, "parts", entry)
+                total += sum(part_tokens(part) for part in (parts if isinstance(parts, list) else [parts]))
+            return total
+
+        tokens = tokens(self.history) + tokens(self.cached_contents) / 4
+        return self.backend.prefill_per_1k_tokens * tokens / 1000
+
+    async def send_message_async(self, content, stream: bool = False, **kwargs):
+        text = self._reply(content)
+        self.history.append(content)
+        prefill = self._prefill()
+        if not stream:
+            await asyncio.sleep(prefill)
+            await self.backend.delay("send_message")
+            self.history.append(text)
+            return _Chunk(text)
+        first = prefill + self.backend.sample("send_message_first_chunk")
+        total = max(first, prefill + self.backend.sample("send_message"))
+        await asyncio.sleep(first)
+        self.backend.check("send_message")
+        words = text.split(" ")
+        chunks = [" ".join(words[i:i + 8]) + " " for i in range(0, len(words), 8)]
+        self.history.append(text)
+
+        async def responses():
+            for i, chunk in enumerate(chunks):
+                if i:
+                    await asyncio.sleep((total - first) / max(1, len(chunks) - 1))
+                yield _Chunk(chunk)
+
+        return responses()
+
+
+class FakeGenerativeModel:
+    """Stand-in for ``vertexai.generative_models.GenerativeModel`` chats."""
+
+    def __init__(self, model_name: str, cached_content=None, **kwargs):
+        self.model_name = model_name
+        self.backend = backend()
+        self.cached_content = cached_content
+
+    def start_chat(self, history=None, **kwargs) -> FakeChatSession:
+        cached_contents = self.cached_content.contents if self.cached_content is not None else None
+        return FakeChatSession(self.backend, history, cached_contents)
+
+    async def generate_content_async(self, contents, **kwargs):
+        await self.backend.delay("generate_content")
+        prompt = contents if isinstance(contents, str) else " ".join(part for part in contents if isinstance(part, str))
+        return _Chunk(f"The user asked about {_topic(prompt)}; the assistant explained how to submit a request.")
+
+
+class FakeCachedContent:
+    def __init__(self, name: str, model_name: str, contents: list, expire_time: float):
+        self.name = name
+        self.model_name = model_name
+        self.contents = contents
+        self.expire_time = expire_time
+        self.deleted = False
+
+
+class FakeContextCache:
+    """Stand-in for ``vertexchat.context_cache.VertexContextCache``; contexts live in this process."""
+
+    def __init__(self, model_name: str, ttl: float = 3600, min_tokens: int = 32768, fake_backend: Optional[FakeBackend] = None):
+        self.model_name = model_name
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.backend = fake_backend or backend()
+        self.live: Dict[str, FakeCachedContent] = {}
+
+    def create(self, contents: list) -> FakeCachedContent:
+        # Runs on a worker thread, like the blocking Vertex call it replaces
+        time.sleep(self.backend.sample("create_cached_content"))
+        self.backend.check("create_cached_content")
+        name = f"projects/fake/locations/us-central1/cachedContents/{self.backend.next_id()}"
+        handle = FakeCachedContent(name, self.model_name, contents, time.time() + self.ttl)
+        self.live[name] = handle
+        return handle
+
+    def model(self, handle: FakeCachedContent) -> FakeGenerativeModel:
+        return FakeGenerativeModel(handle.model_name, cached_content=handle)
+
+    def expires_at(self, handle: FakeCachedContent) -> float:
+        return float("-inf") if handle.deleted else handle.expire_time
+
+    def delete(self, handle: FakeCachedContent) -> None:
+        handle.deleted = True
+        self.live.pop(handle.name, None)
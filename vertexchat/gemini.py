@@ -0,0 +1,49 @@
+"""Streaming helpers for Gemini chats rendered in Chainlit."""
+import logging
+import time
+from typing import Any, Dict
+
+from vertexchat import fakes
+from vertexchat.limiter import backend_limiter
+
+logger = logging.getLogger(__name__)
+
+
+def generative_model(model_name: str, **kwargs):
+    """``GenerativeModel(model_name)``, or the in-process fake when the fake backend is enabled."""
+    if fakes.enabled():
+        return fakes.FakeGenerativeModel(model_name, **kwargs)
+    from vertexai.generative_models import GenerativeModel
+
+    return GenerativeModel(model_name=model_name, **kwargs)
+
+
+async def stream_reply(chat, content, msg) -> Dict[str, Any]:
+    """Send ``content`` on ``chat`` in streaming mode and forward each chunk to ``msg``.
+
+    Returns the timings for the reply (``ttft_s`` is the time to the first
+    streamed token, ``total_s`` the time to the end of the stream) and records
+    them on ``msg.metadata``.
+    """
+    start = time.perf_counter()
+    ttft = None
+    limiter = backend_limiter("gemini")
+    if limiter is None:
+        responses = await chat.send_message_async(content, stream=True)
+    else:
+        responses = await limiter.stream(lambda: chat.send_message_async(content, stream=True))
+    async for chunk in responses:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. a trailing finish-reason chunk)
+            continue
+        if not text:
+            continue
+        if ttft is None:
+            ttft = time.perf_counter() - start
+        await msg.stream_token(text)
+    timings = {"ttft_s": ttft, "total_s": time.perf_counter() - start}
+    msg.metadata = {**(msg.metadata or {}), **timings}
+    logger.info("gemini reply ttft=%s total=%.3fs", "n/a" if ttft is None else f"{ttft:.3f}s", timings["total_s"])
+    return timings
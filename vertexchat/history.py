@@ -0,0 +1,314 @@
+"""Per-session Gemini chat history under a token and byte budget.
+
+gemini-image.py used one module-level ``ChatSession`` for every user, and it
+kept every turn, so each ``send_message`` re-sent everybody's transcript so
+far. ``ChatHistory`` holds one conversation per Chainlit session and starts a
+fresh ``ChatSession`` over a bounded window for each message:
+
+* the newest turns are kept while their estimated tokens fit ``max_tokens``
+* past ``max_bytes``, attachments in the oldest turns are first replaced by a
+  one-line placeholder, then whole turns are dropped
+* with a summarizer, dropped turns are folded into a running summary by a
+  background ``generate_content`` call, and the summary is sent ahead of the
+  window in place of those turns
+* with a context cache (``vertexchat.context_cache``), ``attach`` uploads the
+  session's documents once, and later turns refer to them by handle
+
+Environment: ``CHAT_HISTORY_MAX_TOKENS`` (default 32000),
+``CHAT_HISTORY_MAX_BYTES`` (default 8 MiB), ``CHAT_HISTORY_SUMMARIZE``
+(default ``false``).
+"""
+import asyncio
+import logging
+import os
+import re
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from vertexchat.aio import run_sync
+from vertexchat.context_cache import expiring
+from vertexchat.limiter import limited
+
+logger = logging.getLogger(__name__)
+
+# Gemini bills an image, and each page of a PDF, as a fixed 258 tokens
+TOKENS_PER_IMAGE = 258
+# Last resort for PDFs preprocessing did not count; misses pages kept in compressed object streams
+_PDF_PAGE = re.compile(rb"/Type\s*/Page(?!s)")
+# Page counts of PDF parts, from preprocessing (``FileInfo.pages``)
+_pdf_pages: "weakref.WeakKeyDictionary[Any, int]" = weakref.WeakKeyDictionary()
+SUMMARY_MAX_CHARS = 2000
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation between a user and an assistant. "
+    "Keep names, numbers, decisions and open questions; drop pleasantries. "
+    "Answer with the new summary only, at most {limit} characters.\n\n"
+    "Current summary:\n{summary}\n\nNew turns:\n{transcript}"
+)
+
+
+def _raw(part):
+    # vertexai Part wraps the gapic Part; the fakes pass gapic parts or strings around directly
+    return getattr(part, "_raw_part", part)
+
+
+def set_pdf_pages(part, pages: int) -> None:
+    """Record the page count of the PDF in ``part``, as found by preprocessing, for ``part_tokens``."""
+    _pdf_pages[part] = pages
+
+
+def _known_pages(part) -> Optional[int]:
+    try:
+        return _pdf_pages.get(part)
+    except TypeError:
+        # Proto messages are unhashable; only parts from preprocessing are recorded
+        return None
+
+
+def part_tokens(part) -> int:
+    """Rough input-token estimate for one part: 4 characters a token, 258 per image or PDF page."""
+    if isinstance(part, str):
+        return len(part) // 4 + 1
+    raw = _raw(part)
+    if raw.text:
+        return len(raw.text) // 4 + 1
+    mime_type = raw.inline_data.mime_type or raw.file_data.mime_type
+    if mime_type == "application/pdf":
+        pages = _known_pages(part)
+        if pages is None and raw.inline_data.data:
+            pages = len(_PDF_PAGE.findall(raw.inline_data.data))
+        return TOKENS_PER_IMAGE * max(1, pages or 1)
+    return TOKENS_PER_IMAGE
+
+
+def part_bytes(part) -> int:
+    """Bytes the part adds to a request."""
+    if isinstance(part, str):
+        return len(part.encode("utf-8"))
+    raw = _raw(part)
+    return type(raw).pb(raw).ByteSize()
+
+
+def _is_attachment(part) -> bool:
+    return not isinstance(part, str) and not _raw(part).text
+
+
+def _describe(part, note: str = "earlier attachment omitted") -> str:
+    raw = _raw(part)
+    mime_type = raw.inline_data.mime_type or raw.file_data.mime_type or "file"
+    return f"[{note}: {mime_type}, {part_bytes(part)} bytes]"
+
+
+class Turn:
+    """One user message (text and attachments as sent) and the model's reply."""
+
+    __slots__ = ("parts", "reply", "tokens", "nbytes", "_contents")
+
+    def __init__(self, parts: List[Any], reply: str):
+        self.parts = parts
+        self.reply = reply
+        self._contents = None
+        self._measure()
+
+    def _measure(self) -> None:
+        self.tokens = sum(part_tokens(part) for part in self.parts) + part_tokens(self.reply)
+        self.nbytes = sum(part_bytes(part) for part in self.parts) + part_bytes(self.reply)
+
+    def strip_attachments(self) -> int:
+        """Replace attachments with a placeholder; returns the bytes freed."""
+        if not any(_is_attachment(part) for part in self.parts):
+            return 0
+        before = self.nbytes
+        self.parts = [_describe(part) if _is_attachment(part) else part for part in self.parts]
+        self._contents = None
+        self._measure()
+        return before - self.nbytes
+
+    def contents(self) -> list:
+        if self._contents is None:
+            from vertexai.generative_models import Content, Part
+
+            user = [Part.from_text(part) if isinstance(part, str) else part for part in self.parts]
+            self._contents = [
+                Content(role="user", parts=user),
+                Content(role="model", parts=[Part.from_text(self.reply)]),
+            ]
+        return self._contents
+
+    def transcript(self) -> str:
+        text = " ".join(part if isinstance(part, str) else _describe(part) for part in self.parts)
+        return f"User: {text}\nAssistant: {self.reply}"
+
+
+class ChatHistory:
+    """The bounded conversation of one session with ``model``.
+
+    ``summarizer`` is a model with ``generate_content_async``; without it
+    turns that fall out of the window are forgotten.
+    """
+
+    def __init__(self, model, max_tokens: int = 32000, max_bytes: int = 8 << 20, summarizer=None, context_cache=None):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_bytes = max_bytes
+        self.summarizer = summarizer
+        self.context_cache = context_cache
+        self.documents: List[Any] = []
+        self.uploaded_bytes = 0
+        self._context = None
+        self._context_model = None
+        self.turns: Deque[Turn] = deque()
+        self.tokens = 0
+        self.nbytes = 0
+        self.summary: Optional[str] = None
+        self.dropped = 0
+        self.stripped_bytes = 0
+        self._pending: List[Turn] = []
+        self._summary_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, model, context_cache=None) -> "ChatHistory":
+        summarize = os.environ.get("CHAT_HISTORY_SUMMARIZE", "false").lower() == "true"
+        return cls(
+            model,
+            max_tokens=int(os.environ.get("CHAT_HISTORY_MAX_TOKENS", "32000")),
+            max_bytes=int(os.environ.get("CHAT_HISTORY_MAX_BYTES", str(8 << 20))),
+            summarizer=model if summarize else None,
+            context_cache=context_cache,
+        )
+
+    async def attach(self, content) -> list:
+        """Move attachments in ``content`` into the session's cached context.
+
+        Returns the content to send, with each cached document replaced by a
+        placeholder. Content comes back unchanged when there is no context
+        cache, the documents are below its minimum size, or creating the
+        cache fails.
+        """
+        parts = list(content) if isinstance(content, list) else [content]
+        attachments = [part for part in parts if _is_attachment(part)]
+        if self.context_cache is None:
+            return parts
+        if not attachments and (self._context is None or not expiring(self.context_cache, self._context)):
+            return parts
+        documents = self.documents + attachments
+        if sum(part_tokens(part) for part in documents) < self.context_cache.min_tokens:
+            return parts
+        from vertexai.generative_models import Content, Part
+
+        contents = [
+            Content(role="user", parts=documents),
+            Content(role="model", parts=[Part.from_text("I have read the attached documents.")]),
+        ]
+        try:
+            async with limited("gemini"):
+                handle = await run_sync(self.context_cache.create, contents)
+        except Exception:
+            logger.warning("Could not cache %d documents; sending them inline", len(documents), exc_info=True)
+            if self._context is not None and expiring(self.context_cache, self._context):
+                # Past its TTL the old context is no use; the earlier documents are lost to the model
+                self._context = self._context_model = None
+                self.documents = []
+            return parts
+        previous, self._context = self._context, handle
+        self._context_model = self.context_cache.model(handle)
+        self.documents = documents
+        self.uploaded_bytes += sum(part_bytes(part) for part in documents)
+        if previous is not None:
+            asyncio.get_running_loop().create_task(self._delete(previous))
+        return [_describe(part, "attached document, in the cached context") if _is_attachment(part) else part for part in parts]
+
+    async def _delete(self, handle) -> None:
+        try:
+            await run_sync(self.context_cache.delete, handle)
+        except Exception:
+            logger.warning("Could not delete cached context %s", getattr(handle, "name", handle), exc_info=True)
+
+    async def close(self) -> None:
+        """Delete the session's cached context, if any."""
+        if self._context is not None:
+            handle, self._context, self._context_model = self._context, None, None
+            await self._delete(handle)
+
+    def _summary_contents(self) -> list:
+        if not self.summary:
+            return []
+        from vertexai.generative_models import Content, Part
+
+        return [
+            Content(role="user", parts=[Part.from_text(f"Summary of our conversation so far: {self.summary}")]),
+            Content(role="model", parts=[Part.from_text("Understood.")]),
+        ]
+
+    def start_chat(self, **kwargs):
+        """A ``ChatSession`` primed with the summary and the current window."""
+        history = self._summary_contents()
+        for turn in self.turns:
+            history.extend(turn.contents())
+        model = self._context_model if self._context_model is not None else self.model
+        return model.start_chat(history=history, **kwargs)
+
+    def request_size(self, content) -> Tuple[int, int]:
+        """Estimated (tokens, bytes) of the history plus ``content`` sent as the next message."""
+        parts = content if isinstance(content, list) else [content]
+        summary_tokens = part_tokens(self.summary) if self.summary else 0
+        return (
+            self.tokens + summary_tokens + sum(part_tokens(part) for part in parts),
+            self.nbytes + (part_bytes(self.summary) if self.summary else 0) + sum(part_bytes(part) for part in parts),
+        )
+
+    def record(self, content, reply: str) -> None:
+        """Append a finished exchange and compact the history back under budget."""
+        turn = Turn(list(content) if isinstance(content, list) else [content], reply)
+        self.turns.append(turn)
+        self.tokens += turn.tokens
+        self.nbytes += turn.nbytes
+        self._compact()
+
+    def _compact(self) -> None:
+        for turn in self.turns:
+            if self.nbytes <= self.max_bytes:
+                break
+            tokens = turn.tokens
+            freed = turn.strip_attachments()
+            self.nbytes -= freed
+            self.tokens += turn.tokens - tokens
+            self.stripped_bytes += freed
+        dropped = []
+        while len(self.turns) > 1 and (self.tokens > self.max_tokens or self.nbytes > self.max_bytes):
+            turn = self.turns.popleft()
+            self.tokens -= turn.tokens
+            self.nbytes -= turn.nbytes
+            dropped.append(turn)
+        self.dropped += len(dropped)
+        if dropped and self.summarizer is not None:
+            self._pending.extend(dropped)
+            if self._summary_task is None or self._summary_task.done():
+                self._summary_task = asyncio.get_running_loop().create_task(self._summarize())
+
+    async def _summarize(self) -> None:
+        while self._pending:
+            turns, self._pending = self._pending, []
+            prompt = SUMMARY_PROMPT.format(
+                limit=SUMMARY_MAX_CHARS,
+                summary=self.summary or "(none)",
+                transcript="\n".join(turn.transcript() for turn in turns),
+            )
+            try:
+                async with limited("gemini"):
+                    response = await self.summarizer.generate_content_async(prompt)
+                self.summary = response.text.strip()[:SUMMARY_MAX_CHARS]
+            except Exception:
+                logger.warning("Could not summarize %d dropped turns; they are forgotten", len(turns), exc_info=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "turns": len(self.turns),
+            "tokens": self.tokens,
+            "bytes": self.nbytes,
+            "dropped_turns": self.dropped,
+            "stripped_bytes": self.stripped_bytes,
+            "summary_chars": len(self.summary or ""),
+            "cached_documents": len(self.documents) if self._context is not None else 0,
+            "uploaded_bytes": self.uploaded_bytes,
+        }
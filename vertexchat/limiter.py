@@ -0,0 +1,291 @@
+"""Process-wide admission control for Discovery Engine and Gemini calls.
+
+Nothing used to bound how many backend calls a process had in flight, so a
+traffic spike ran straight into quota 429s for every user at once.
+``AdaptiveLimiter`` caps concurrent calls per backend and adapts the cap
+with AIMD:
+
+* each successful call raises the limit by ``1/limit``, about one per round
+  trip at full load, but only while the limit is actually in use
+* a quota or overload error (429, ``ResourceExhausted``, 503) halves it, at
+  most once per ``cooldown`` seconds so one burst of errors counts once
+
+Calls beyond the limit wait in a FIFO queue of at most ``max_queue``. A call
+that finds the queue full, or waits longer than ``queue_timeout``, fails at
+once with ``Overloaded``. ``busy_on_overload`` turns that into a short "busy"
+reply in a Chainlit handler, instead of an error after a long wait.
+
+``backend_limiter("discoveryengine")`` and ``backend_limiter("gemini")`` are
+the shared instances used by ``vertexchat.aio``, ``vertexchat.rest``,
+``vertexchat.gemini`` and ``vertexchat.history``. When ``prometheus_client``
+is installed, the live limit, in-flight calls, queue depth and rejections
+are exported with the other metrics:
+
+* ``vertexchat_backend_limit{backend}``
+* ``vertexchat_backend_in_flight{backend}``
+* ``vertexchat_backend_queue_depth{backend}``
+* ``vertexchat_backend_rejected_total{backend, reason}``
+* ``vertexchat_backend_overloads_total{backend}``
+
+Environment: ``BACKEND_LIMITER_ENABLED`` (default ``true``), and per backend
+``<NAME>_LIMIT_INITIAL`` (16), ``<NAME>_LIMIT_MIN`` (1), ``<NAME>_LIMIT_MAX``
+(128), ``<NAME>_QUEUE_MAX`` (64), ``<NAME>_QUEUE_TIMEOUT`` (10 s), with
+``NAME`` being ``DISCOVERYENGINE`` or ``GEMINI``.
+"""
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from google.api_core import exceptions as core_exceptions
+
+logger = logging.getLogger(__name__)
+
+BUSY_MESSAGE = "We're getting a lot of questions right now. Please try again in a few seconds."
+
+# Errors that mean the backend wants less traffic from us
+OVERLOAD_ERRORS = (
+    core_exceptions.TooManyRequests,
+    core_exceptions.ResourceExhausted,
+    core_exceptions.ServiceUnavailable,
+)
+_OVERLOAD_STATUS = frozenset({429, 503})
+
+try:
+    import prometheus_client
+except ImportError:  # pragma: no cover - optional dependency
+    prometheus_client = None
+
+if prometheus_client is not None:
+    LIMIT = prometheus_client.Gauge("vertexchat_backend_limit", "Current adaptive concurrency limit", ["backend"])
+    IN_FLIGHT = prometheus_client.Gauge("vertexchat_backend_in_flight", "Backend calls in flight", ["backend"])
+    QUEUE_DEPTH = prometheus_client.Gauge("vertexchat_backend_queue_depth", "Backend calls waiting for a slot", ["backend"])
+    REJECTED = prometheus_client.Counter(
+        "vertexchat_backend_rejected", "Backend calls refused by the limiter", ["backend", "reason"]
+    )
+    OVERLOADS = prometheus_client.Counter(
+        "vertexchat_backend_overloads", "Quota or overload errors that lowered the limit", ["backend"]
+    )
+
+
+class Overloaded(Exception):
+    """The limiter refused a call: its queue was full, or the wait for a slot timed out."""
+
+    def __init__(self, backend: str, reason: str):
+        super().__init__(f"{backend} is overloaded ({reason})")
+        self.backend = backend
+        self.reason = reason
+
+
+def is_overload(error: BaseException) -> bool:
+    """A quota or overload error, from a gRPC client or an ``httpx`` REST call."""
+    if isinstance(error, OVERLOAD_ERRORS):
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) in _OVERLOAD_STATUS
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a bounded FIFO wait queue for one backend."""
+
+    def __init__(
+        self,
+        name: str,
+        initial: float = 16,
+        min_limit: float = 1,
+        max_limit: float = 128,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0,
+        backoff: float = 0.5,
+        cooldown: float = 1.0,
+    ):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.overloads = 0
+        self._publish()
+
+    @classmethod
+    def from_env(cls, name: str) -> "AdaptiveLimiter":
+        prefix = name.upper()
+        return cls(
+            name,
+            initial=float(os.environ.get(f"{prefix}_LIMIT_INITIAL", "16")),
+            min_limit=float(os.environ.get(f"{prefix}_LIMIT_MIN", "1")),
+            max_limit=float(os.environ.get(f"{prefix}_LIMIT_MAX", "128")),
+            max_queue=int(os.environ.get(f"{prefix}_QUEUE_MAX", "64")),
+            queue_timeout=float(os.environ.get(f"{prefix}_QUEUE_TIMEOUT", "10")),
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _publish(self) -> None:
+        if prometheus_client is not None:
+            LIMIT.labels(self.name).set(self.limit)
+            IN_FLIGHT.labels(self.name).set(self.in_flight)
+            QUEUE_DEPTH.labels(self.name).set(len(self._waiters))
+
+    def _reject(self, reason: str) -> Overloaded:
+        self.rejected += 1
+        if prometheus_client is not None:
+            REJECTED.labels(self.name, reason).inc()
+        logger.debug("%s limiter rejected a call (%s): limit %.1f, %d in flight, %d queued",
+                     self.name, reason, self.limit, self.in_flight, len(self._waiters))
+        return Overloaded(self.name, reason)
+
+    async def acquire(self) -> None:
+        """Wait for a slot; raises ``Overloaded`` when the queue is full or the wait times out."""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            self._publish()
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the caller went away: hand the slot on
+                self._release_slot()
+            else:
+                waiter.cancel()
+                self._discard(waiter)
+            raise
+        if not waiter.done():
+            waiter.cancel()
+            self._discard(waiter)
+            raise self._reject("queue_timeout")
+        self.admitted += 1
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._publish()
+
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+        self._publish()
+
+    def release(self, error: Optional[BaseException] = None) -> None:
+        """Give the slot back, adapting the limit to how the call went."""
+        if error is None:
+            # Only grow while the limit is what holds calls back, or it drifts up unused
+            if self.in_flight >= int(self.limit) - 1 or self._waiters:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        elif is_overload(error):
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.overloads += 1
+                if prometheus_client is not None:
+                    OVERLOADS.labels(self.name).inc()
+                logger.warning("%s overloaded (%r); limit lowered to %.1f", self.name, error, self.limit)
+        self._release_slot()
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a slot for the enclosed call."""
+        await self.acquire()
+        try:
+            yield
+        except BaseException as error:
+            self.release(error)
+            raise
+        self.release()
+
+    async def stream(self, open_stream: Callable[[], Awaitable[Any]]) -> AsyncIterator:
+        """Open a streaming call under a slot that is held until the stream ends or is closed."""
+        await self.acquire()
+        try:
+            responses = await open_stream()
+        except BaseException as error:
+            self.release(error)
+            raise
+        return self._held(responses)
+
+    async def _held(self, responses) -> AsyncIterator:
+        error = None
+        try:
+            async for response in responses:
+                yield response
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.release(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "overloads": self.overloads,
+        }
+
+
+_limiters: Dict[str, Optional[AdaptiveLimiter]] = {}
+
+
+def backend_limiter(name: str) -> Optional[AdaptiveLimiter]:
+    """The process-wide limiter for backend ``name``; ``None`` when ``BACKEND_LIMITER_ENABLED=false``."""
+    if name not in _limiters:
+        enabled = os.environ.get("BACKEND_LIMITER_ENABLED", "true").lower() != "false"
+        _limiters[name] = AdaptiveLimiter.from_env(name) if enabled else None
+    return _limiters[name]
+
+
+@contextlib.asynccontextmanager
+async def limited(name: str) -> AsyncIterator[None]:
+    """``backend_limiter(name).slot()``, or nothing when limiting is off."""
+    limiter = backend_limiter(name)
+    if limiter is None:
+        yield
+        return
+    async with limiter.slot():
+        yield
+
+
+def busy_on_overload(handler):
+    """Decorate a Chainlit handler to answer with ``BUSY_MESSAGE`` when a backend refuses the call."""
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await handler(*args, **kwargs)
+        except Overloaded as error:
+            import chainlit as cl
+
+            logger.warning("told the user to retry: %s", error)
+            await cl.Message(content=BUSY_MESSAGE).send()
+
+    return wrapper
@@ -0,0 +1,149 @@
+"""Per-stage latency metrics for the chat handlers.
+
+``StageMetrics`` times each stage of a message - session lookup, request
+build, the RPC, reference rendering, the Chainlit send - into Prometheus
+histograms, so a p99 regression can be pinned on one stage:
+
+* ``vertexchat_stage_seconds{app, stage}`` - one observation per stage per message
+* ``vertexchat_message_seconds{app, outcome}`` - the whole handler, ``ok`` or ``error``
+
+``serve_metrics()`` exposes them on a separate port that only listens on
+localhost by default (``VERTEXCHAT_METRICS_PORT``, 9464, and
+``VERTEXCHAT_METRICS_ADDR``, 127.0.0.1), so a public deployment does not
+publish them. ``VERTEXCHAT_METRICS_ON_APP=true`` instead adds an
+unauthenticated ``/metrics`` route to the Chainlit server itself.
+
+With ``VERTEXCHAT_OTEL=true`` every message and stage is also an
+OpenTelemetry span. The exporter is configured the usual way through the
+``OTEL_*`` environment variables. Both libraries are optional: without
+``prometheus_client`` the timings are only logged at debug level, and without
+``opentelemetry`` no spans are recorded.
+"""
+import contextlib
+import logging
+import os
+import time
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+try:
+    import prometheus_client
+except ImportError:  # pragma: no cover - optional dependency
+    prometheus_client = None
+
+if prometheus_client is not None:
+    STAGE_SECONDS = prometheus_client.Histogram(
+        "vertexchat_stage_seconds", "Time spent in one stage of a chat handler", ["app", "stage"], buckets=BUCKETS
+    )
+    MESSAGE_SECONDS = prometheus_client.Histogram(
+        "vertexchat_message_seconds", "Time to handle one chat message end to end", ["app", "outcome"], buckets=BUCKETS
+    )
+
+_tracer = None
+_served = False
+
+
+def _get_tracer():
+    global _tracer
+    if _tracer is not None or os.environ.get("VERTEXCHAT_OTEL", "false").lower() != "true":
+        return _tracer
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("VERTEXCHAT_OTEL is set but opentelemetry-api is not installed; spans are disabled")
+        return None
+    _configure_tracer_provider(trace)
+    _tracer = trace.get_tracer("vertexchat")
+    return _tracer
+
+
+def _configure_tracer_provider(trace) -> None:
+    """Install an OTLP-exporting SDK provider unless the process already has one."""
+    if type(trace.get_tracer_provider()).__name__ != "ProxyTracerProvider":
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("opentelemetry-sdk / OTLP exporter not installed; spans go to any provider configured elsewhere")
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": os.environ.get("OTEL_SERVICE_NAME", "vertexchat")}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+
+
+class StageMetrics:
+    """Stage timers for one app; ``app`` becomes the ``app`` label."""
+
+    def __init__(self, app: str):
+        self.app = app
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Record a duration measured elsewhere (e.g. time to first streamed token)."""
+        if prometheus_client is not None:
+            STAGE_SECONDS.labels(self.app, stage).observe(seconds)
+        logger.debug("%s %s %.4fs", self.app, stage, seconds)
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as stage ``name``."""
+        tracer = _get_tracer()
+        span = tracer.start_as_current_span(name) if tracer is not None else contextlib.nullcontext()
+        start = time.perf_counter()
+        with span:
+            try:
+                yield
+            finally:
+                self.observe(name, time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def message(self, name: str = "on_message") -> Iterator[None]:
+        """Time a whole handler; stages inside it become child spans."""
+        tracer = _get_tracer()
+        span = tracer.start_as_current_span(name, attributes={"vertexchat.app": self.app}) if tracer is not None else contextlib.nullcontext()
+        start = time.perf_counter()
+        outcome = "error"
+        with span:
+            try:
+                yield
+                outcome = "ok"
+            finally:
+                seconds = time.perf_counter() - start
+                if prometheus_client is not None:
+                    MESSAGE_SECONDS.labels(self.app, outcome).observe(seconds)
+                logger.debug("%s %s %s %.4fs", self.app, name, outcome, seconds)
+
+
+def serve_metrics(port: Optional[int] = None) -> None:
+    """Expose ``/metrics`` once per process.
+
+    Serves on ``port`` (or ``VERTEXCHAT_METRICS_PORT``) bound to
+    ``VERTEXCHAT_METRICS_ADDR``, or on the Chainlit server when
+    ``VERTEXCHAT_METRICS_ON_APP=true``.
+    """
+    global _served
+    if _served or prometheus_client is None:
+        return
+    _served = True
+    if os.environ.get("VERTEXCHAT_METRICS_ON_APP", "false").lower() != "true":
+        port = port or int(os.environ.get("VERTEXCHAT_METRICS_PORT", "9464"))
+        addr = os.environ.get("VERTEXCHAT_METRICS_ADDR", "127.0.0.1")
+        try:
+            prometheus_client.start_http_server(port, addr=addr)
+        except OSError:
+            logger.warning("Could not serve metrics on %s:%d", addr, port, exc_info=True)
+        return
+    from chainlit.server import app
+    from starlette.responses import Response
+    from starlette.routing import Route
+
+    async def metrics(request):
+        return Response(prometheus_client.generate_latest(), media_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+    # Ahead of Chainlit's catch-all route, which would otherwise serve the UI for /metrics
+    app.router.routes.insert(0, Route("/metrics", metrics, methods=["GET"]))
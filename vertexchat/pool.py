@@ -0,0 +1,125 @@
+"""Pre-warmed pool of conversations / Answers API sessions.
+
+Opening a chat used to block on a ``create_conversation`` RPC (or a token
+refresh plus a REST call for Answers sessions) before the welcome message
+could render. ``WarmPool`` keeps a few ready-made resources around, hands one
+out without waiting, and refills in the background. When the pool is empty
+the caller gets ``None`` and creates one lazily on the first message instead.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Generic, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class WarmPool(Generic[T]):
+    """Keep up to ``size`` resources created by ``factory`` ready for use.
+
+    Items older than ``max_age`` seconds are discarded rather than handed out.
+    Chainlit loads the app module before its event loop is running, so the
+    refill task cannot start at import: ``start_with_server()`` starts it when
+    the server starts, and otherwise it starts on first use.
+    """
+
+    def __init__(self, factory: Callable[[], Awaitable[T]], size: int = 4, max_age: float = 1800, refill_concurrency: int = 2):
+        self.factory = factory
+        self.size = size
+        self.max_age = max_age
+        self.refill_concurrency = refill_concurrency
+        self._items: Deque[Tuple[float, T]] = deque()
+        self._pending = 0
+        self._refill_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._failures = 0
+        self.served_warm = 0
+        self.served_cold = 0
+
+    @classmethod
+    def from_env(cls, factory: Callable[[], Awaitable[T]], prefix: str = "CONVERSATION_POOL") -> "WarmPool[T]":
+        return cls(
+            factory,
+            size=int(os.environ.get(f"{prefix}_SIZE", "4")),
+            max_age=float(os.environ.get(f"{prefix}_MAX_AGE", "1800")),
+        )
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def start(self) -> None:
+        """Start the background refill task on the running loop (idempotent)."""
+        if self.size <= 0 or (self._refill_task is not None and not self._refill_task.done()):
+            return
+        self._wakeup = asyncio.Event()
+        self._refill_task = asyncio.get_running_loop().create_task(self._refill())
+        self._wakeup.set()
+
+    def start_with_server(self) -> None:
+        """Start filling the pool as the Chainlit server starts, so the first chat after a cold start is warm too."""
+        from chainlit.server import app
+
+        lifespan = app.router.lifespan_context
+
+        @contextlib.asynccontextmanager
+        async def warm_lifespan(server_app):
+            self.start()
+            async with lifespan(server_app) as state:
+                yield state
+
+        app.router.lifespan_context = warm_lifespan
+
+    def take_nowait(self) -> Optional[T]:
+        """Return a ready resource, or ``None`` if none is available right now."""
+        self.start()
+        now = time.monotonic()
+        item = None
+        while self._items:
+            created, candidate = self._items.popleft()
+            if now - created <= self.max_age:
+                item = candidate
+                break
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if item is not None:
+            self.served_warm += 1
+        return item
+
+    async def get(self) -> T:
+        """Return a ready resource, creating one inline if the pool is empty."""
+        item = self.take_nowait()
+        if item is None:
+            self.served_cold += 1
+            item = await self.factory()
+        return item
+
+    async def _create_one(self) -> None:
+        try:
+            item = await self.factory()
+        except Exception:
+            # Back off so a failing backend is not hammered by refills
+            self._failures += 1
+            delay = min(60.0, 5.0 * 2 ** (self._failures - 1))
+            logger.exception("warm pool refill failed (%d in a row); retrying in %.0fs", self._failures, delay)
+            await asyncio.sleep(delay)
+        else:
+            if self._failures:
+                logger.info("warm pool refill recovered after %d failures", self._failures)
+            self._failures = 0
+            self._items.append((time.monotonic(), item))
+        finally:
+            self._pending -= 1
+
+    async def _refill(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while len(self._items) + self._pending < self.size:
+                batch = min(self.refill_concurrency, self.size - len(self._items) - self._pending)
+                self._pending += batch
+                await asyncio.gather(*(self._create_one() for _ in range(batch)))
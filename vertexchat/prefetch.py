@@ -0,0 +1,149 @@
+"""Speculative prefetch of the related questions shown under an answer.
+
+Users click the suggested related questions often, and each click used to
+cost a full ``answer_query`` round trip. After each answer, ``Prefetcher``
+starts answering the top few related questions in the background. A click
+then awaits the task that is already running or finished instead of issuing
+a new call.
+
+Prefetching is bounded three ways:
+
+* at most ``concurrency`` prefetch calls are in flight. Extra prefetches are
+  skipped, not queued, because a queued prefetch that gets clicked would
+  answer later than an inline call. This way speculative traffic cannot
+  crowd out the answers users are actually waiting for
+* each user has a budget of prefetches per chat
+* a user's outstanding prefetches are cancelled as soon as they ask
+  something else
+
+A prefetch must not change session state: a question the user never clicks
+would otherwise become a turn in their conversation, and the next follow-up
+would be answered with it as context. Prefetches are asked without a session,
+and when one is used the app sends the turn to the user's session in the
+background (``vertexchat.cache.TurnRecorder``), as it does for cache hits.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Answer up to ``top_k`` related questions per reply ahead of the click.
+
+    ``fetch(question)`` returns the response for a question. It must not use
+    the user's session: prefetched answers are standalone, which is also what
+    lets them go through the shared answer cache.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Any]],
+        top_k: int = 3,
+        concurrency: int = 16,
+        budget: int = 20,
+    ):
+        self.fetch = fetch
+        self.top_k = top_k
+        self.concurrency = concurrency
+        self.budget = budget
+        self._in_flight = 0
+        self._pending: Dict[Hashable, Dict[str, asyncio.Task]] = {}
+        self._spent: Dict[Hashable, int] = {}
+        self.issued = 0
+        self.hits = 0
+        self.cancelled = 0
+        self.over_budget = 0
+        self.shed = 0
+
+    @classmethod
+    def from_env(cls, fetch: Callable[[str], Awaitable[Any]]) -> Optional["Prefetcher"]:
+        """Build from ``PREFETCH_*`` settings, or ``None`` when ``PREFETCH_ENABLED=false``."""
+        if os.environ.get("PREFETCH_ENABLED", "true").lower() == "false":
+            return None
+        return cls(
+            fetch,
+            top_k=int(os.environ.get("PREFETCH_TOP_K", "3")),
+            concurrency=int(os.environ.get("PREFETCH_CONCURRENCY", "16")),
+            budget=int(os.environ.get("PREFETCH_BUDGET", "20")),
+        )
+
+    def schedule(self, user_key: Hashable, questions: Iterable[str]) -> int:
+        """Replace ``user_key``'s prefetches with the top related ``questions``.
+
+        Returns how many prefetches were started.
+        """
+        self.cancel(user_key)
+        pending = self._pending.setdefault(user_key, {})
+        started = 0
+        for question in list(questions)[: self.top_k]:
+            if question in pending:
+                continue
+            if self._spent.get(user_key, 0) >= self.budget:
+                self.over_budget += 1
+                break
+            if self._in_flight >= self.concurrency:
+                self.shed += 1
+                break
+            self._in_flight += 1
+            self._spent[user_key] = self._spent.get(user_key, 0) + 1
+            task = asyncio.get_running_loop().create_task(self.fetch(question))
+            # A done callback also runs for tasks cancelled before they ever started
+            task.add_done_callback(self._done)
+            pending[question] = task
+            started += 1
+        self.issued += started
+        return started
+
+    async def take(self, user_key: Hashable, question: str) -> Optional[Any]:
+        """Return the prefetched response for ``question``, or ``None`` if there is none.
+
+        Waits if the prefetch is still in flight. All of the user's other
+        prefetches are cancelled, since they asked something else.
+        """
+        task = self._pending.get(user_key, {}).pop(question, None)
+        self.cancel(user_key)
+        if task is None:
+            return None
+        try:
+            response = await task
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None
+            raise
+        except Exception:
+            logger.warning("prefetch for %r failed; answering inline", question, exc_info=True)
+            return None
+        self.hits += 1
+        return response
+
+    def _done(self, task: asyncio.Task) -> None:
+        self._in_flight -= 1
+        # Retrieve the exception so failed speculative calls are not logged as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    def cancel(self, user_key: Hashable) -> None:
+        """Cancel ``user_key``'s outstanding prefetches."""
+        for task in self._pending.pop(user_key, {}).values():
+            if not task.done():
+                task.cancel()
+                self.cancelled += 1
+
+    def forget(self, user_key: Hashable) -> None:
+        """Cancel and drop all state for a finished chat."""
+        self.cancel(user_key)
+        self._spent.pop(user_key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "issued": self.issued,
+            "hits": self.hits,
+            "cancelled": self.cancelled,
+            "over_budget": self.over_budget,
+            "shed": self.shed,
+            "hit_rate": self.hits / self.issued if self.issued else 0.0,
+        }
+
@@ -0,0 +1,375 @@
+"""CPU-bound attachment preprocessing, run in worker processes.
+
+Functions here are called through ``vertexchat.attachments`` on a process
+pool, so they take and return only picklable values. Files are read from
+disk inside the worker; their bytes never cross the process boundary.
+
+``preprocess_file`` also shrinks uploads before they are sent inline, under
+``ReduceOptions``:
+
+* photos are downscaled to ``image_max_side`` (Gemini gains nothing beyond
+  3072 px) and recompressed as JPEG, or as PNG when they have transparency
+* PDFs lose blank pages and pages past ``pdf_max_pages``
+* scanned PDFs, without a text layer, are rasterized to ``pdf_raster_dpi``
+  JPEG pages when that is smaller. This needs the optional ``pypdfium2``.
+
+Nothing below ``min_bytes`` is touched, and a result that is not smaller
+than the original is discarded. Reduced files are written to ``work_dir``,
+named by the input's content hash and the options, so identical uploads are
+only reduced once; files there older than ``WORK_FILE_MAX_AGE`` are removed.
+"""
+import hashlib
+import io
+import json
+import mimetypes
+import mmap
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+WORK_FILE_MAX_AGE = 24 * 3600
+
+# MIME types Gemini accepts as inline parts
+SUPPORTED_MIME_TYPES = frozenset({
+    "application/pdf",
+    "image/png",
+    "image/jpeg",
+    "image/webp",
+    "image/heic",
+    "image/heif",
+    "text/plain",
+    "text/csv",
+    "text/html",
+    "text/markdown",
+})
+
+_MAGIC = (
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"PK\x03\x04", "application/zip"),
+)
+
+
+class AttachmentError(Exception):
+    """A file that cannot be sent to the model, with a reason fit to show the user."""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(name, reason)
+        self.name = name
+        self.reason = reason
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.reason}"
+
+
+@dataclass
+class FileInfo:
+    """What preprocessing learned about one attachment."""
+
+    name: str
+    path: str
+    mime_type: str
+    size: int
+    pages: Optional[int] = None
+    has_text_layer: Optional[bool] = None
+    text: Optional[str] = None
+    seconds: float = 0.0
+    # (path, mime type) of the reduced file(s) to send instead; empty means send the original
+    outputs: List[Tuple[str, str]] = field(default_factory=list)
+    bytes_out: Optional[int] = None
+    # Pages of the PDF sent, when reduction dropped some
+    pages_out: Optional[int] = None
+    reduction: str = ""
+
+
+@dataclass(frozen=True)
+class ReduceOptions:
+    """How far ``preprocess_file`` may shrink an attachment."""
+
+    min_bytes: int = 256 << 10
+    image_max_side: int = 1536
+    image_quality: int = 85
+    pdf_max_pages: int = 0
+    pdf_raster: str = "auto"
+    pdf_raster_dpi: int = 100
+    work_dir: str = os.path.join(tempfile.gettempdir(), "vertexchat-attachments")
+
+    @classmethod
+    def from_env(cls) -> Optional["ReduceOptions"]:
+        """``ATTACHMENT_REDUCE*`` / ``ATTACHMENT_IMAGE_*`` / ``ATTACHMENT_PDF_*``; ``None`` when ``ATTACHMENT_REDUCE=false``."""
+        if os.environ.get("ATTACHMENT_REDUCE", "true").lower() == "false":
+            return None
+        defaults = cls()
+        return cls(
+            min_bytes=int(os.environ.get("ATTACHMENT_REDUCE_MIN_BYTES", defaults.min_bytes)),
+            image_max_side=int(os.environ.get("ATTACHMENT_IMAGE_MAX_SIDE", defaults.image_max_side)),
+            image_quality=int(os.environ.get("ATTACHMENT_IMAGE_QUALITY", defaults.image_quality)),
+            pdf_max_pages=int(os.environ.get("ATTACHMENT_PDF_MAX_PAGES", defaults.pdf_max_pages)),
+            pdf_raster=os.environ.get("ATTACHMENT_PDF_RASTER", defaults.pdf_raster).lower(),
+            pdf_raster_dpi=int(os.environ.get("ATTACHMENT_PDF_RASTER_DPI", defaults.pdf_raster_dpi)),
+            work_dir=os.environ.get("ATTACHMENT_WORK_DIR", defaults.work_dir),
+        )
+
+
+def content_hash(path) -> str:
+    """SHA-256 of the file at ``path`` without reading it into memory."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        digest = hashlib.sha256()
+        if size == 0:
+            return digest.hexdigest()
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+        except (OSError, ValueError):
+            # Not mappable (e.g. a pipe or some network filesystems): hash in chunks
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+def sniff_mime(head: bytes, declared: Optional[str] = None, name: str = "") -> str:
+    """MIME type from the file's leading bytes, then the declared type, then the file name."""
+    for magic, mime_type in _MAGIC:
+        if head.startswith(magic):
+            # .docx, .xlsx and friends are zip files; their declared type says more
+            return declared if mime_type == "application/zip" and declared else mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"):
+        return "image/heic"
+    if declared and declared != "application/octet-stream":
+        return declared
+    guessed = mimetypes.guess_type(name)[0]
+    if guessed:
+        return guessed
+    try:
+        head.decode("utf-8")
+        return "text/plain"
+    except UnicodeDecodeError:
+        return "application/octet-stream"
+
+
+def inspect_file(path: str, declared_mime: Optional[str] = None, name: str = "", extract_text: bool = False) -> FileInfo:
+    """Sniff the type of the file at ``path`` and read its structure.
+
+    PDFs are opened to count pages and check for a text layer. With
+    ``extract_text`` their full text is extracted, and text files are
+    decoded. Raises ``AttachmentError`` for unsupported or unreadable files.
+    """
+    start = time.perf_counter()
+    name = name or path
+    try:
+        with open(path, "rb") as f:
+            head = f.read(64)
+            f.seek(0, 2)
+            size = f.tell()
+    except OSError as error:
+        raise AttachmentError(name, f"could not be read ({error.strerror})") from None
+    mime_type = sniff_mime(head, declared_mime, name)
+    if mime_type not in SUPPORTED_MIME_TYPES:
+        raise AttachmentError(name, f"unsupported file type {mime_type}")
+    info = FileInfo(name=name, path=path, mime_type=mime_type, size=size)
+    if mime_type == "application/pdf":
+        _inspect_pdf(info, extract_text)
+    elif mime_type.startswith("text/") and extract_text:
+        with open(path, "rb") as f:
+            info.text = f.read().decode("utf-8", errors="replace")
+    info.seconds = time.perf_counter() - start
+    return info
+
+
+def _inspect_pdf(info: FileInfo, extract_text: bool) -> None:
+    import pypdf
+
+    try:
+        reader = pypdf.PdfReader(info.path)
+        if reader.is_encrypted:
+            raise AttachmentError(info.name, "is a password-protected PDF")
+        info.pages = len(reader.pages)
+        if extract_text:
+            info.text = "\n\n".join(page.extract_text() or "" for page in reader.pages)
+            info.has_text_layer = bool(info.text.strip())
+        else:
+            info.has_text_layer = bool(info.pages and (reader.pages[0].extract_text() or "").strip())
+    except AttachmentError:
+        raise
+    except Exception as error:
+        # pypdf raises a variety of errors (PdfReadError, ValueError, KeyError...) on damaged files
+        raise AttachmentError(info.name, f"is not a readable PDF ({type(error).__name__}: {error})") from None
+
+
+def preprocess_file(
+    path: str,
+    declared_mime: Optional[str] = None,
+    name: str = "",
+    extract_text: bool = False,
+    options: Optional[ReduceOptions] = None,
+) -> FileInfo:
+    """``inspect_file``, then shrink the file under ``options`` unless it is sent as text."""
+    start = time.perf_counter()
+    info = inspect_file(path, declared_mime, name, extract_text)
+    sent_as_text = info.text is not None and (info.has_text_layer or info.mime_type.startswith("text/"))
+    reducible = info.mime_type in ("image/png", "image/jpeg", "image/webp", "application/pdf")
+    if options is not None and reducible and not sent_as_text and info.size >= options.min_bytes:
+        base = _output_base(info, options)
+        if not _load_manifest(info, base):
+            try:
+                if info.mime_type == "application/pdf":
+                    _reduce_pdf(info, options, base)
+                else:
+                    _reduce_image(info, options, base)
+            except Exception as error:
+                # Reduction is an optimization; the original file is still good to send
+                info.outputs = []
+                info.reduction = f"kept original ({type(error).__name__}: {error})"
+            else:
+                _write(base + ".json", json.dumps({"outputs": info.outputs, "reduction": info.reduction}).encode())
+    info.bytes_out = sum(os.path.getsize(p) for p, _ in info.outputs) if info.outputs else info.size
+    info.seconds = time.perf_counter() - start
+    return info
+
+
+def _output_base(info: FileInfo, options: ReduceOptions) -> str:
+    if not os.path.isdir(options.work_dir):
+        os.makedirs(options.work_dir, exist_ok=True)
+    else:
+        _prune(options.work_dir)
+    key = hashlib.sha256(f"{content_hash(info.path)}:{options!r}".encode()).hexdigest()[:32]
+    return os.path.join(options.work_dir, key)
+
+
+def _load_manifest(info: FileInfo, base: str) -> bool:
+    """Fill ``info`` from an earlier reduction of the same content, if its files are all still there."""
+    try:
+        with open(base + ".json") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    outputs = [tuple(output) for output in manifest["outputs"]]
+    try:
+        # Touch them so pruning goes by last use
+        for path in [base + ".json"] + [path for path, _ in outputs]:
+            os.utime(path)
+    except OSError:
+        return False
+    info.outputs = outputs
+    info.reduction = manifest["reduction"] + " (reused)"
+    return True
+
+
+_last_prune = 0.0
+
+
+def _prune(work_dir: str) -> None:
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < 3600:
+        return
+    _last_prune = now
+    for entry in os.scandir(work_dir):
+        try:
+            if now - entry.stat().st_mtime > WORK_FILE_MAX_AGE:
+                os.remove(entry.path)
+        except OSError:
+            # Another worker got there first
+            pass
+
+
+def _write(path: str, data: bytes) -> None:
+    tmp = f"{path}.{os.getpid()}.partial"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _reduce_image(info: FileInfo, options: ReduceOptions, base: str) -> None:
+    from PIL import Image, ImageOps
+
+    with Image.open(info.path) as image:
+        original_size = image.size
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((options.image_max_side, options.image_max_side), Image.LANCZOS)
+        transparent = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        out = io.BytesIO()
+        if transparent:
+            image.save(out, format="PNG", optimize=True)
+            mime_type, suffix = "image/png", ".png"
+        else:
+            image.convert("RGB").save(out, format="JPEG", quality=options.image_quality, optimize=True)
+            mime_type, suffix = "image/jpeg", ".jpg"
+    if out.tell() >= info.size:
+        info.reduction = "kept original (recompressed image was not smaller)"
+        return
+    path = base + suffix
+    _write(path, out.getvalue())
+    info.outputs = [(path, mime_type)]
+    info.reduction = f"image {original_size[0]}x{original_size[1]} -> {image.size[0]}x{image.size[1]} {mime_type}"
+
+
+def _is_blank(page) -> bool:
+    # No images and next to no drawing operators; vector-only pages (charts without labels) are kept
+    resources = page.get("/Resources") or {}
+    if "/XObject" in resources:
+        return False
+    contents = page.get_contents()
+    return contents is None or len(contents.get_data().strip()) < 16
+
+
+def _reduce_pdf(info: FileInfo, options: ReduceOptions, base: str) -> None:
+    import pypdf
+
+    reader = pypdf.PdfReader(info.path)
+    total = len(reader.pages)
+    limit = min(total, options.pdf_max_pages) if options.pdf_max_pages else total
+    keep = [index for index in range(limit) if not _is_blank(reader.pages[index])] or [0]
+    candidates = []
+    if len(keep) < total:
+        writer = pypdf.PdfWriter()
+        for index in keep:
+            writer.add_page(reader.pages[index])
+        for page in writer.pages:
+            page.compress_content_streams()
+        out = io.BytesIO()
+        writer.write(out)
+        candidates.append((out.tell(), ".pdf", [out.getvalue()], "application/pdf", f"pdf {total} -> {len(keep)} pages"))
+    if options.pdf_raster == "always" or (options.pdf_raster == "auto" and not info.has_text_layer):
+        images = _rasterize(keep, info, options)
+        if images is not None:
+            candidates.append((sum(map(len, images)), ".jpg", images, "image/jpeg",
+                               f"pdf {total} pages -> {len(images)} JPEG pages at {options.pdf_raster_dpi} dpi"))
+    best = min(candidates, key=lambda candidate: candidate[0], default=None)
+    if best is None or best[0] >= info.size:
+        info.reduction = "kept original (nothing smaller)"
+        return
+    _, suffix, blobs, mime_type, info.reduction = best
+    if mime_type == "application/pdf":
+        info.pages_out = len(keep)
+    info.outputs = []
+    for number, blob in enumerate(blobs):
+        path = f"{base}-{number}{suffix}"
+        _write(path, blob)
+        info.outputs.append((path, mime_type))
+
+
+def _rasterize(indexes: List[int], info: FileInfo, options: ReduceOptions) -> Optional[List[bytes]]:
+    try:
+        import pypdfium2
+    except ImportError:
+        return None
+    document = pypdfium2.PdfDocument(info.path)
+    try:
+        images = []
+        for index in indexes:
+            image = document[index].render(scale=options.pdf_raster_dpi / 72).to_pil()
+            out = io.BytesIO()
+            image.convert("RGB").save(out, format="JPEG", quality=options.image_quality, optimize=True)
+            images.append(out.getvalue())
+        return images
+    finally:
+        document.close()
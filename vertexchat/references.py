@@ -0,0 +1,104 @@
+"""Citation and reference rendering shared by all the apps.
+
+Handles the three response shapes the apps receive:
+
+* ``render_summary`` - a converse/search ``Summary`` whose text carries
+  ``[1]`` / ``[1, 3]`` markers resolved against ``summary_with_metadata.references``
+* ``render_search_results`` - summary text followed by a list of the top
+  search results
+* ``render_answer`` - an Answers API ``Answer`` followed by its cited references
+
+Citation markers are rewritten in one regex pass and reference lists are
+de-duplicated by URL with a set, so cost is linear in the answer length.
+"""
+import re
+from itertools import islice
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+_CITATION = re.compile(r"\[(\d+(?:\s*,\s*\d+)*)\]")
+_GCS = re.compile(r"^gs://")
+
+
+def parse_external_link(url: str = "") -> str:
+    """Turn ``gs://bucket/object`` into a browsable Cloud Storage URL."""
+    return _GCS.sub("https://storage.cloud.google.com/", url, count=1)
+
+
+def link_citations(text: str, urls: Sequence[str]) -> str:
+    """Replace ``[n]`` and ``[n, m]`` markers with markdown links to ``urls[n - 1]``.
+
+    Numbers without a matching URL are left as plain ``[n]``.
+    """
+    if not urls:
+        return text
+
+    def replace(match: "re.Match") -> str:
+        links = []
+        for number in match.group(1).split(","):
+            n = int(number)
+            if 1 <= n <= len(urls) and urls[n - 1]:
+                links.append(f"[{n}]({urls[n - 1]})")
+            else:
+                links.append(f"[{n}]")
+        return ", ".join(links)
+
+    return _CITATION.sub(replace, text)
+
+
+def references_block(references: Iterable[Tuple[str, str]], numbered: bool = False) -> str:
+    """Format ``(title, url)`` pairs as a markdown reference list, skipping repeated URLs.
+
+    ``numbered`` labels each entry with its position in ``references``, not in
+    the list, so the numbers still match ``[n]`` citations after skipped entries.
+    """
+    seen = set()
+    lines: List[str] = []
+    for position, (title, url) in enumerate(references, 1):
+        if not url or url in seen:
+            continue
+        seen.add(url)
+        label = f"[{position}] {title}" if numbered else title
+        lines.append(f"\n [{label}]({url})")
+    if not lines:
+        return ""
+    return "\n References:" + "".join(lines)
+
+
+def render_summary(summary) -> str:
+    """Summary text with inline citation links from ``summary_with_metadata``."""
+    references = summary.summary_with_metadata.references
+    urls = [parse_external_link(reference.uri) for reference in references]
+    return link_citations(summary.summary_text, urls)
+
+
+def _search_result_link(search_result) -> Tuple[str, Optional[str]]:
+    document = search_result.document
+    data = document.struct_data or document.derived_struct_data
+    url = data.get("url") or data.get("link")
+    return data.get("title", ""), parse_external_link(url) if url else None
+
+
+def render_search_results(text: str, search_results, limit: int = 5) -> str:
+    """``text`` followed by a numbered list of the top ``limit`` search results."""
+    # Slicing a proto-plus repeated field yields raw protobuf messages; islice keeps the wrappers
+    return text + references_block((_search_result_link(result) for result in islice(search_results, limit)), numbered=True)
+
+
+def answer_references(answer) -> str:
+    """Reference list for the sources cited in an Answers API ``Answer``."""
+    references = answer.references
+
+    def cited():
+        for citation in answer.citations:
+            for source in citation.sources[:1]:
+                index = int(source.reference_id)
+                if 0 <= index < len(references):
+                    metadata = references[index].chunk_info.document_metadata
+                    yield metadata.title, parse_external_link(metadata.uri)
+
+    return references_block(cited())
+
+
+def render_answer(answer) -> str:
+    """Answer text followed by its cited references."""
+    return answer.answer_text + answer_references(answer)
@@ -0,0 +1,66 @@
+"""Shared keep-alive HTTP client for Discovery Engine REST endpoints.
+
+A bare ``requests.post`` opens a new TCP+TLS connection per call. All REST
+traffic goes through one pooled ``httpx.AsyncClient`` per event loop instead,
+authenticated from a shared ``TokenCache``.
+"""
+import asyncio
+import os
+import weakref
+from typing import Optional
+
+import httpx
+
+from vertexchat import fakes
+from vertexchat.auth import TokenCache
+from vertexchat.limiter import limited
+
+DISCOVERY_ENGINE_REST = "https://discoveryengine.googleapis.com/v1beta"
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def http_client(verify=True) -> httpx.AsyncClient:
+    """Return the pooled client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.environ.get("VERTEXCHAT_HTTP_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.environ.get("VERTEXCHAT_HTTP_KEEPALIVE", "20")),
+                keepalive_expiry=60,
+            ),
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            verify=verify,
+            transport=fakes.http_transport() if fakes.enabled() else None,
+        )
+        _clients[loop] = client
+    return client
+
+
+async def aclose_client() -> None:
+    """Close the running loop's pooled client, e.g. before ``asyncio.run`` closes the loop."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def create_session(
+    token_cache: TokenCache,
+    project_id: str,
+    data_store_id: str,
+    user_pseudo_id: str = "",
+    base_url: str = DISCOVERY_ENGINE_REST,
+    client: Optional[httpx.AsyncClient] = None,
+) -> str:
+    """Create an Answers API session and return its resource name."""
+    url = f"{base_url}/projects/{project_id}/locations/global/collections/default_collection/dataStores/{data_store_id}/sessions"
+    headers = {
+        "Authorization": f"Bearer {await token_cache.atoken()}",
+        "Content-Type": "application/json",
+    }
+    async with limited("discoveryengine"):
+        response = await (client or http_client()).post(url, headers=headers, json={"userPseudoId": user_pseudo_id})
+        response.raise_for_status()
+    return response.json()["name"]
@@ -0,0 +1,320 @@
+"""Latency-aware routing and hedged requests across Discovery Engine endpoints.
+
+The apps built one ``ConversationalSearch`` for a single endpoint at import
+time, so a slow tail on that endpoint reached every user. ``RoutedSearch``
+has the same async methods but holds a ``ConversationalSearch`` per
+configured endpoint:
+
+* each endpoint keeps a rolling window of call latencies, and calls go to the
+  healthy endpoint with the lowest median. A small share of calls
+  (``explore``) goes to another endpoint so recovered ones are noticed.
+* ``eject_after`` consecutive retryable failures take an endpoint out of
+  rotation for ``eject_seconds``. A repeatable call that fails with a
+  retryable error is retried once on the next best endpoint.
+* with ``hedge`` on, a call that is still running after the endpoint's
+  ``hedge_percentile`` latency is also sent to the runner-up endpoint. The
+  first success wins and the other call is cancelled. Hedges are capped at
+  ``hedge_budget`` of all calls, so a slow endpoint cannot double the load.
+
+Only repeatable calls are hedged: ``answer_query`` without a session, as
+used by the prefetcher and the offline evals. Those and
+``create_conversation`` (a spare empty conversation is harmless) and
+``update_conversation`` (it sets the messages to the same turn) fail over
+on any retryable error. A session ``answer_query`` or a
+``converse_conversation`` that timed out or failed with a 5xx may already
+have recorded its turn, and repeating it would record the turn twice. So
+those calls are never hedged, and they fail over only on a quota rejection
+(429), which means the request was never run. Streaming answers are routed
+but neither hedged nor failed over. Their time to open the stream is kept in
+a window of its own, apart from the unary latencies that rank endpoints.
+Every endpoint must serve the data store's location, e.g.
+``discoveryengine.googleapis.com`` and a second global endpoint, or
+``us-discoveryengine.googleapis.com`` for a ``us`` data store.
+
+Environment: ``DISCOVERYENGINE_ENDPOINTS`` (comma-separated; with fewer than
+two, ``search_client_from_env`` returns a plain ``ConversationalSearch``),
+``ROUTER_HEDGE`` (default ``false``), ``ROUTER_HEDGE_PERCENTILE`` (95),
+``ROUTER_HEDGE_BUDGET`` (0.1), ``ROUTER_EXPLORE`` (0.05).
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from google.api_core import exceptions as core_exceptions
+
+from vertexchat.aio import RETRYABLE_ERRORS, ConversationalSearch, client_options_for, conversation_turn
+from vertexchat.limiter import backend_limiter, limited
+
+logger = logging.getLogger(__name__)
+
+HEDGEABLE_METHODS = frozenset({"answer_query"})
+# Repeating these creates nothing but a spare resource, or writes the same messages again
+IDEMPOTENT_METHODS = frozenset({"create_conversation", "update_conversation"})
+# Quota rejections: the backend refused the request before running it
+NOT_RUN_ERRORS = (core_exceptions.TooManyRequests, core_exceptions.ResourceExhausted)
+
+
+class EndpointStats:
+    """Rolling latency and health of one endpoint."""
+
+    __slots__ = ("endpoint", "latencies", "stream_opens", "min_samples", "failures", "ejected_until", "calls", "errors", "hedges_won")
+
+    def __init__(self, endpoint: str, window: int = 200, min_samples: int = 20):
+        self.endpoint = endpoint
+        self.latencies: deque = deque(maxlen=window)
+        # Time to open a streaming answer; not comparable with a whole unary call
+        self.stream_opens: deque = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.hedges_won = 0
+
+    def percentile(self, q: float, samples: Optional[deque] = None) -> Optional[float]:
+        """The ``q``-th percentile of recent latencies, or ``None`` until there are ``min_samples``."""
+        samples = self.latencies if samples is None else samples
+        if len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def record(self, seconds: float) -> None:
+        self.latencies.append(seconds)
+        self.failures = 0
+
+    def record_stream_open(self, seconds: float) -> None:
+        self.stream_opens.append(seconds)
+        self.failures = 0
+
+    def record_failure(self, now: float, eject_after: int, eject_seconds: float) -> None:
+        self.errors += 1
+        self.failures += 1
+        if self.failures >= eject_after:
+            self.ejected_until = now + eject_seconds
+            self.failures = 0
+            logger.warning("endpoint %s ejected for %.0fs after %d failures", self.endpoint, eject_seconds, eject_after)
+
+
+class RoutedSearch:
+    """``ConversationalSearch`` over several endpoints, routed by observed latency."""
+
+    def __init__(
+        self,
+        discoveryengine,
+        endpoints: List[str],
+        hedge: bool = False,
+        hedge_percentile: float = 95,
+        hedge_budget: float = 0.1,
+        min_hedge_delay: float = 0.05,
+        explore: float = 0.05,
+        window: int = 200,
+        min_samples: int = 20,
+        eject_after: int = 5,
+        eject_seconds: float = 30.0,
+    ):
+        if not endpoints:
+            raise ValueError("RoutedSearch needs at least one endpoint")
+        self.discoveryengine = discoveryengine
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.min_hedge_delay = min_hedge_delay
+        self.explore = explore
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.clients: Dict[str, ConversationalSearch] = {
+            endpoint: ConversationalSearch(discoveryengine, client_options=client_options_for("global", api_endpoint=endpoint))
+            for endpoint in endpoints
+        }
+        self.stats: Dict[str, EndpointStats] = {endpoint: EndpointStats(endpoint, window, min_samples) for endpoint in endpoints}
+        self.calls = 0
+        self.hedges = 0
+        self.failovers = 0
+        self._rng = random.Random()
+
+    @classmethod
+    def from_env(cls, discoveryengine, endpoints: List[str]) -> "RoutedSearch":
+        return cls(
+            discoveryengine,
+            endpoints,
+            hedge=os.environ.get("ROUTER_HEDGE", "false").lower() == "true",
+            hedge_percentile=float(os.environ.get("ROUTER_HEDGE_PERCENTILE", "95")),
+            hedge_budget=float(os.environ.get("ROUTER_HEDGE_BUDGET", "0.1")),
+            explore=float(os.environ.get("ROUTER_EXPLORE", "0.05")),
+        )
+
+    def ranked(self) -> List[EndpointStats]:
+        """Endpoints best first: healthy before ejected, unmeasured first (to measure them), then by median latency."""
+        now = time.monotonic()
+
+        def key(stats: EndpointStats):
+            median = stats.percentile(50)
+            if not stats.healthy(now):
+                return (True, stats.ejected_until, False, 0.0)
+            return (False, 0.0, median is not None, median or 0.0)
+
+        ranked = sorted(self.stats.values(), key=key)
+        if len(ranked) > 1 and ranked[1].healthy(now) and self._rng.random() < self.explore:
+            ranked[0], ranked[1] = ranked[1], ranked[0]
+        return ranked
+
+    def _hedge_delay(self, stats: EndpointStats) -> Optional[float]:
+        if not self.hedge or self.hedges >= self.hedge_budget * self.calls:
+            return None
+        delay = stats.percentile(self.hedge_percentile)
+        return None if delay is None else max(self.min_hedge_delay, delay)
+
+    async def _timed(self, stats: EndpointStats, method: str, *args, **kwargs) -> Any:
+        start = time.monotonic()
+        stats.calls += 1
+        try:
+            result = await self.clients[stats.endpoint].invoke(method, *args, **kwargs)
+        except asyncio.CancelledError:
+            # The losing side of a hedge took at least this long; keep it so a slow endpoint does not look fast
+            stats.latencies.append(time.monotonic() - start)
+            raise
+        except RETRYABLE_ERRORS:
+            stats.record_failure(time.monotonic(), self.eject_after, self.eject_seconds)
+            raise
+        stats.record(time.monotonic() - start)
+        return result
+
+    async def _hedged(self, primary: EndpointStats, secondary: EndpointStats, delay: float, method: str, *args, **kwargs) -> Any:
+        first = asyncio.ensure_future(self._timed(primary, method, *args, **kwargs))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                try:
+                    return first.result()
+                except RETRYABLE_ERRORS as error:
+                    return await self._failover(primary, secondary, error, method, *args, **kwargs)
+            self.hedges += 1
+            tasks.add(asyncio.ensure_future(self._timed(secondary, method, *args, **kwargs)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            secondary.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _hedgeable(self, method: str, kwargs) -> bool:
+        request = kwargs.get("request")
+        return method in HEDGEABLE_METHODS and request is not None and not getattr(request, "session", "")
+
+    def _can_fail_over(self, method: str, kwargs, error: BaseException) -> bool:
+        """Whether repeating the call elsewhere cannot record a session or conversation turn twice."""
+        return method in IDEMPOTENT_METHODS or self._hedgeable(method, kwargs) or isinstance(error, NOT_RUN_ERRORS)
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """Invoke ``method`` on the best endpoint, hedging or failing over as configured."""
+        # One limiter slot for the logical call, taken before any endpoint is timed:
+        # queue wait is not endpoint latency, and a hedge or failover needs no second slot
+        async with limited("discoveryengine"):
+            return await self._route(method, *args, **kwargs)
+
+    async def _route(self, method: str, *args, **kwargs) -> Any:
+        self.calls += 1
+        ranked = self.ranked()
+        primary = ranked[0]
+        secondary = ranked[1] if len(ranked) > 1 and ranked[1].healthy(time.monotonic()) else None
+        delay = self._hedge_delay(primary) if secondary is not None and self._hedgeable(method, kwargs) else None
+        if delay is not None:
+            return await self._hedged(primary, secondary, delay, method, *args, **kwargs)
+        try:
+            return await self._timed(primary, method, *args, **kwargs)
+        except RETRYABLE_ERRORS as error:
+            if secondary is None or not self._can_fail_over(method, kwargs, error):
+                raise
+            return await self._failover(primary, secondary, error, method, *args, **kwargs)
+
+    async def _failover(self, primary: EndpointStats, secondary: EndpointStats, error, method: str, *args, **kwargs) -> Any:
+        self.failovers += 1
+        logger.info("%s on %s failed (%r); retrying on %s", method, primary.endpoint, error, secondary.endpoint)
+        return await self._timed(secondary, method, *args, **kwargs)
+
+    def data_store_path(self, project_id: str, location: str, data_store_id: str) -> str:
+        return next(iter(self.clients.values())).data_store_path(project_id, location, data_store_id)
+
+    def serving_config_path(self, project_id: str, location: str, data_store_id: str, serving_config: str) -> str:
+        return next(iter(self.clients.values())).serving_config_path(project_id, location, data_store_id, serving_config)
+
+    async def create_conversation(self, project_id: str, location: str, data_store_id: str):
+        return await self.call(
+            "create_conversation",
+            parent=self.data_store_path(project_id, location, data_store_id),
+            conversation=self.discoveryengine.Conversation(),
+        )
+
+    async def converse_conversation(self, request):
+        return await self.call("converse_conversation", request=request)
+
+    async def record_turn(self, conversation: str, query: str, reply):
+        return await self.call("update_conversation", **conversation_turn(self.discoveryengine, conversation, query, reply))
+
+    async def answer_query(self, request):
+        return await self.call("answer_query", request=request)
+
+    async def stream_answer_query(self, request):
+        """Routed but never hedged or failed over; the time until the stream opens is kept apart."""
+        limiter = backend_limiter("discoveryengine")
+        if limiter is None:
+            return await self._open_stream(request)
+        return await limiter.stream(lambda: self._open_stream(request))
+
+    async def _open_stream(self, request):
+        self.calls += 1
+        stats = self.ranked()[0]
+        start = time.monotonic()
+        stats.calls += 1
+        try:
+            responses = await self.clients[stats.endpoint].open_stream(request)
+        except RETRYABLE_ERRORS:
+            stats.record_failure(time.monotonic(), self.eject_after, self.eject_seconds)
+            raise
+        stats.record_stream_open(time.monotonic() - start)
+        return responses
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "endpoints": {
+                endpoint: {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "healthy": stats.healthy(now),
+                    "p50_s": stats.percentile(50),
+                    "p95_s": stats.percentile(95),
+                    "stream_open_p50_s": stats.percentile(50, stats.stream_opens),
+                    "hedges_won": stats.hedges_won,
+                }
+                for endpoint, stats in self.stats.items()
+            },
+        }
+
+
+def search_client_from_env(discoveryengine, location: str, api_endpoint: Optional[str] = None):
+    """A ``RoutedSearch`` over ``DISCOVERYENGINE_ENDPOINTS``, or the single-endpoint ``ConversationalSearch`` as before."""
+    endpoints = [endpoint.strip() for endpoint in os.environ.get("DISCOVERYENGINE_ENDPOINTS", "").split(",") if endpoint.strip()]
+    if len(endpoints) < 2:
+        endpoint = endpoints[0] if endpoints else api_endpoint
+        return ConversationalSearch(discoveryengine, client_options=client_options_for(location, api_endpoint=endpoint))
+    return RoutedSearch.from_env(discoveryengine, endpoints)
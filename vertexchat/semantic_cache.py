@@ -0,0 +1,170 @@
+"""Near-duplicate query lookup for the answer cache.
+
+Exact keys miss paraphrases such as "how about dry cleaner" and "what about
+dry cleaners?". ``SemanticIndex`` embeds queries offline with a signed hashing
+vectorizer (word stems, word bigrams and character trigrams) and finds
+neighbours through random-hyperplane LSH tables, re-ranking the candidates by
+exact cosine similarity. No model download or network call is involved.
+
+Set the threshold conservatively: queries that differ in one important word
+("renew" vs "cancel" my permit) still share most of their features.
+
+Entries expire like the exact tiers: ``SemanticCache`` takes the answer
+cache's TTL and ignores neighbours stored longer ago than that.
+"""
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vertexchat.cache import normalize_query
+
+_TOKEN = re.compile(r"\w+")
+
+# Question scaffolding carries little meaning; these words get ``stopword_weight``
+STOPWORDS = frozenset(
+    "a about an and are as at be can could do does for from hello hi how i if in is it me my of on or please should "
+    "the there to what when where which who why will with would you your".split()
+)
+
+
+class HashingEmbedder:
+    """Map text to an L2-normalised ``dim``-sized vector with the hashing trick."""
+
+    def __init__(self, dim: int = 512, char_weight: float = 0.5, stopword_weight: float = 0.1):
+        self.dim = dim
+        self.char_weight = char_weight
+        self.stopword_weight = stopword_weight
+
+    @staticmethod
+    def _stem(word: str) -> str:
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            return word[:-1]
+        return word
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        words = [self._stem(w) for w in _TOKEN.findall(normalize_query(text))]
+        weights = [self.stopword_weight if w in STOPWORDS else 1.0 for w in words]
+        features = [("w:" + w, weight) for w, weight in zip(words, weights)]
+        features += [("b:" + a + " " + b, min(wa, wb)) for a, b, wa, wb in zip(words, words[1:], weights, weights[1:])]
+        for w, weight in zip(words, weights):
+            padded = f"#{w}#"
+            features += [("c:" + padded[i:i + 3], self.char_weight * weight) for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            # Low bits pick the slot, the top bit the sign, so collisions cancel out on average
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticIndex:
+    """Bounded in-process ANN index from query vectors to cached values.
+
+    The vector matrix grows by doubling up to ``maxsize`` rows; after that the
+    oldest entry is evicted for each new one. A query that is already indexed,
+    up to ``normalize_query``, has its value and insert time replaced instead
+    of taking a second row.
+    """
+
+    def __init__(self, embedder: HashingEmbedder, maxsize: int = 5000, tables: int = 16, bits: int = 8, seed: int = 0):
+        self.embedder = embedder
+        self.maxsize = maxsize
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((tables, bits, embedder.dim)).astype(np.float32)
+        self._powers = 1 << np.arange(bits)
+        self._buckets: List[Dict[int, set]] = [{} for _ in range(tables)]
+        self._vectors = np.zeros((min(256, maxsize), embedder.dim), dtype=np.float32)
+        # slot -> (value, bucket ids, insert time, normalized query), oldest first
+        self._entries: "OrderedDict[int, Tuple[Any, np.ndarray, float, str]]" = OrderedDict()
+        self._slots: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _bucket_ids(self, vector: np.ndarray) -> np.ndarray:
+        # (tables, bits) sign pattern -> one integer bucket id per table
+        return ((self._planes @ vector) > 0) @ self._powers
+
+    def _allocate(self) -> int:
+        slot = len(self._entries)
+        if slot < self.maxsize:
+            if slot == len(self._vectors):
+                grown = np.zeros((min(self.maxsize, 2 * slot), self.embedder.dim), dtype=np.float32)
+                grown[:slot] = self._vectors
+                self._vectors = grown
+            return slot
+        slot, (_, old_buckets, _, old_query) = self._entries.popitem(last=False)
+        del self._slots[old_query]
+        for table, bucket in zip(self._buckets, old_buckets):
+            table[int(bucket)].discard(slot)
+        return slot
+
+    def add(self, query: str, value: Any) -> None:
+        normalized = normalize_query(query)
+        slot = self._slots.get(normalized)
+        if slot is not None:
+            # Same vector and buckets; only the value and its age change
+            buckets = self._entries.pop(slot)[1]
+            self._entries[slot] = (value, buckets, time.monotonic(), normalized)
+            return
+        slot = self._allocate()
+        vector = self.embedder.embed(query)
+        buckets = self._bucket_ids(vector)
+        self._vectors[slot] = vector
+        for table, bucket in zip(self._buckets, buckets):
+            table.setdefault(int(bucket), set()).add(slot)
+        self._entries[slot] = (value, buckets, time.monotonic(), normalized)
+        self._slots[normalized] = slot
+
+    def search(self, query: str, max_age: Optional[float] = None) -> Optional[Tuple[Any, float]]:
+        """Return ``(value, cosine similarity)`` of the nearest cached query, if any.
+
+        With ``max_age``, entries stored more than ``max_age`` seconds ago are skipped.
+        """
+        vector = self.embedder.embed(query)
+        candidates = set()
+        for table, bucket in zip(self._buckets, self._bucket_ids(vector)):
+            candidates |= table.get(int(bucket), set())
+        if max_age is not None:
+            oldest = time.monotonic() - max_age
+            candidates = {slot for slot in candidates if self._entries[slot][2] >= oldest}
+        if not candidates:
+            return None
+        slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        scores = self._vectors[slots] @ vector
+        best = int(np.argmax(scores))
+        return self._entries[int(slots[best])][0], float(scores[best])
+
+
+class SemanticCache:
+    """Per-configuration semantic indexes with a similarity ``threshold`` and an optional ``ttl``."""
+
+    def __init__(self, threshold: float = 0.95, maxsize: int = 5000, dim: int = 512, ttl: Optional[float] = None):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.embedder = HashingEmbedder(dim=dim)
+        self._indexes: Dict[str, SemanticIndex] = {}
+
+    def get(self, namespace: str, query: str) -> Optional[Tuple[Any, float]]:
+        index = self._indexes.get(namespace)
+        if index is None:
+            return None
+        match = index.search(query, max_age=self.ttl)
+        if match is None or match[1] < self.threshold:
+            return None
+        return match
+
+    def set(self, namespace: str, query: str, value: Any) -> None:
+        index = self._indexes.get(namespace)
+        if index is None:
+            index = self._indexes[namespace] = SemanticIndex(self.embedder, maxsize=self.maxsize)
+        index.add(query, value)
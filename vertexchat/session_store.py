@@ -0,0 +1,95 @@
+"""Per-user Answers API session store with bounded memory.
+
+Each Chainlit user session maps to its own Answers API session, so concurrent
+users never share conversation context. Records are ``__slots__`` objects that
+keep only the part of the session resource name after a shared prefix, and the
+store evicts sessions idle for longer than ``idle_ttl`` as well as the least
+recently used ones beyond ``max_sessions``.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class SessionRecord:
+    __slots__ = ("session_id", "turns", "last_used")
+
+    def __init__(self, session_id: str, last_used: float):
+        self.session_id = session_id
+        self.turns = 0
+        self.last_used = last_used
+
+
+class SessionStore:
+    """LRU/idle-evicting map from Chainlit session id to Answers API session."""
+
+    def __init__(self, max_sessions: int = 50000, idle_ttl: float = 3600, session_prefix: str = ""):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.session_prefix = session_prefix
+        self._records: "OrderedDict[str, SessionRecord]" = OrderedDict()
+        self.evicted = 0
+
+    @classmethod
+    def from_env(cls, session_prefix: str = "") -> "SessionStore":
+        return cls(
+            max_sessions=int(os.environ.get("SESSION_STORE_MAX", "50000")),
+            idle_ttl=float(os.environ.get("SESSION_STORE_IDLE_TTL", "3600")),
+            session_prefix=session_prefix,
+        )
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def session_name(self, record: SessionRecord) -> str:
+        """Full session resource name for ``record``."""
+        if record.session_id.startswith("projects/"):
+            return record.session_id
+        return self.session_prefix + record.session_id
+
+    def get(self, user_key: str) -> Optional[SessionRecord]:
+        record = self._records.get(user_key)
+        if record is None:
+            return None
+        now = time.monotonic()
+        if now - record.last_used > self.idle_ttl:
+            del self._records[user_key]
+            self.evicted += 1
+            return None
+        record.last_used = now
+        self._records.move_to_end(user_key)
+        return record
+
+    def put(self, user_key: str, session_name: str) -> SessionRecord:
+        now = time.monotonic()
+        self.evict_idle(now)
+        if self.session_prefix and session_name.startswith(self.session_prefix):
+            session_id = session_name[len(self.session_prefix):]
+        else:
+            # A name under a different parent is kept whole
+            session_id = session_name
+        record = SessionRecord(session_id, now)
+        self._records[user_key] = record
+        self._records.move_to_end(user_key)
+        while len(self._records) > self.max_sessions:
+            self._records.popitem(last=False)
+            self.evicted += 1
+        return record
+
+    def pop(self, user_key: str) -> Optional[SessionRecord]:
+        return self._records.pop(user_key, None)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop sessions idle for longer than ``idle_ttl``; returns how many were removed."""
+        now = time.monotonic() if now is None else now
+        removed = 0
+        # Records are in least-recently-used order, so stop at the first live one
+        while self._records:
+            user_key, record = next(iter(self._records.items()))
+            if now - record.last_used <= self.idle_ttl:
+                break
+            del self._records[user_key]
+            removed += 1
+        self.evicted += removed
+        return removed
@@ -0,0 +1,309 @@
+"""Sampled, size-capped tracing for the chat handlers.
+
+``traceable`` is a drop-in for ``langsmith.run_helpers.traceable``. The
+langsmith decorator traces every call and serializes whole arguments
+(``cl.Message`` objects, proto responses). This one decides once per
+top-level call whether to record the trace (head-based sampling), and nested
+traced calls follow that decision. Unsampled calls run the function directly.
+Recorded inputs and outputs are cut down to a fixed size before anything is
+serialized.
+
+Configured from the environment:
+
+* ``VERTEXCHAT_TRACE_MODE`` - ``off``, ``langsmith`` or ``local``. Defaults to
+  ``langsmith`` when ``LANGCHAIN_API_KEY`` is set, otherwise ``off``.
+* ``VERTEXCHAT_TRACE_SAMPLE_RATE`` - fraction of top-level calls traced. The
+  default, 1.0, traces every call as the langsmith decorator did; set e.g.
+  ``0.1`` to trace one call in ten under heavy traffic.
+* ``VERTEXCHAT_TRACE_MAX_PAYLOAD`` - characters kept per input/output value (default 2048)
+* ``VERTEXCHAT_TRACE_SINK`` - file for ``local`` mode. A ``.sqlite``/``.db``
+  path writes a ``spans`` table, anything else JSON lines (default ``traces.jsonl``).
+
+``local`` mode needs no network, so traces can be collected offline or under
+load tests. Spans are handed to a background writer thread, and the handler
+never waits on disk.
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import reprlib
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar = contextvars.ContextVar("vertexchat_trace_span", default=None)
+# Marks the body of a top-level call that was not sampled, so nested calls skip the coin flip
+_UNSAMPLED = object()
+
+
+def summarize(value: Any, limit: int) -> Any:
+    """A JSON-friendly stand-in for ``value`` that costs O(limit) to build."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return value if len(value) <= limit else f"{value[:limit]}...[{len(value)} chars]"
+    content = getattr(value, "content", None)
+    if isinstance(content, str):
+        # cl.Message and friends: the text is what matters
+        return {"type": type(value).__name__, "content": summarize(content, limit)}
+    pb = getattr(type(value), "pb", None)
+    if callable(pb):
+        # proto-plus: printing a response serializes all of it, so record only its size
+        try:
+            return f"<{type(value).__name__} {pb(value).ByteSize()} bytes>"
+        except TypeError:
+            pass
+    return _repr(limit).repr(value)
+
+
+@functools.lru_cache(maxsize=8)
+def _repr(limit: int) -> reprlib.Repr:
+    r = reprlib.Repr()
+    r.maxstring = r.maxother = limit
+    r.maxlevel = 3
+    return r
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "run_type", "start", "inputs", "run")
+
+    def __init__(self, name: str, run_type: str, inputs: Dict[str, Any], parent: Optional["Span"]):
+        self.span_id = uuid.uuid4().hex
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.run_type = run_type
+        self.start = time.time()
+        self.inputs = inputs
+        self.run = None
+
+
+class LocalSink:
+    """Appends finished spans to a JSON lines or SQLite file from a writer thread."""
+
+    BATCH = 256
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sqlite = path.endswith((".sqlite", ".sqlite3", ".db"))
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="vertexchat-trace-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def start(self, span: Span) -> None:
+        pass
+
+    def end(self, span: Span, outputs: Any, error: Optional[str]) -> None:
+        self._queue.put({
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "name": span.name,
+            "run_type": span.run_type,
+            "start": span.start,
+            "duration_s": time.time() - span.start,
+            "inputs": span.inputs,
+            "outputs": outputs,
+            "error": error,
+        })
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        write = self._sqlite_writer() if self.sqlite else self._jsonl_writer()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                write([record for record in batch if record is not None])
+            except Exception:
+                logger.exception("Failed to write %d spans to %s", len(batch), self.path)
+            if stop:
+                return
+
+    def _jsonl_writer(self) -> Callable:
+        def write(records):
+            with open(self.path, "a") as f:
+                for record in records:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+        return write
+
+    def _sqlite_writer(self) -> Callable:
+        db = sqlite3.connect(self.path)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS spans (trace_id TEXT, span_id TEXT PRIMARY KEY, parent_id TEXT, name TEXT, "
+            "run_type TEXT, start REAL, duration_s REAL, inputs TEXT, outputs TEXT, error TEXT)"
+        )
+
+        def write(records):
+            db.executemany(
+                "INSERT OR REPLACE INTO spans VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (r["trace_id"], r["span_id"], r["parent_id"], r["name"], r["run_type"], r["start"], r["duration_s"],
+                     json.dumps(r["inputs"], default=str), json.dumps(r["outputs"], default=str), r["error"])
+                    for r in records
+                ],
+            )
+            db.commit()
+
+        return write
+
+
+class LangSmithSink:
+    """Posts spans as LangSmith runs; the client batches uploads in its own thread."""
+
+    def __init__(self, project_name: Optional[str] = None):
+        from langsmith.run_trees import RunTree
+
+        self.RunTree = RunTree
+        self.project_name = project_name or os.environ.get("LANGCHAIN_PROJECT")
+
+    def start(self, span: Span) -> None:
+        parent = _current.get()
+        if isinstance(parent, Span) and parent.run is not None:
+            span.run = parent.run.create_child(name=span.name, run_type=span.run_type, inputs=span.inputs)
+        else:
+            span.run = self.RunTree(name=span.name, run_type=span.run_type, inputs=span.inputs, project_name=self.project_name)
+        span.run.post()
+
+    def end(self, span: Span, outputs: Any, error: Optional[str]) -> None:
+        span.run.end(outputs={"output": outputs}, error=error)
+        span.run.patch()
+
+    def close(self) -> None:
+        pass
+
+
+class Tracer:
+    """Sampling policy plus a sink; ``mode="off"`` makes ``trace`` return functions unchanged."""
+
+    def __init__(self, mode: str = "off", sample_rate: float = 1.0, max_payload: int = 2048, sink=None):
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.max_payload = max_payload
+        self.sink = sink
+        self.stats = {"sampled": 0, "skipped": 0}
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        mode = os.environ.get("VERTEXCHAT_TRACE_MODE", "langsmith" if os.environ.get("LANGCHAIN_API_KEY") else "off").lower()
+        sample_rate = float(os.environ.get("VERTEXCHAT_TRACE_SAMPLE_RATE", "1.0"))
+        max_payload = int(os.environ.get("VERTEXCHAT_TRACE_MAX_PAYLOAD", "2048"))
+        sink = None
+        if mode == "local":
+            sink = LocalSink(os.environ.get("VERTEXCHAT_TRACE_SINK", "traces.jsonl"))
+        elif mode == "langsmith":
+            sink = LangSmithSink()
+        elif mode != "off":
+            raise ValueError(f"VERTEXCHAT_TRACE_MODE must be off, langsmith or local, not {mode!r}")
+        return cls(mode, sample_rate, max_payload, sink)
+
+    def _sample(self) -> bool:
+        sampled = random.random() < self.sample_rate
+        self.stats["sampled" if sampled else "skipped"] += 1
+        return sampled
+
+    def _start(self, signature: inspect.Signature, name: str, run_type: str, args, kwargs) -> Optional[Span]:
+        """Open a span for this call, or return ``None`` if it is not traced."""
+        parent = _current.get()
+        if parent is _UNSAMPLED or (parent is None and not self._sample()):
+            return None
+        try:
+            bound = signature.bind_partial(*args, **kwargs).arguments
+        except TypeError:
+            bound = {"args": args, "kwargs": kwargs}
+        inputs = {key: summarize(value, self.max_payload) for key, value in bound.items()}
+        span = Span(name, run_type, inputs, parent if isinstance(parent, Span) else None)
+        try:
+            self.sink.start(span)
+        except Exception:
+            logger.exception("Could not start trace span %s", name)
+            return None
+        return span
+
+    def _end(self, span: Span, result: Any, error: Optional[BaseException]) -> None:
+        try:
+            self.sink.end(span, summarize(result, self.max_payload), None if error is None else repr(error))
+        except Exception:
+            logger.exception("Could not finish trace span %s", span.name)
+
+    def trace(self, run_type: str = "chain", name: Optional[str] = None) -> Callable:
+        def decorator(func: Callable) -> Callable:
+            if self.mode == "off":
+                return func
+            span_name = name or func.__name__
+            signature = inspect.signature(func)
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    span = self._start(signature, span_name, run_type, args, kwargs)
+                    token = _current.set(span if span is not None else _UNSAMPLED)
+                    error = result = None
+                    try:
+                        result = await func(*args, **kwargs)
+                        return result
+                    except BaseException as e:
+                        error = e
+                        raise
+                    finally:
+                        _current.reset(token)
+                        if span is not None:
+                            self._end(span, result, error)
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                span = self._start(signature, span_name, run_type, args, kwargs)
+                token = _current.set(span if span is not None else _UNSAMPLED)
+                error = result = None
+                try:
+                    result = func(*args, **kwargs)
+                    return result
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    _current.reset(token)
+                    if span is not None:
+                        self._end(span, result, error)
+
+            return wrapper
+
+        return decorator
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer.from_env()
+    return _tracer
+
+
+def traceable(run_type: str = "chain", name: Optional[str] = None) -> Callable:
+    """Trace the decorated function under the process-wide, env-configured tracer."""
+    return get_tracer().trace(run_type=run_type, name=name)